@@ -21,9 +21,39 @@ Suppliers: VITAR, Aries (ROYALBAY), ENERVIT
 import xml.etree.ElementTree as ET
 import os
 import glob
+import gzip
+import argparse
+import hashlib
+import json
+import math
+import pickle
+import sys
+import threading
+from sys import intern
 from collections import defaultdict
-from decimal import Decimal
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import ExitStack, nullcontext
+from operator import attrgetter
+from decimal import Decimal, ROUND_HALF_UP
+from itertools import accumulate
 import csv
+import datetime
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # optional - ColumnStore falls back to pure Python
+    np = None
+
+try:
+    from lxml import etree as lxml_etree
+except ImportError:  # optional - XML is parsed with ElementTree instead
+    lxml_etree = None
+
+try:
+    import brotli
+except ImportError:  # optional - only .gz files are precompressed
+    brotli = None
 
 
 # XML namespaces
@@ -35,13 +65,930 @@ NS = {
     'typ': 'http://www.stormware.cz/schema/version_2/type.xsd',
 }
 
+# Version of the parsed record format. Bump it whenever parsing changes the
+# records it produces, so stale entries in the parse cache are discarded.
+PARSER_VERSION = 5
+
+
+# ============================================================================
+# FIXED-POINT NUMBERS
+# ============================================================================
+#
+# Amounts and quantities are kept as integers scaled by 10**digits, so sums
+# are exact and cheap. They are converted to float only when written out.
+
+MONEY_DIGITS = 2        # document and line totals, in haléře / cents
+UNIT_PRICE_DIGITS = 6   # unit and stock card prices (Pohoda keeps more decimals)
+QUANTITY_DIGITS = 6     # quantities and discount percentages, in millionths (Pohoda exports up to 4+ decimals)
+
+_POW10 = [10 ** n for n in range(10)]
+
+
+def to_fixed(text, digits):
+    """
+    Parse a decimal string into an integer scaled by 10**digits.
+
+    Plain numbers with at most `digits` decimal places take an int() fast
+    path. Anything else goes through Decimal, rounding extra places half
+    away from zero (and raising for malformed input).
+    """
+    dot = text.find('.')
+    try:
+        if dot < 0:
+            return int(text) * _POW10[digits]
+        frac_len = len(text) - dot - 1
+        if frac_len <= digits:
+            return int(text[:dot] + text[dot + 1:]) * _POW10[digits - frac_len]
+    except ValueError:
+        pass
+
+    scaled = (Decimal(text) * _POW10[digits]).to_integral_value(rounding=ROUND_HALF_UP)
+    return int(scaled)
+
+
+def fixed_to_float(value, digits):
+    """Convert a fixed-point integer back to float (correctly rounded)."""
+    return value / _POW10[digits]
+
+
+# ============================================================================
+# RECORD MODEL
+# ============================================================================
+#
+# Parsed documents are compact __slots__ objects rather than dicts. Items do
+# not copy their document's header fields; they keep a reference to the
+# parent order / invoice and expose those fields as read-only properties.
+# Repeated strings (product names, codes, customers...) are interned, so
+# every line of the same product shares one string object.
+
+class Record:
+    """
+    Base class of parsed records.
+
+    Records keep the mapping interface the reports and exporters use
+    (record['field'], record.get(), record.copy()); FIELDS lists the
+    visible fields in export order.
+    """
+
+    __slots__ = ()
+    FIELDS = ()
+
+    def __init__(self, **values):
+        for name, value in values.items():
+            setattr(self, name, value)
+
+    def __getitem__(self, name):
+        try:
+            return getattr(self, name)
+        except AttributeError:
+            raise KeyError(name) from None
+
+    def __setitem__(self, name, value):
+        setattr(self, name, value)
+
+    def __contains__(self, name):
+        return hasattr(self, name)
+
+    def get(self, name, default=None):
+        return getattr(self, name, default)
+
+    def keys(self):
+        return [name for name in self.FIELDS if hasattr(self, name)]
+
+    def copy(self):
+        """Return the record as a plain dict."""
+        return {name: getattr(self, name) for name in self.keys()}
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.copy()!r})"
+
+
+def _parent_properties(cls, parent, names):
+    """Expose the parent document's fields on an item class as properties."""
+    for name in names:
+        setattr(cls, name, property(attrgetter(f'{parent}.{name}')))
+    return cls
+
+
+class Order(Record):
+    FIELDS = (
+        'order_number', 'internal_number', 'date', 'date_from', 'date_to',
+        'company', 'customer_name', 'city', 'street', 'zip', 'customer_country',
+        'ico', 'dic', 'email', 'phone', 'currency', 'centre',
+        'channel', 'salesperson', 'country', 'supplier',
+        'payment_type', 'price_level', 'is_executed', 'is_delivered',
+        'note', 'int_note', 'total_czk', 'total_czk_bez_dph', 'total_eur', 'total_eur_bez_dph',
+        'customer_id',
+    )
+    __slots__ = FIELDS
+
+
+class Invoice(Record):
+    FIELDS = (
+        'invoice_number', 'sym_var', 'order_number', 'date', 'date_tax', 'date_due',
+        'company', 'customer_name', 'city', 'street', 'zip', 'customer_country',
+        'ico', 'dic', 'email', 'phone', 'currency', 'centre',
+        'channel', 'salesperson', 'country', 'supplier',
+        'payment_type', 'price_level', 'accounting', 'is_paid', 'liquidation_date',
+        'total_czk', 'total_czk_bez_dph', 'total_eur', 'total_eur_bez_dph', 'customer_id',
+    )
+    __slots__ = FIELDS
+
+
+ORDER_ITEM_HEADER_FIELDS = (
+    'order_number', 'date', 'company', 'currency', 'channel', 'salesperson', 'country', 'supplier',
+)
+
+INVOICE_ITEM_HEADER_FIELDS = ('invoice_number',) + ORDER_ITEM_HEADER_FIELDS
+
+
+class OrderItem(Record):
+    __slots__ = (
+        'order', 'product_code', 'product_name', 'ean', 'quantity', 'delivered', 'unit',
+        'unit_price', 'discount_percent', 'total_czk', 'total_czk_bez_dph', 'total_eur', 'total_eur_bez_dph',
+    )
+    FIELDS = ORDER_ITEM_HEADER_FIELDS + __slots__[1:]
+
 
-def get_text(element, xpath, default=''):
-    """Safely get text from XML element."""
-    el = element.find(xpath, NS)
-    if el is not None and el.text:
-        return el.text.strip()
-    return default
+class InvoiceItem(Record):
+    __slots__ = (
+        'invoice', 'product_code', 'product_name', 'ean', 'quantity', 'unit',
+        'unit_price', 'discount_percent', 'total_czk', 'total_czk_bez_dph', 'total_eur', 'total_eur_bez_dph',
+    )
+    FIELDS = INVOICE_ITEM_HEADER_FIELDS + __slots__[1:]
+
+
+_parent_properties(OrderItem, 'order', ORDER_ITEM_HEADER_FIELDS)
+_parent_properties(InvoiceItem, 'invoice', INVOICE_ITEM_HEADER_FIELDS)
+
+
+class StockItem(Record):
+    FIELDS = (
+        'code', 'name', 'name_complement', 'full_name', 'ean', 'unit',
+        'count', 'selling_price', 'purchase_price', 'brand',
+        'total_sold_90d', 'avg_daily_sales', 'days_remaining',
+        'avg_daily_7d', 'avg_daily_30d', 'avg_daily_90d', 'avg_daily_365d', 'trend_30d',
+        'forecast_30d', 'forecast_30d_low', 'forecast_30d_high',
+        'stockout_date', 'stockout_date_early', 'stockout_date_late',
+    )
+    __slots__ = FIELDS
+
+
+# ============================================================================
+# COLUMN STORE
+# ============================================================================
+
+class ColumnStore:
+    """
+    Column-oriented, in-memory table built from parsed records.
+
+    Measures are typed arrays of fixed-point integers ('q'). Dimensions are
+    dictionary-encoded: an array of int codes ('i') plus the list of their
+    distinct values, so grouping works on small integers instead of
+    strings. group_by() is vectorized with numpy when it is installed and
+    falls back to a pure-Python loop with identical results otherwise.
+    """
+
+    def __init__(self, size=0):
+        self.size = size
+        self.dimensions = {}  # name -> (codes, values)
+        self.measures = {}    # name -> array('q')
+
+    @classmethod
+    def from_records(cls, records, dimensions=(), measures=()):
+        """
+        Build a store from records.
+
+        `dimensions` holds field names or (name, field, transform) tuples;
+        transformed dimensions are derived from the field's dictionary, so
+        e.g. month costs one call per distinct date, not per row.
+        """
+        store = cls(len(records))
+        for spec in dimensions:
+            name, field, transform = spec if isinstance(spec, tuple) else (spec, spec, None)
+            if field not in store.dimensions:
+                store.add_dimension(field, map(attrgetter(field), records))
+            if transform is not None:
+                store.derive_dimension(name, field, transform)
+        for name in measures:
+            store.measures[name] = array('q', map(attrgetter(name), records))
+        return store
+
+    def add_dimension(self, name, values):
+        """Dictionary-encode an iterable of values as dimension `name`."""
+        index = {}
+        setdefault = index.setdefault
+        codes = array('i', [setdefault(value, len(index)) for value in values])
+        self.dimensions[name] = (codes, list(index))
+
+    def derive_dimension(self, name, source, transform):
+        """Add dimension `name` whose values are transform(value) of `source`."""
+        source_codes, source_values = self.dimensions[source]
+        index = {}
+        lookup = [index.setdefault(transform(value), len(index)) for value in source_values]
+        self.dimensions[name] = (array('i', map(lookup.__getitem__, source_codes)), list(index))
+
+    def values(self, name):
+        """Distinct values of a dimension."""
+        return self.dimensions[name][1]
+
+    def mask(self, name, predicate):
+        """Row mask (array of 0/1) where predicate(dimension value) holds."""
+        codes, values = self.dimensions[name]
+        lookup = [1 if predicate(value) else 0 for value in values]
+        return array('b', map(lookup.__getitem__, codes))
+
+    def group_by(self, dimensions, measures=(), where=None):
+        """
+        Aggregate rows by a tuple of dimensions.
+
+        Returns {(dimension values...): (row count, sum of each measure...)},
+        ordered by dimension codes. `where` is an optional row mask.
+        """
+        codes = [self.dimensions[name][0] for name in dimensions]
+        sizes = [len(self.dimensions[name][1]) for name in dimensions]
+        columns = [self.measures[name] for name in measures]
+
+        if np is not None:
+            groups = self._group_by_numpy(codes, sizes, columns, where)
+        else:
+            groups = self._group_by_python(codes, sizes, columns, where)
+
+        values = [self.dimensions[name][1] for name in dimensions]
+        result = {}
+        for key, totals in groups:
+            labels = []
+            for size, dim_values in zip(reversed(sizes), reversed(values)):
+                key, code = divmod(key, size)
+                labels.append(dim_values[code])
+            result[tuple(reversed(labels))] = totals
+        return result
+
+    def _group_by_numpy(self, codes, sizes, columns, where):
+        keys = np.zeros(self.size, dtype=np.int64)
+        for column, size in zip(codes, sizes):
+            keys = keys * size + np.frombuffer(column, dtype=np.int32)
+        measures = [np.frombuffer(column, dtype=np.int64) for column in columns]
+        if where is not None:
+            selected = np.frombuffer(where, dtype=np.int8).astype(bool)
+            keys = keys[selected]
+            measures = [column[selected] for column in measures]
+
+        unique, inverse = np.unique(keys, return_inverse=True)
+        counts = np.bincount(inverse, minlength=len(unique))
+        sums = []
+        for column in measures:
+            total = np.zeros(len(unique), dtype=np.int64)
+            np.add.at(total, inverse, column)
+            sums.append(total.tolist())
+        return [(key, (count,) + tuple(s[i] for s in sums))
+                for i, (key, count) in enumerate(zip(unique.tolist(), counts.tolist()))]
+
+    def _group_by_python(self, codes, sizes, columns, where):
+        if codes:
+            keys = codes[0]
+            for column, size in zip(codes[1:], sizes[1:]):
+                keys = [key * size + code for key, code in zip(keys, column)]
+        else:
+            keys = [0] * self.size
+
+        counts = defaultdict(int)
+        sums = [defaultdict(int) for _ in columns]
+        rows = range(self.size) if where is None else [i for i, keep in enumerate(where) if keep]
+        for i in rows:
+            key = keys[i]
+            counts[key] += 1
+            for total, column in zip(sums, columns):
+                total[key] += column[i]
+        return [(key, (counts[key],) + tuple(total[key] for total in sums)) for key in sorted(counts)]
+
+
+def order_month(date):
+    """Month bucket ('YYYY-MM') of a document date."""
+    return date[:7] if date else 'Unknown'
+
+
+ORDER_DIMENSIONS = ('date', ('month', 'date', order_month), 'currency', 'channel', 'salesperson',
+                    'country', 'supplier')
+ORDER_MEASURES = ('total_czk', 'total_czk_bez_dph', 'total_eur', 'total_eur_bez_dph')
+
+ITEM_DIMENSIONS = ('date', ('month', 'date', order_month), 'currency', 'channel', 'salesperson',
+                   'country', 'supplier', 'product_code')
+ITEM_MEASURES = ('quantity', 'total_czk', 'total_czk_bez_dph', 'total_eur', 'total_eur_bez_dph')
+
+
+def build_order_store(orders):
+    """Columnar store of orders or invoices."""
+    return ColumnStore.from_records(orders, ORDER_DIMENSIONS, ORDER_MEASURES)
+
+
+def build_item_store(items):
+    """Columnar store of order or invoice items."""
+    return ColumnStore.from_records(items, ITEM_DIMENSIONS, ITEM_MEASURES)
+
+
+def qualify_tag(tag):
+    """Expand a prefixed tag like 'ord:order' to ElementTree's '{uri}order' form."""
+    prefix, local = tag.split(':', 1)
+    return f"{{{NS[prefix]}}}{local}"
+
+
+def iter_xml_records(filepath, tag):
+    """
+    Stream document elements (e.g. 'ord:order') from a Pohoda XML export.
+
+    The file is parsed incrementally by the active XML backend, so only the
+    record currently being yielded is kept in memory. Once the caller moves
+    on to the next record, the element is cleared and detached from the
+    tree, which keeps memory flat regardless of export size.
+    """
+    return xml_backend.iter_records(filepath, qualify_tag(tag))
+
+
+def _etree_iter_records(filepath, qname):
+    """ElementTree implementation of iter_xml_records()."""
+    root = None
+
+    for event, elem in ET.iterparse(filepath, events=('start', 'end')):
+        if root is None:
+            root = elem
+        if event == 'end' and elem.tag == qname:
+            yield elem
+            elem.clear()
+            root.clear()
+
+
+def _lxml_iter_records(filepath, qname):
+    """lxml implementation of iter_xml_records()."""
+    for event, elem in lxml_etree.iterparse(filepath, events=('end',), tag=qname):
+        yield elem
+        elem.clear(keep_tail=True)
+        # Drop the records (and their wrappers) already processed
+        for ancestor in elem.iterancestors():
+            while ancestor.getprevious() is not None:
+                del ancestor.getparent()[0]
+
+
+def resolve_workers(workers):
+    """Return the number of parser processes to use (0 or None = all CPU cores)."""
+    if not workers:
+        return os.cpu_count() or 1
+    return max(1, workers)
+
+
+def map_xml_files(parse_fn, *task_args, workers=1, executor=None):
+    """
+    Apply parse_fn to each export file and yield the results in file order.
+
+    With workers > 1 the files are spread over a process pool, or over the
+    shared `executor` when one is given. Results are still yielded in the
+    original order, so merging them gives exactly the same records as a
+    serial run.
+    """
+    n_tasks = len(task_args[0])
+    if executor is not None and n_tasks:
+        yield from executor.map(parse_fn, *task_args)
+    elif workers > 1 and n_tasks > 1:
+        with ProcessPoolExecutor(max_workers=min(workers, n_tasks), initializer=use_xml_backend,
+                                 initargs=(xml_backend.name,)) as pool:
+            yield from pool.map(parse_fn, *task_args)
+    else:
+        yield from map(parse_fn, *task_args)
+
+
+# ============================================================================
+# ROLLUP ENGINE
+# ============================================================================
+#
+# Reports are grouping sets over orders (or items): a tuple of dimensions,
+# optionally restricted to rows where some dimensions have given values,
+# aggregated into a row count plus sums of the measures. A Rollup reads
+# the records once into a ColumnStore holding every dimension and measure
+# its sets need, then aggregates each set from the integer codes. Adding a
+# report means adding a grouping set, not another scan of the records.
+#
+# Dimensions are record fields (channel, salesperson, country, supplier,
+# currency, payment_type, company, ...) or time grains of the date: day,
+# week (ISO, 'YYYY-Www'), month, quarter ('YYYY-Qn') and year. Grains are
+# derived once per distinct date.
+
+def _date_grain(transform):
+    def grain(date):
+        try:
+            return transform(datetime.date.fromisoformat(date))
+        except (TypeError, ValueError):
+            return 'Unknown'
+    return grain
+
+
+TIME_GRAINS = {
+    'day': _date_grain(lambda day: day.isoformat()),
+    'week': _date_grain(lambda day: '{0}-W{1:02d}'.format(*day.isocalendar())),
+    'month': order_month,
+    'quarter': _date_grain(lambda day: f'{day.year}-Q{(day.month - 1) // 3 + 1}'),
+    'year': _date_grain(lambda day: str(day.year)),
+}
+
+
+class GroupingSet:
+    """
+    Dimensions to group by, plus optional `where` {dimension: value}
+    restricting the set to matching rows.
+    """
+
+    def __init__(self, dimensions, where=None):
+        self.dimensions = tuple(dimensions)
+        self.where = dict(where or {})
+
+
+class Rollup:
+    """
+    Aggregate records into several grouping sets at once.
+
+        rollup = Rollup({'by_week': GroupingSet(('week', 'channel'))}, ('total_czk',))
+        results = rollup.run(orders)
+        results['by_week'][('2025-W03', 'B2B')]  # -> (count, total_czk)
+
+    measures name fixed-point fields of the records (ORDER_MEASURES or
+    ITEM_MEASURES); every cell is (row count, sum of each measure...).
+    """
+
+    def __init__(self, grouping_sets, measures=ORDER_MEASURES):
+        self.grouping_sets = dict(grouping_sets)
+        self.measures = tuple(measures)
+
+    def dimension_specs(self):
+        """ColumnStore dimension specs of all dimensions the sets use."""
+        names = []
+        for grouping_set in self.grouping_sets.values():
+            for name in grouping_set.dimensions + tuple(grouping_set.where):
+                if name not in names:
+                    names.append(name)
+        return tuple((name, 'date', TIME_GRAINS[name]) if name in TIME_GRAINS else name for name in names)
+
+    def run(self, records):
+        """Return {set name: {(dimension values...): (count, sums...)}}."""
+        store = ColumnStore.from_records(records, self.dimension_specs(), self.measures)
+        return self.run_store(store)
+
+    def run_store(self, store):
+        """Like run(), on a store that already holds the dimensions and measures."""
+        results = {}
+        for name, grouping_set in self.grouping_sets.items():
+            where = None
+            for dimension, value in grouping_set.where.items():
+                mask = store.mask(dimension, lambda candidate, value=value: candidate == value)
+                where = mask if where is None else array('b', map(min, where, mask))
+            results[name] = store.group_by(grouping_set.dimensions, self.measures, where=where)
+        return results
+
+
+def pivot(cells, row_dimension, column_dimension, measure=0, dimensions=None):
+    """
+    Nested {row value: {column value: total}} of one measure of a grouping
+    set's cells, summing over its other dimensions.
+
+    `dimensions` are the set's dimension names (default: the two pivoted
+    ones, in that order); `measure` indexes into the measures, or is
+    'count' for the row count.
+    """
+    dimensions = dimensions or (row_dimension, column_dimension)
+    row_index = dimensions.index(row_dimension)
+    column_index = dimensions.index(column_dimension)
+    value_index = 0 if measure == 'count' else measure + 1
+
+    table = defaultdict(lambda: defaultdict(int))
+    for key, values in cells.items():
+        table[key[row_index]][key[column_index]] += values[value_index]
+    return {row: dict(columns) for row, columns in table.items()}
+
+
+# ============================================================================
+# SALES INDEX
+# ============================================================================
+#
+# Stock predictions need sold quantities per product over several windows
+# (7/30/90/365 days) and as-of dates. SalesIndex sums the order items
+# per product and day once, then keeps running totals (prefix sums) per
+# product, so any window is the difference of two lookups. Quantities are
+# fixed-point like everywhere else. The running totals are a numpy matrix
+# (products x days) when numpy is installed, arrays of integers otherwise.
+
+SALES_WINDOWS = (7, 30, 90, 365)
+
+
+class SalesIndex:
+    """
+    Daily sold quantities per product code, as prefix sums.
+
+    Day 0 is the first sales date and `last_day` the last one; `sold()`
+    and `trend()` count windows ending at `last_day` unless given an
+    as-of day.
+    """
+
+    def __init__(self, first_date, days, rows, prefix):
+        self.first_date = first_date
+        self.days = days
+        self.last_day = days - 1
+        self.rows = rows      # product code -> row of prefix
+        self.prefix = prefix  # row -> running totals, prefix[row][d] = sold before day d
+
+    @classmethod
+    def from_items(cls, items):
+        """Build the index from order (or invoice) items."""
+        store = ColumnStore.from_records(items, ('date', 'product_code'), ('quantity',))
+        day_of = {}
+        for value in store.values('date'):
+            try:
+                day_of[value] = datetime.date.fromisoformat(value)
+            except (TypeError, ValueError):
+                pass
+        if not day_of:
+            return cls(None, 0, {}, [])
+
+        first_date = min(day_of.values())
+        days = (max(day_of.values()) - first_date).days + 1
+        day_of = {value: (day - first_date).days for value, day in day_of.items()}
+
+        cells = []
+        rows = {}
+        for (date, code), (count, quantity) in store.group_by(('date', 'product_code'), ('quantity',)).items():
+            if code and date in day_of:
+                cells.append((rows.setdefault(code, len(rows)), day_of[date], quantity))
+
+        if np is not None:
+            prefix = np.zeros((len(rows), days + 1), dtype=np.int64)
+            if cells:
+                row_index, day_index, quantities = (np.array(column, dtype=np.int64) for column in zip(*cells))
+                np.add.at(prefix, (row_index, day_index + 1), quantities)
+            np.cumsum(prefix, axis=1, out=prefix)
+        else:
+            daily = [[0] * (days + 1) for _ in rows]
+            for row, day, quantity in cells:
+                daily[row][day + 1] += quantity
+            prefix = [array('q', accumulate(row)) for row in daily]
+        return cls(first_date, days, rows, prefix)
+
+    def day(self, date):
+        """Day number of a 'YYYY-MM-DD' date."""
+        return (datetime.date.fromisoformat(date) - self.first_date).days
+
+    def sold(self, code, days, as_of=None):
+        """Fixed-point quantity of `code` sold in the `days` days up to and including day as_of."""
+        row = self.rows.get(code)
+        if row is None:
+            return 0
+        end = min(self.last_day if as_of is None else as_of, self.last_day) + 1
+        if end <= 0:
+            return 0
+        totals = self.prefix[row]
+        return int(totals[end] - totals[max(end - days, 0)])
+
+    def trend(self, code, days, as_of=None):
+        """
+        Relative change of sales in the last `days` days against the `days`
+        before them (0.5 = sold 50 % more), or None without earlier sales.
+        """
+        as_of = self.last_day if as_of is None else as_of
+        previous = self.sold(code, days, as_of - days)
+        if not previous:
+            return None
+        return (self.sold(code, days, as_of) - previous) / previous
+
+
+# ============================================================================
+# DEMAND FORECAST
+# ============================================================================
+#
+# Stock-out dates come from a damped additive Holt-Winters model (level,
+# trend, weekly seasonality) fitted to every product's daily sales at
+# once. Yearly seasonality (race season, winter) is handled by first
+# dividing each day by a per-product calendar month factor, shrunk
+# towards 1 while there is little history, and multiplying forecasts by
+# it again. Each product gets the smoothing parameters of FORECAST_GRID
+# that fit its history best (one-step-ahead squared error). Bands come from
+# the spread of the one-step errors, growing with the square root of
+# the horizon.
+#
+# With numpy the model runs over a (parameter sets x products) matrix one
+# day at a time and thousands of products take well under a second.
+# Without it the same arithmetic runs per product on floats, with
+# identical results, but over ten times slower per product; a warning says
+# so, as a daily update with thousands of products then takes tens of
+# seconds. numpy is the one dependency the forecast really wants.
+
+FORECAST_GRID = tuple((alpha, beta, gamma) for alpha in (0.05, 0.2) for beta in (0.01, 0.1) for gamma in (0.05, 0.2))
+FORECAST_DAMPING = 0.98
+FORECAST_HORIZON = 365
+FORECAST_Z = 1.2816  # two-sided 80 % band
+FORECAST_DIGITS = 3  # decimals of exported forecast quantities
+_SEASON_INIT_DAYS = 28
+
+
+def _fit_holt_winters(series, days, alpha, beta, gamma):
+    """
+    Fit the model to series(t) for t < days, in error-correction form.
+
+    Only arithmetic is used, so values and parameters may be floats or
+    numpy arrays (broadcast elementwise). Returns (level, trend, season,
+    squared error sum, number of errors).
+    """
+    init = min(days, _SEASON_INIT_DAYS)
+    level = 0.0
+    for t in range(init):
+        level = level + series(t)
+    level = level / init
+
+    season = [0.0] * 7
+    if init >= 7:
+        for slot in range(7):
+            total = 0.0
+            count = 0
+            for t in range(slot, init, 7):
+                total = total + series(t)
+                count += 1
+            season[slot] = total / count - level
+
+    trend = 0.0 * level
+    sse = 0.0 * level
+    for t in range(init, days):
+        slot = t % 7
+        error = series(t) - (level + FORECAST_DAMPING * trend + season[slot])
+        sse = sse + error * error
+        level = level + FORECAST_DAMPING * trend + alpha * error
+        trend = FORECAST_DAMPING * trend + alpha * beta * error
+        season[slot] = season[slot] + gamma * (1 - alpha) * error
+    return level, trend, season, sse, days - init
+
+
+def _yearly_factors(month_sums, month_days, total, days):
+    """Calendar month factors (12) from sold quantities per month, shrunk towards 1."""
+    if days < 365 or not total:
+        return [1.0] * 12
+    years = days / 365
+    weight = years / (years + 1)
+    return [1.0 + ((month_sum * days) / (total * month_day) - 1.0) * weight if month_day else 1.0
+            for month_sum, month_day in zip(month_sums, month_days)]
+
+
+def _forecast_paths(level, trend, season, sigma, days, factor_of, maximum):
+    """Yield (h, cumulative demand, low, high) for h = 1..FORECAST_HORIZON."""
+    damping = 0.0
+    cumulative = 0.0
+    for h in range(1, FORECAST_HORIZON + 1):
+        damping = damping + FORECAST_DAMPING ** h
+        point = maximum((level + damping * trend + season[(days - 1 + h) % 7]) * factor_of(h), 0.0)
+        cumulative = cumulative + point
+        spread = FORECAST_Z * sigma * math.sqrt(h)
+        yield h, cumulative, maximum(cumulative - spread, 0.0), cumulative + spread
+
+
+def forecast_demand(index, stock):
+    """
+    Forecast demand of the products in `stock` ({code: fixed-point count}).
+
+    Returns {code: fields} with forecast_30d(_low/_high) quantities and
+    stockout_date (plus _early/_late, the band) as 'YYYY-MM-DD' or None
+    when stock lasts beyond FORECAST_HORIZON. Products without sales are
+    left out.
+    """
+    codes = [code for code in stock if code in index.rows]
+    if not codes:
+        return {}
+
+    days = index.days
+    scale = _POW10[QUANTITY_DIGITS]
+    last_date = index.first_date + datetime.timedelta(days=index.last_day)
+    future_months = [(last_date + datetime.timedelta(days=h)).month - 1 for h in range(FORECAST_HORIZON + 1)]
+
+    # Calendar month of every day, as runs of (month, first day, end day)
+    runs = []
+    month_days = [0] * 12
+    for day in range(days):
+        month = (index.first_date + datetime.timedelta(days=day)).month - 1
+        if runs and runs[-1][0] == month and runs[-1][2] == day:
+            runs[-1][2] = day + 1
+        else:
+            runs.append([month, day, day + 1])
+        month_days[month] += 1
+    month_of_day = [month for month, start, end in runs for _ in range(start, end)]
+
+    if np is not None:
+        return _forecast_numpy(index, codes, stock, days, scale, last_date, future_months, runs, month_days,
+                               month_of_day)
+    print(f"Warning: numpy is not installed, forecasting {len(codes)} products in pure Python "
+          f"(slow for thousands of products; pip install numpy)")
+    return _forecast_python(index, codes, stock, days, scale, last_date, future_months, runs, month_days,
+                            month_of_day)
+
+
+def _forecast_fields(count, last_date, at_30, hits):
+    """Exported fields of one product: 30-day demand (point, low, high) and first stock-out days."""
+    fields = {name: round(float(value), FORECAST_DIGITS)
+              for name, value in zip(('forecast_30d', 'forecast_30d_low', 'forecast_30d_high'), at_30)}
+    for name, h in zip(('stockout_date', 'stockout_date_early', 'stockout_date_late'), hits):
+        if h is not None:
+            h = 0 if count <= 0 else h
+            h = (last_date + datetime.timedelta(days=h)).isoformat()
+        fields[name] = h
+    return fields
+
+
+def _forecast_python(index, codes, stock, days, scale, last_date, future_months, runs, month_days, month_of_day):
+    forecasts = {}
+    for code in codes:
+        totals = index.prefix[index.rows[code]]
+        month_sums = [0] * 12
+        for month, start, end in runs:
+            month_sums[month] += totals[end] - totals[start]
+        factors = _yearly_factors(month_sums, month_days, totals[days], days)
+        daily = [(totals[t + 1] - totals[t]) / scale / factors[month_of_day[t]] for t in range(days)]
+
+        best = None
+        for alpha, beta, gamma in FORECAST_GRID:
+            fit = _fit_holt_winters(daily.__getitem__, days, alpha, beta, gamma)
+            if best is None or fit[3] < best[3]:
+                best = fit
+        level, trend, season, sse, errors = best
+        sigma = math.sqrt(sse / max(errors, 1))
+
+        # Point demand reaches the stock first, then the high and the low end of the band
+        count = stock[code] / scale
+        hits = [None, None, None]
+        for h, cumulative, low, high in _forecast_paths(level, trend, season, sigma, days,
+                                                        lambda h: factors[future_months[h]], max):
+            if h == 30:
+                at_30 = (cumulative, low, high)
+            for i, demand in enumerate((cumulative, high, low)):
+                if hits[i] is None and demand >= count:
+                    hits[i] = h
+        forecasts[code] = _forecast_fields(count, last_date, at_30, hits)
+    return forecasts
+
+
+def _forecast_numpy(index, codes, stock, days, scale, last_date, future_months, runs, month_days, month_of_day):
+    rows = np.array([index.rows[code] for code in codes])
+    totals = index.prefix[rows]
+
+    month_sums = np.zeros((len(codes), 12), dtype=np.int64)
+    for month, start, end in runs:
+        month_sums[:, month] += totals[:, end] - totals[:, start]
+    factors = np.array([_yearly_factors(sums, month_days, total, days)
+                        for sums, total in zip(month_sums.tolist(), totals[:, days].tolist())])
+    daily = (np.diff(totals, axis=1) / scale) / factors[:, month_of_day]
+
+    # State matrices have a row per parameter set and a column per product
+    grid = np.array(FORECAST_GRID)
+    alpha, beta, gamma = (grid[:, i:i + 1] for i in range(3))
+    shape = (len(grid), len(codes))
+    level, trend, season, sse, errors = _fit_holt_winters(lambda t: daily[:, t], days, alpha, beta, gamma)
+    best = np.argmin(np.broadcast_to(sse, shape), axis=0)
+    columns = np.arange(len(codes))
+
+    def pick(state):
+        return np.broadcast_to(state, shape)[best, columns]
+
+    sigma = np.sqrt(pick(sse) / max(errors, 1))
+    paths = np.array([path[1:] for path in _forecast_paths(
+        pick(level), pick(trend), [pick(slot) for slot in season], sigma, days,
+        lambda h: factors[:, future_months[h]], np.maximum)])  # horizon x (point, low, high) x product
+
+    counts = np.array([stock[code] for code in codes]) / scale
+    hits = []
+    for demand in (paths[:, 0], paths[:, 2], paths[:, 1]):
+        reached = demand >= counts
+        hits.append(np.where(reached.any(axis=0), reached.argmax(axis=0) + 1, -1).tolist())
+    return {code: _forecast_fields(counts[i], last_date, paths[29, :, i],
+                                   [None if h[i] < 0 else h[i] for h in hits])
+            for i, code in enumerate(codes)}
+
+
+# ============================================================================
+# PARSE CACHE
+# ============================================================================
+#
+# Parsed records are cached per source file as pickles under
+# <cache_dir>/<kind>/. An entry is reused when the parser version and
+# task arguments match and the file is unchanged: same size and mtime, or,
+# if only the mtime moved, the same SHA-256 of its content. Files that
+# fail to parse are never cached, so their errors keep being reported;
+# valid exports without records are cached like any other.
+
+def file_sha256(filepath):
+    """Return the SHA-256 hex digest of a file's content."""
+    digest = hashlib.sha256()
+    with open(filepath, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_cache_key(filepath):
+    """Return the cache key of a source file: path, size, mtime and content hash."""
+    st = os.stat(filepath)
+    return {
+        'path': os.path.abspath(filepath),
+        'size': st.st_size,
+        'mtime': st.st_mtime_ns,
+        'sha256': file_sha256(filepath),
+    }
+
+
+def _cache_entry_path(cache_dir, kind, filepath):
+    name = hashlib.sha1(os.path.abspath(filepath).encode('utf-8')).hexdigest()
+    return os.path.join(cache_dir, kind, name + '.pickle')
+
+
+def load_cached_parse(cache_dir, kind, filepath, args=()):
+    """Return the cached parse result for a file, or None if it must be parsed."""
+    entry_path = _cache_entry_path(cache_dir, kind, filepath)
+    try:
+        with open(entry_path, 'rb') as f:
+            entry = pickle.load(f)
+        st = os.stat(filepath)
+    except Exception:
+        return None
+
+    key = entry.get('key', {})
+    if (entry.get('version') != PARSER_VERSION or entry.get('args') != args
+            or key.get('path') != os.path.abspath(filepath) or key.get('size') != st.st_size):
+        return None
+
+    if key.get('mtime') != st.st_mtime_ns:
+        # Touched but possibly unchanged - compare content, then refresh the key
+        if key.get('sha256') != file_sha256(filepath):
+            return None
+        store_cached_parse(cache_dir, kind, filepath, entry['result'], args, dict(key, mtime=st.st_mtime_ns))
+
+    return entry['result']
+
+
+def store_cached_parse(cache_dir, kind, filepath, result, args=(), key=None):
+    """Write a parse result to the cache (key defaults to the file's current state)."""
+    entry_path = _cache_entry_path(cache_dir, kind, filepath)
+    os.makedirs(os.path.dirname(entry_path), exist_ok=True)
+    entry = {
+        'version': PARSER_VERSION,
+        'args': args,
+        'key': key or file_cache_key(filepath),
+        'result': result,
+    }
+    tmp_path = f"{entry_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(entry, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, entry_path)
+
+
+def evict_parse_cache(cache_dir, kind, live_files):
+    """Remove cache entries of a kind whose source file is no longer exported."""
+    kind_dir = os.path.join(cache_dir, kind)
+    if not os.path.isdir(kind_dir):
+        return
+    live = {os.path.basename(_cache_entry_path(cache_dir, kind, f)) for f in live_files}
+    for name in os.listdir(kind_dir):
+        if name not in live:
+            os.remove(os.path.join(kind_dir, name))
+
+
+def parse_files_cached(kind, parse_fn, xml_files, *task_args, workers=1, cache_dir=None, executor=None):
+    """
+    Yield (result, from_cache) for each file in order.
+
+    Unchanged files are served from the parse cache in cache_dir; the rest
+    go through map_xml_files() and are cached unless they failed. parse_fn
+    returns (result, error message or None). Each result is
+    yielded as soon as it is ready, so the caller's log of a file stays
+    next to anything printed while parsing it. task_args holds
+    extra per-file arguments for parse_fn (they are part of the cache key).
+    Without a cache_dir every file is parsed.
+    """
+    per_file_args = [tuple(args) for args in zip(*task_args)] if task_args else [()] * len(xml_files)
+    cached = {}
+    keys = {}
+
+    if cache_dir:
+        evict_parse_cache(cache_dir, kind, xml_files)
+        for filepath, args in zip(xml_files, per_file_args):
+            result = load_cached_parse(cache_dir, kind, filepath, args)
+            if result is not None:
+                cached[filepath] = result
+            else:
+                keys[filepath] = file_cache_key(filepath)
+
+    pending = [i for i, filepath in enumerate(xml_files) if filepath not in cached]
+    results = map_xml_files(parse_fn, [xml_files[i] for i in pending],
+                            *[[args[i] for i in pending] for args in task_args],
+                            workers=workers, executor=executor)
+
+    # Pending files come out of map_xml_files() lazily, in the same order
+    for filepath, args in zip(xml_files, per_file_args):
+        if filepath in cached:
+            yield cached[filepath], True
+            continue
+        result = next(results)
+        if cache_dir and result[1] is None:
+            store_cached_parse(cache_dir, kind, filepath, result, args, keys[filepath])
+        yield result, False
 
 
 def classify_order(order_number, currency, centre):
@@ -90,214 +1037,1299 @@ def classify_order(order_number, currency, centre):
     return ('B2B', salesperson, country, 'VITAR')
 
 
+# Product name fragments of ENERVIT products (mirrors classifyBrand() in app.js)
+ENERVIT_NAME_PARTS = (
+    'ENERVIT', 'ISOCARB', 'CARBO GEL', 'CARBO FLOW', 'CARBO BAR', 'CARBO CHEWS',
+    'CARBO JELLY', 'CARBO TABLETS', 'COMPETITION BAR', 'ISOTONIC', 'RECOVERY DRINK',
+    'LIQUID GEL', 'PRE SPORT', 'AFTER SPORT', 'PROTEIN BAR', 'C2:1', 'BCAA',
+    'CREATINA', 'CREATINE', 'MAGNESIUM SPORT', 'GEL (25',
+)
+
+
+def classify_brand(product_name):
+    """
+    Classify product brand based on product name.
+
+    Returns 'ENERVIT', 'ROYALBAY' or 'VITAR', exactly like classifyBrand()
+    in app.js.
+    """
+    if not product_name:
+        return 'VITAR'
+    name = product_name.upper()
+
+    if any(part in name for part in ENERVIT_NAME_PARTS) or ('GEL (' in name and 'ML)' in name):
+        return 'ENERVIT'
+
+    if 'ROYAL BAY' in name or 'ROYALBAY' in name:
+        return 'ROYALBAY'
+
+    return 'VITAR'
+
+
+# ============================================================================
+# FIELD MAPS
+# ============================================================================
+#
+# Each map lists the fields of one record type as child paths relative to
+# the record element. compile_field_map() turns a map into an extractor that
+# fills the whole record in a single walk over the element's children,
+# instead of one './/' descendant search per field. A field spec is either a
+# path or a (path, default) tuple; the default is used when the element is
+# missing or empty.
+
+ORDER_FIELDS = {
+    'order_number': 'ord:orderHeader/ord:numberOrder',
+    'internal_number': 'ord:orderHeader/ord:number/typ:numberRequested',
+    'date': 'ord:orderHeader/ord:date',
+    'date_from': 'ord:orderHeader/ord:dateFrom',
+    'date_to': 'ord:orderHeader/ord:dateTo',
+    'centre': 'ord:orderHeader/ord:centre/typ:ids',
+    'company': 'ord:orderHeader/ord:partnerIdentity/typ:address/typ:company',
+    'customer_name': 'ord:orderHeader/ord:partnerIdentity/typ:address/typ:name',
+    'city': 'ord:orderHeader/ord:partnerIdentity/typ:address/typ:city',
+    'street': 'ord:orderHeader/ord:partnerIdentity/typ:address/typ:street',
+    'zip': 'ord:orderHeader/ord:partnerIdentity/typ:address/typ:zip',
+    'customer_country': 'ord:orderHeader/ord:partnerIdentity/typ:address/typ:country/typ:ids',
+    'ico': 'ord:orderHeader/ord:partnerIdentity/typ:address/typ:ico',
+    'dic': 'ord:orderHeader/ord:partnerIdentity/typ:address/typ:dic',
+    'email': 'ord:orderHeader/ord:partnerIdentity/typ:address/typ:email',
+    'mobil_phone': 'ord:orderHeader/ord:partnerIdentity/typ:address/typ:mobilPhone',
+    'phone': 'ord:orderHeader/ord:partnerIdentity/typ:address/typ:phone',
+    'payment_type': 'ord:orderHeader/ord:paymentType/typ:ids',
+    'price_level': 'ord:orderHeader/ord:priceLevel/typ:ids',
+    'is_executed': 'ord:orderHeader/ord:isExecuted',
+    'is_delivered': 'ord:orderHeader/ord:isDelivered',
+    'note': 'ord:orderHeader/ord:note',
+    'int_note': 'ord:orderHeader/ord:intNote',
+    'foreign_currency': 'ord:orderSummary/ord:foreignCurrency/typ:currency/typ:ids',
+    'foreign_price_sum': ('ord:orderSummary/ord:foreignCurrency/typ:priceSum', '0'),
+    'price_none': ('ord:orderSummary/ord:homeCurrency/typ:priceNone', '0'),
+    'price_low': ('ord:orderSummary/ord:homeCurrency/typ:priceLow', '0'),
+    'price_low_sum': ('ord:orderSummary/ord:homeCurrency/typ:priceLowSum', '0'),
+    'price_high': ('ord:orderSummary/ord:homeCurrency/typ:priceHigh', '0'),
+    'price_high_sum': ('ord:orderSummary/ord:homeCurrency/typ:priceHighSum', '0'),
+}
+
+ORDER_ITEM_FIELDS = {
+    'product_name': 'ord:text',
+    'product_code': 'ord:code',
+    'quantity': ('ord:quantity', '0'),
+    'delivered': ('ord:delivered', '0'),
+    'unit': 'ord:unit',
+    'discount_percent': ('ord:discountPercentage', '0'),
+    'ean': 'ord:stockItem/typ:stockItem/typ:EAN',
+    'unit_price': ('ord:homeCurrency/typ:unitPrice', '0'),
+    'price': ('ord:homeCurrency/typ:price', '0'),  # bez DPH
+    'price_sum': ('ord:homeCurrency/typ:priceSum', '0'),  # s DPH
+}
+
+INVOICE_FIELDS = {
+    'invoice_number': 'inv:invoiceHeader/inv:number/typ:numberRequested',
+    'sym_var': 'inv:invoiceHeader/inv:symVar',
+    'order_number': 'inv:invoiceHeader/inv:numberOrder',
+    'date': 'inv:invoiceHeader/inv:date',
+    'date_tax': 'inv:invoiceHeader/inv:dateTax',
+    'date_due': 'inv:invoiceHeader/inv:dateDue',
+    'centre': 'inv:invoiceHeader/inv:centre/typ:ids',
+    'company': 'inv:invoiceHeader/inv:partnerIdentity/typ:address/typ:company',
+    'customer_name': 'inv:invoiceHeader/inv:partnerIdentity/typ:address/typ:name',
+    'city': 'inv:invoiceHeader/inv:partnerIdentity/typ:address/typ:city',
+    'street': 'inv:invoiceHeader/inv:partnerIdentity/typ:address/typ:street',
+    'zip': 'inv:invoiceHeader/inv:partnerIdentity/typ:address/typ:zip',
+    'customer_country': 'inv:invoiceHeader/inv:partnerIdentity/typ:address/typ:country/typ:ids',
+    'ico': 'inv:invoiceHeader/inv:partnerIdentity/typ:address/typ:ico',
+    'dic': 'inv:invoiceHeader/inv:partnerIdentity/typ:address/typ:dic',
+    'email': 'inv:invoiceHeader/inv:partnerIdentity/typ:address/typ:email',
+    'mobil_phone': 'inv:invoiceHeader/inv:partnerIdentity/typ:address/typ:mobilPhone',
+    'phone': 'inv:invoiceHeader/inv:partnerIdentity/typ:address/typ:phone',
+    'payment_type': 'inv:invoiceHeader/inv:paymentType/typ:ids',
+    'price_level': 'inv:invoiceHeader/inv:priceLevel/typ:ids',
+    'accounting': 'inv:invoiceHeader/inv:accounting/typ:ids',
+    'liquidation_date': 'inv:invoiceHeader/inv:liquidation/typ:date',
+    'foreign_currency': 'inv:invoiceSummary/inv:foreignCurrency/typ:currency/typ:ids',
+    'foreign_price_sum': ('inv:invoiceSummary/inv:foreignCurrency/typ:priceSum', '0'),
+    'price_none': ('inv:invoiceSummary/inv:homeCurrency/typ:priceNone', '0'),
+    'price_low': ('inv:invoiceSummary/inv:homeCurrency/typ:priceLow', '0'),
+    'price_low_sum': ('inv:invoiceSummary/inv:homeCurrency/typ:priceLowSum', '0'),
+    'price_high': ('inv:invoiceSummary/inv:homeCurrency/typ:priceHigh', '0'),
+    'price_high_sum': ('inv:invoiceSummary/inv:homeCurrency/typ:priceHighSum', '0'),
+}
+
+INVOICE_ITEM_FIELDS = {
+    'product_name': 'inv:text',
+    'product_code': 'inv:code',
+    'quantity': ('inv:quantity', '0'),
+    'unit': 'inv:unit',
+    'discount_percent': ('inv:discountPercentage', '0'),
+    'ean': 'inv:stockItem/typ:stockItem/typ:EAN',
+    'unit_price': ('inv:homeCurrency/typ:unitPrice', '0'),
+    'price': ('inv:homeCurrency/typ:price', '0'),  # bez DPH
+    'price_sum': ('inv:homeCurrency/typ:priceSum', '0'),  # s DPH
+    'foreign_price': ('inv:foreignCurrency/typ:price', '0'),  # bez DPH
+    'foreign_price_sum': ('inv:foreignCurrency/typ:priceSum', '0'),  # s DPH
+}
+
+STOCK_FIELDS = {
+    'code': 'stk:stockHeader/stk:code',
+    'name': 'stk:stockHeader/stk:name',
+    'name_complement': 'stk:stockHeader/stk:nameComplement',
+    'ean': 'stk:stockHeader/stk:EAN',
+    'unit': 'stk:stockHeader/stk:unit',
+    'count': ('stk:stockHeader/stk:count', '0'),
+    'selling_price': ('stk:stockHeader/stk:sellingPrice', '0'),
+    'purchase_price': ('stk:stockHeader/stk:purchasingPrice', '0'),
+}
+
+
+def compile_field_map(fields):
+    """
+    Compile a field map into an extractor function.
+
+    The paths are merged into one tree of qualified tags, so the returned
+    function visits each relevant child element once and returns a dict of
+    stripped text values keyed by field name. As with Element.find(), the
+    first matching element wins.
+    """
+    tree = {}
+    defaults = {}
+
+    for name, spec in fields.items():
+        path, default = spec if isinstance(spec, tuple) else (spec, '')
+        defaults[name] = default
+        node = tree
+        tags = [qualify_tag(tag) for tag in path.split('/')]
+        for tag in tags[:-1]:
+            node = node.setdefault(tag, ({}, []))[0]
+        node.setdefault(tags[-1], ({}, []))[1].append(name)
+
+    def walk(element, node, record):
+        for child in element:
+            entry = node.get(child.tag)
+            if entry is None:
+                continue
+            subtree, names = entry
+            for name in names:
+                if name not in record:
+                    text = child.text
+                    record[name] = text.strip() if text else defaults[name]
+            if subtree:
+                walk(child, subtree, record)
+
+    def extract(element):
+        record = {}
+        walk(element, tree, record)
+        if len(record) < len(defaults):
+            for name, default in defaults.items():
+                record.setdefault(name, default)
+        return record
+
+    return extract
+
+
+extract_order_fields = compile_field_map(ORDER_FIELDS)
+extract_order_item_fields = compile_field_map(ORDER_ITEM_FIELDS)
+extract_invoice_fields = compile_field_map(INVOICE_FIELDS)
+extract_invoice_item_fields = compile_field_map(INVOICE_ITEM_FIELDS)
+extract_stock_fields = compile_field_map(STOCK_FIELDS)
+
+
+# ============================================================================
+# XML BACKENDS
+# ============================================================================
+#
+# A backend streams record elements out of export files. 'etree'
+# (xml.etree.ElementTree) is always available; 'lxml' is used when lxml is
+# installed. Both produce identical records, so parse cache entries are
+# shared between them.
+#
+# lxml elements support the same child iteration, tags and text as
+# ElementTree ones, so the field extractors above serve both backends;
+# per-field precompiled XPath turned out slower than their single walk.
+
+class XmlBackend:
+    """An XML parser backend: streams record elements out of export files."""
+
+    __slots__ = ('name', 'iter_records')
+
+    def __init__(self, name, iter_records):
+        self.name = name
+        self.iter_records = iter_records
+
+
+XML_BACKENDS = {
+    'etree': XmlBackend('etree', _etree_iter_records),
+}
+if lxml_etree is not None:
+    XML_BACKENDS['lxml'] = XmlBackend('lxml', _lxml_iter_records)
+
+# Exceptions raised for malformed XML by any backend
+XML_PARSE_ERRORS = (ET.ParseError,) + ((lxml_etree.XMLSyntaxError,) if lxml_etree is not None else ())
+
+
+def use_xml_backend(name='auto'):
+    """
+    Switch XML parsing to backend `name` ('auto', 'lxml' or 'etree').
+
+    'auto' picks lxml when it is installed and ElementTree otherwise.
+    Returns the selected backend.
+    """
+    global xml_backend
+
+    if name == 'auto':
+        name = 'lxml' if 'lxml' in XML_BACKENDS else 'etree'
+    if name not in XML_BACKENDS:
+        raise ValueError(f"XML backend '{name}' is not available")
+
+    xml_backend = XML_BACKENDS[name]
+    return xml_backend
+
+
+use_xml_backend()
+
+
 def parse_order_items(order_element, order_info):
     """Parse order items and return list of item data."""
     items = []
-    detail = order_element.find('.//ord:orderDetail', NS)
+    detail = order_element.find('ord:orderDetail', NS)
 
     if detail is None:
         return items
 
-    for item in detail.findall('.//ord:orderItem', NS):
-        product_name = get_text(item, './/ord:text')
-        product_code = get_text(item, './/ord:code')
-        quantity = Decimal(get_text(item, './/ord:quantity', '0'))
-        delivered = Decimal(get_text(item, './/ord:delivered', '0'))
-        unit = get_text(item, './/ord:unit')
-        discount = Decimal(get_text(item, './/ord:discountPercentage', '0'))
-
-        # Get EAN
-        ean = get_text(item, './/ord:stockItem//typ:stockItem//typ:EAN')
-
-        # Get price
-        home_curr = item.find('.//ord:homeCurrency', NS)
-        if home_curr is not None:
-            unit_price = Decimal(get_text(home_curr, './/typ:unitPrice', '0'))
-            price_without_vat = Decimal(get_text(home_curr, './/typ:price', '0'))  # bez DPH
-            price_sum = Decimal(get_text(home_curr, './/typ:priceSum', '0'))  # s DPH
-        else:
-            unit_price = Decimal('0')
-            price_without_vat = Decimal('0')
-            price_sum = Decimal('0')
+    for item in detail.findall('ord:orderItem', NS):
+        fields = extract_order_item_fields(item)
 
         # Skip items with no product code (like shipping, discounts)
-        if not product_code:
+        if not fields['product_code']:
             continue
 
-        items.append({
-            'order_number': order_info['order_number'],
-            'date': order_info['date'],
-            'company': order_info['company'],
-            'currency': order_info['currency'],
-            'channel': order_info['channel'],
-            'salesperson': order_info['salesperson'],
-            'country': order_info['country'],
-            'supplier': order_info['supplier'],
-            'product_code': product_code,
-            'product_name': product_name,
-            'ean': ean,
-            'quantity': quantity,
-            'delivered': delivered,
-            'unit': unit,
-            'unit_price': unit_price,
-            'discount_percent': discount,
-            'total_czk': price_sum if order_info['currency'] != 'EUR' else Decimal('0'),
-            'total_czk_bez_dph': price_without_vat if order_info['currency'] != 'EUR' else Decimal('0'),
-            'total_eur': Decimal('0'),
-            'total_eur_bez_dph': Decimal('0'),
-        })
+        items.append(OrderItem(
+            order=order_info,
+            product_code=intern(fields['product_code']),
+            product_name=intern(fields['product_name']),
+            ean=intern(fields['ean']),
+            quantity=to_fixed(fields['quantity'], QUANTITY_DIGITS),
+            delivered=to_fixed(fields['delivered'], QUANTITY_DIGITS),
+            unit=intern(fields['unit']),
+            unit_price=to_fixed(fields['unit_price'], UNIT_PRICE_DIGITS),
+            discount_percent=to_fixed(fields['discount_percent'], QUANTITY_DIGITS),
+            total_czk=to_fixed(fields['price_sum'], MONEY_DIGITS) if order_info.currency != 'EUR' else 0,
+            total_czk_bez_dph=to_fixed(fields['price'], MONEY_DIGITS) if order_info.currency != 'EUR' else 0,
+            total_eur=0,
+            total_eur_bez_dph=0,
+        ))
+
+    return items
+
+
+def parse_order(order_element):
+    """Parse a single order element and return order data."""
+    if order_element.find('ord:orderHeader', NS) is None:
+        return None, []
+
+    fields = extract_order_fields(order_element)
+
+    # Get currency (check foreignCurrency for EUR)
+    currency = 'EUR' if fields['foreign_currency'] == 'EUR' else 'CZK'
+
+    # Get totals from summary - use foreignCurrency for EUR orders, homeCurrency for CZK
+    total_czk = 0
+    total_czk_bez_dph = 0
+    total_eur = 0
+    total_eur_bez_dph = 0
+
+    if currency == 'EUR':
+        # For EUR orders, get the EUR amount from foreignCurrency
+        total_eur = to_fixed(fields['foreign_price_sum'], MONEY_DIGITS)
+        # For EUR/SK orders, VAT is typically 0 or handled differently
+        # Use priceSum as bez DPH value (SK market is essentially without VAT)
+        total_eur_bez_dph = total_eur
+        # Also get CZK equivalent from homeCurrency
+        total_czk = (to_fixed(fields['price_none'], MONEY_DIGITS) + to_fixed(fields['price_low_sum'], MONEY_DIGITS)
+                     + to_fixed(fields['price_high_sum'], MONEY_DIGITS))
+    else:
+        # For CZK orders
+        # With VAT (priceSum = priceLowSum + priceHighSum)
+        total_czk = (to_fixed(fields['price_low_sum'], MONEY_DIGITS)
+                     + to_fixed(fields['price_high_sum'], MONEY_DIGITS))
+        # Without VAT (price = priceLow + priceHigh)
+        total_czk_bez_dph = (to_fixed(fields['price_low'], MONEY_DIGITS)
+                             + to_fixed(fields['price_high'], MONEY_DIGITS))
+
+    # Classify order
+    order_number = fields['order_number']
+    centre = intern(fields['centre'])
+    channel, salesperson, country, supplier = classify_order(order_number, currency, centre)
+
+    order_data = Order(
+        order_number=order_number,
+        internal_number=fields['internal_number'],
+        date=intern(fields['date']),
+        date_from=fields['date_from'],
+        date_to=fields['date_to'],
+        company=intern(fields['company']),
+        customer_name=intern(fields['customer_name']),
+        city=intern(fields['city']),
+        street=intern(fields['street']),
+        zip=intern(fields['zip']),
+        customer_country=intern(fields['customer_country']),
+        ico=intern(fields['ico']),
+        dic=intern(fields['dic']),
+        email=intern(fields['email']),
+        phone=fields['mobil_phone'] or fields['phone'],
+        customer_id=customer_id(fields['ico'], fields['company'] or fields['customer_name'], fields['zip']),
+        currency=currency,
+        centre=centre,
+        channel=channel,
+        salesperson=salesperson,
+        country=country,
+        supplier=supplier,
+        payment_type=intern(fields['payment_type']),
+        price_level=intern(fields['price_level']),
+        is_executed=fields['is_executed'] == 'true',
+        is_delivered=fields['is_delivered'] == 'true',
+        note=fields['note'],
+        int_note=fields['int_note'],
+        total_czk=total_czk,
+        total_czk_bez_dph=total_czk_bez_dph,
+        total_eur=total_eur,
+        total_eur_bez_dph=total_eur_bez_dph,
+    )
+
+    # Parse order items
+    items = parse_order_items(order_element, order_data)
+
+    return order_data, items
+
+
+# ============================================================================
+# OUTPUT FILES
+# ============================================================================
+
+class AtomicFile:
+    """
+    Write a file atomically, leaving it untouched when nothing changed.
+
+    Content goes to a temporary file next to `path`, which then replaces
+    `path` with os.replace(), so a reader (browser, static host, git) only
+    ever sees the old or the new complete file. If the new content has the
+    same SHA-256 as the existing file, the temporary file is discarded and
+    `path` keeps its content and mtime. After the block, `changed` tells
+    which happened:
+
+        output = AtomicFile(path)
+        with output as f:
+            f.write(text)
+        if output.changed:
+            ...
+    """
+
+    def __init__(self, path, mode='w', encoding='utf-8', newline=None):
+        self.path = path
+        self.mode = mode
+        self.encoding = None if 'b' in mode else encoding
+        self.newline = newline
+        self.changed = None
+        self.file = None
+        self.tmp_path = None
+
+    def __enter__(self):
+        self.tmp_path = f"{self.path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        self.file = open(self.tmp_path, self.mode, encoding=self.encoding, newline=self.newline)
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        self.file.close()
+        if exc_type is not None:
+            os.remove(self.tmp_path)
+            return False
+
+        if same_file_content(self.tmp_path, self.path):
+            os.remove(self.tmp_path)
+            self.changed = False
+        else:
+            os.replace(self.tmp_path, self.path)
+            self.changed = True
+        return False
+
+
+def same_file_content(path, other_path):
+    """True if both files exist and have identical content (size, then SHA-256)."""
+    try:
+        if os.path.getsize(path) != os.path.getsize(other_path):
+            return False
+    except OSError:
+        return False
+    return file_sha256(path) == file_sha256(other_path)
+
+
+# ============================================================================
+# FAN-OUT EXPORT
+# ============================================================================
+#
+# Exported records go through one schema per record type (EXPORT_SCHEMAS),
+# which lists the exported fields and how they are converted: fixed-point
+# amounts to floats, empty salesperson to null. A FanOutWriter converts
+# each record once and routes the row to all of its sinks in the same
+# pass - the all_orders CSV, dashboard data files, month shards, binary
+# columns - optionally split into branches (regular / sponsoring
+# invoices) and narrowed to a named view of the schema's fields.
+
+_REQUIRED = object()
+
+
+def _money(value):
+    return fixed_to_float(value, MONEY_DIGITS)
+
+
+def _quantity(value):
+    return fixed_to_float(value, QUANTITY_DIGITS)
+
+
+def _unit_price(value):
+    return fixed_to_float(value, UNIT_PRICE_DIGITS)
+
+
+def _or_none(value):
+    return value if value else None
+
+
+class Schema:
+    """
+    Exported fields of one record type, in export order.
+
+    converters maps field names to functions applied to their values and
+    defaults gives values for fields a record may not have; other fields
+    are required. views names subsets of the fields (in their own order)
+    for sinks that export less than the whole row.
+    """
+
+    def __init__(self, fields, converters=None, defaults=None, views=None):
+        self.fields = tuple(fields)
+        self.views = {name: tuple(view) for name, view in (views or {}).items()}
+        converters = converters or {}
+        self.converters = tuple((i, converters[name]) for i, name in enumerate(self.fields) if name in converters)
+        if defaults:
+            self.defaults = tuple(defaults.get(name, _REQUIRED) for name in self.fields)
+            self.values = self._values_with_defaults
+        else:
+            self.values = attrgetter(*self.fields)
+
+    def _values_with_defaults(self, record):
+        return [getattr(record, name) if default is _REQUIRED else getattr(record, name, default)
+                for name, default in zip(self.fields, self.defaults)]
+
+    def to_row(self, record):
+        """Convert a record into its exported row dict."""
+        values = list(self.values(record))
+        for i, convert in self.converters:
+            values[i] = convert(values[i])
+        return dict(zip(self.fields, values))
+
+
+_AMOUNT_CONVERTERS = {
+    'total_czk': _money, 'total_czk_bez_dph': _money,
+    'total_eur': _money, 'total_eur_bez_dph': _money,
+}
+
+_ITEM_CONVERTERS = {
+    'salesperson': _or_none,
+    'quantity': _quantity,
+    'delivered': _quantity,
+    'unit_price': _unit_price,
+    'discount_percent': _quantity,
+    **_AMOUNT_CONVERTERS,
+}
+
+EXPORT_SCHEMAS = {
+    # all_orders.csv has every order field, data.js the dashboard view
+    'order': Schema(
+        Order.FIELDS,
+        {'salesperson': _or_none, **_AMOUNT_CONVERTERS},
+        views={'dashboard': (
+            'order_number', 'internal_number', 'date', 'customer_id', 'city', 'currency', 'centre',
+            'channel', 'salesperson', 'country', 'supplier',
+            'payment_type', 'price_level', 'is_executed', 'is_delivered',
+            'total_czk', 'total_czk_bez_dph', 'total_eur', 'total_eur_bez_dph',
+        )},
+    ),
+    'order_item': Schema(OrderItem.FIELDS, _ITEM_CONVERTERS),
+    'invoice': Schema(
+        (
+            'invoice_number', 'order_number', 'date', 'date_due', 'customer_id', 'city', 'currency', 'centre',
+            'channel', 'salesperson', 'country', 'supplier',
+            'payment_type', 'price_level', 'is_paid', 'liquidation_date',
+            'total_czk', 'total_czk_bez_dph', 'total_eur', 'total_eur_bez_dph',
+        ),
+        {'salesperson': _or_none, **_AMOUNT_CONVERTERS},
+    ),
+    'invoice_item': Schema(InvoiceItem.FIELDS, _ITEM_CONVERTERS),
+    # Prediction fields are missing when there were no orders to predict from
+    'stock': Schema(
+        (
+            'code', 'name', 'full_name', 'ean', 'unit', 'brand',
+            'count', 'selling_price', 'purchase_price',
+            'total_sold_90d', 'avg_daily_sales', 'days_remaining',
+            'avg_daily_7d', 'avg_daily_30d', 'avg_daily_90d', 'avg_daily_365d', 'trend_30d',
+            'forecast_30d', 'forecast_30d_low', 'forecast_30d_high',
+            'stockout_date', 'stockout_date_early', 'stockout_date_late',
+        ),
+        {
+            'count': _quantity, 'selling_price': _unit_price, 'purchase_price': _unit_price,
+            'total_sold_90d': _quantity, 'avg_daily_sales': float,
+        },
+        defaults={
+            'total_sold_90d': 0, 'avg_daily_sales': 0, 'days_remaining': -1,
+            'avg_daily_7d': 0.0, 'avg_daily_30d': 0.0, 'avg_daily_90d': 0.0, 'avg_daily_365d': 0.0,
+            'trend_30d': None,
+            'forecast_30d': 0.0, 'forecast_30d_low': 0.0, 'forecast_30d_high': 0.0,
+            'stockout_date': None, 'stockout_date_early': None, 'stockout_date_late': None,
+        },
+    ),
+}
+
+
+class Sink:
+    """
+    Base class of export sinks.
+
+    A sink is a context manager taking converted rows: open() runs on
+    entry, write(row, record) once per routed record and close() on a
+    clean exit; `count` is the number of rows written. Output files are
+    opened with open_file(), so they are written atomically and left
+    untouched when the export fails part way.
+    """
+
+    def __enter__(self):
+        self.count = 0
+        with ExitStack() as files:
+            self.files = files
+            self.open()
+            self.files = files.pop_all()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is not None:
+            return self.files.__exit__(exc_type, exc, tb)
+        with self.files:
+            self.close()
+        return False
+
+    def open_file(self, path, mode='w', newline=None):
+        """Open an AtomicFile that is committed when the sink closes."""
+        return self.files.enter_context(AtomicFile(path, mode, newline=newline))
+
+    def open(self):
+        pass
+
+    def write(self, row, record=None):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+
+class CsvSink(Sink):
+    """Sink writing rows to a CSV file with a header line."""
+
+    def __init__(self, path, fieldnames):
+        self.path = path
+        self.fieldnames = fieldnames
+
+    def open(self):
+        self.writer = csv.DictWriter(self.open_file(self.path, newline=''), fieldnames=self.fieldnames)
+        self.writer.writeheader()
+
+    def write(self, row, record=None):
+        self.writer.writerow(row)
+        self.count += 1
+
+
+class RecordSink(Sink):
+    """Sink collecting the routed records themselves (e.g. for the cubes)."""
+
+    def open(self):
+        self.records = []
+
+    def write(self, row, record=None):
+        self.records.append(record)
+        self.count += 1
+
+
+class FanOutWriter:
+    """
+    Export records to several sinks in one pass.
+
+    Each record is converted once with the schema; route() adds a sink,
+    optionally receiving only records for which split(record) returns
+    `branch` and only the fields of one of the schema's views:
+
+        out = FanOutWriter(EXPORT_SCHEMAS['invoice'], split=invoice_branch)
+        regular = out.route(JsDataSink(...), branch='regular')
+        sponsoring = out.route(JsDataSink(...), branch='sponsoring')
+        out.write(invoices)
+    """
+
+    def __init__(self, schema, split=None):
+        self.schema = schema
+        self.split = split
+        self.routes = []
+
+    def route(self, sink, branch=None, view=None):
+        """Add a sink; returns it."""
+        self.routes.append((branch, view, sink))
+        return sink
+
+    def _routes_of(self, branch):
+        return [(view, sink) for route_branch, view, sink in self.routes
+                if route_branch is None or route_branch == branch]
+
+    def write(self, records):
+        """Convert and route all records, then close the sinks."""
+        to_row = self.schema.to_row
+        split = self.split
+        views = self.schema.views
+        routes_by_branch = {}
+
+        with ExitStack() as sinks:
+            for _, _, sink in self.routes:
+                sinks.enter_context(sink)
+
+            for record in records:
+                branch = split(record) if split else None
+                routes = routes_by_branch.get(branch)
+                if routes is None:
+                    routes = routes_by_branch[branch] = self._routes_of(branch)
+
+                row = to_row(record)
+                view_rows = {}
+                for view, sink in routes:
+                    if view is None:
+                        sink.write(row, record)
+                        continue
+                    view_row = view_rows.get(view)
+                    if view_row is None:
+                        view_row = view_rows[view] = {name: row[name] for name in views[view]}
+                    sink.write(view_row, record)
+
+
+# ============================================================================
+# JS DATA FILES
+# ============================================================================
+#
+# Dashboard data files define one global array of row objects each, e.g.
+# `const ordersData = [...]`. They come in three formats:
+# - rows:     pretty-printed JSON array of objects (the original format)
+# - columnar: minified {length, columns} table with one array per field;
+#             string fields with many repeated values are stored as a
+#             dictionary of distinct values plus an array of codes.
+#             decodeColumns() from loader.js turns it back into the same
+#             array of row objects when the page loads.
+# - lines:    JSON array with one compact row object per line, so a changed
+#             record is a one-line diff (see --sort-rows)
+#
+# Rows are pushed to the file as they are converted, so an export never
+# holds the converted dicts or the whole JSON text in memory. The rows
+# format is written one row at a time, with the same bytes
+# json.dumps(rows, indent=2) would produce.
+
+JS_FORMATS = ('rows', 'columnar', 'lines')
+
+
+_row_encoder = json.JSONEncoder(ensure_ascii=False, indent=2)
+_compact_encoder = json.JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+
+
+def collect_columns(rows):
+    """Gather an iterable of dicts (all with the same keys) into ({name: values}, row count)."""
+    columns = {}
+    length = 0
+    for row in rows:
+        if not length:
+            columns = {name: [] for name in row}
+        for name, value in row.items():
+            columns[name].append(value)
+        length += 1
+    return columns, length
+
+
+def encode_columns(rows):
+    """Columnar form of an iterable of dicts (all with the same keys)."""
+    columns, length = collect_columns(rows)
+
+    encoded = {}
+    for name, values in columns.items():
+        if all(value is None or isinstance(value, str) for value in values):
+            index = {}
+            codes = [index.setdefault(value, len(index)) for value in values]
+            # Only worth it when values repeat
+            if len(index) * 2 <= len(values):
+                encoded[name] = {'values': list(index), 'codes': codes}
+                continue
+        encoded[name] = values
+    return {'length': length, 'columns': encoded}
+
+
+def _write_columns_json(f, table):
+    """Write a columnar table as compact JSON, one column at a time."""
+    f.write(f'{{"length":{table["length"]},"columns":{{')
+    for i, (name, column) in enumerate(table['columns'].items()):
+        f.write(f'{"," if i else ""}{_compact_encoder.encode(name)}:')
+        f.write(_compact_encoder.encode(column))
+    f.write('}}')
+    return table['length']
+
+
+class JsRowsStream:
+    """
+    Write rows pushed one at a time as a JS expression evaluating to the
+    array of row objects; finish() ends it and returns the row count.
+
+    The columnar format needs whole columns, so its rows are kept until
+    finish().
+    """
+
+    def __init__(self, f, js_format='rows'):
+        self.file = f
+        self.js_format = js_format
+        self.rows = []
+        self.count = 0
+
+    def write(self, row):
+        if self.js_format == 'columnar':
+            self.rows.append(row)
+        elif self.js_format == 'lines':
+            self.file.write(',\n' if self.count else '[\n')
+            self.file.write(_compact_encoder.encode(row))
+        else:
+            self.file.write(',\n  ' if self.count else '[\n  ')
+            # JSON strings never contain raw newlines, so this only indents lines
+            self.file.write(_row_encoder.encode(row).replace('\n', '\n  '))
+        self.count += 1
+
+    def finish(self):
+        if self.js_format == 'columnar':
+            self.file.write('decodeColumns(')
+            _write_columns_json(self.file, encode_columns(self.rows))
+            self.file.write(')')
+            self.rows = []
+        else:
+            self.file.write('\n]' if self.count else '[]')
+        return self.count
+
+
+def _write_js_rows(f, rows, js_format):
+    """Write rows as a JS expression evaluating to the array of row objects."""
+    stream = JsRowsStream(f, js_format)
+    for row in rows:
+        stream.write(row)
+    return stream.finish()
+
+
+class JsDataSink(Sink):
+    """Sink writing the dashboard data file defining `const <name>`."""
+
+    def __init__(self, path, name, title, js_format='rows'):
+        self.path = path
+        self.name = name
+        self.title = title
+        self.js_format = js_format
+
+    def open(self):
+        f = self.open_file(self.path)
+        f.write(f'// VITAR Sport Analytics - {self.title}\n')
+        f.write('// Generated from Pohoda XML exports\n\n')
+        f.write(f'const {self.name} = ')
+        self.stream = JsRowsStream(f, self.js_format)
+
+    def write(self, row, record=None):
+        self.stream.write(row)
+
+    def close(self):
+        self.count = self.stream.finish()
+        self.stream.file.write(';\n')
+
+
+def write_js_data(path, name, rows, title, js_format='rows'):
+    """
+    Write rows as the dashboard data file defining `const <name>`.
+
+    Returns the number of rows written.
+    """
+    with JsDataSink(path, name, title, js_format) as sink:
+        for row in rows:
+            sink.write(row)
+    return sink.count
+
+
+# ============================================================================
+# BINARY COLUMNS
+# ============================================================================
+#
+# With --binary the item datasets are also written as typed-array column
+# blobs the dashboard can fetch as one ArrayBuffer and view in place:
+# - <name>.bin:  little-endian columns, each starting at a multiple of 8
+#                bytes: numbers as Float64, booleans as Int32 (0/1) and
+#                strings as Int32 codes into a dictionary
+# - <name>.json: header with the row count and, per column, its name,
+#                type ('float64', 'bool' or 'string'), byte offset and the
+#                dictionary of string values
+# loadBinaryColumns() in loader.js reads them.
+
+def _binary_column(values):
+    """Return (type, array, dictionary) for one column of values."""
+    if all(isinstance(value, bool) for value in values):
+        return 'bool', array('i', values), None
+    if all(isinstance(value, (int, float)) and not isinstance(value, bool) for value in values):
+        return 'float64', array('d', values), None
+    index = {}
+    codes = array('i', [index.setdefault(value, len(index)) for value in values])
+    return 'string', codes, list(index)
+
+
+class BinaryColumnsSink(Sink):
+    """
+    Sink writing rows as <path_stem>.bin plus its <path_stem>.json header.
+
+    report() prints the written row count after the block.
+    """
+
+    def __init__(self, path_stem):
+        self.path_stem = path_stem
+
+    def open(self):
+        self.columns = {}
+
+    def write(self, row, record=None):
+        if not self.count:
+            self.columns = {name: [] for name in row}
+        for name, value in row.items():
+            self.columns[name].append(value)
+        self.count += 1
+
+    def close(self):
+        header_columns = []
+        offset = 0
+        f = self.open_file(f'{self.path_stem}.bin', 'wb')
+        for name, values in self.columns.items():
+            column_type, data, dictionary = _binary_column(values)
+            if sys.byteorder != 'little':
+                data.byteswap()
+            entry = {'name': name, 'type': column_type, 'offset': offset}
+            if dictionary is not None:
+                entry['values'] = dictionary
+            header_columns.append(entry)
+
+            raw = data.tobytes()
+            padding = -len(raw) % 8
+            f.write(raw + b'\0' * padding)
+            offset += len(raw) + padding
+        self.columns = {}
+
+        f = self.open_file(f'{self.path_stem}.json')
+        json.dump({'length': self.count, 'byteLength': offset, 'columns': header_columns}, f,
+                  ensure_ascii=False, separators=(',', ':'))
+
+    def report(self):
+        print(f"Exported {self.count} rows as binary columns to: {self.path_stem}.bin")
+
+
+# ============================================================================
+# MONTH SHARDS
+# ============================================================================
+#
+# With --shards each dated dataset is also written as one file per month,
+# shards/<dataset>/<YYYY-MM>.js, next to shards/<dataset>/manifest.js which
+# lists the months with their row counts and SHA-256 hashes. Shard files
+# call registerShard() and manifests registerManifest() from loader.js;
+# its loadMonths() then loads just the months a view needs, using the
+# hash to bust the browser cache when a shard changes.
+#
+# A month's shard can only be written once all its rows are in. With
+# --sort-rows the rows come sorted by date, so each shard is written as
+# soon as the next month starts and memory stays bounded by one month.
+# Otherwise the rows of the whole dataset are held until the export ends.
+
+SHARDS_DIR = 'shards'
+
+
+class ShardSink(Sink):
+    """
+    Sink writing rows as month shards of dataset `name` plus its manifest.
+
+    Rows are grouped by the month of their date. With sorted_rows (rows
+    sorted by date) a month's shard is written as soon as a row of the
+    next month arrives; otherwise every row is held in memory and the
+    shards are written on close. Either way only one shard file is open at
+    a time, and all of them are committed together when the sink closes.
+    Shards of months that no longer have any rows are removed. After the
+    block `manifest` holds the written manifest and report() prints where
+    the shards went.
+    """
+
+    def __init__(self, output_dir, name, title, js_format='rows', sorted_rows=False):
+        self.dataset_dir = os.path.join(output_dir, SHARDS_DIR, name)
+        self.name = name
+        self.title = title
+        self.js_format = js_format
+        self.sorted_rows = sorted_rows
+
+    def open(self):
+        os.makedirs(self.dataset_dir, exist_ok=True)
+        self.months = defaultdict(list)  # month -> rows of its shard, until it is written
+        self.shards = {}
+        self.manifest = None
+
+    def write(self, row, record=None):
+        month = order_month(row['date'])
+        if self.sorted_rows and month not in self.months:
+            if month in self.shards:
+                raise ValueError(f"{self.name} rows are not sorted by date: {month} came back")
+            # Sorted by date, so the months held so far are complete
+            self._write_shards()
+        self.months[month].append(row)
+        self.count += 1
+
+    def _write_shards(self):
+        for month in sorted(self.months):
+            filename = f'{month}.js'
+            f = self.open_file(os.path.join(self.dataset_dir, filename))
+            f.write(f'// VITAR Sport Analytics - {self.title} {month}\n')
+            f.write('// Generated from Pohoda XML exports\n\n')
+            f.write(f'registerShard({json.dumps(self.name)}, {json.dumps(month)}, ')
+            rows = _write_js_rows(f, self.months.pop(month), self.js_format)
+            f.write(');\n')
+            # Closed now, renamed into place with the other files when the sink closes
+            f.close()
+            self.shards[month] = {'month': month, 'file': filename, 'rows': rows, 'sha256': file_sha256(f.name)}
+
+    def close(self):
+        self._write_shards()
+        shards = [self.shards[month] for month in sorted(self.shards)]
+
+        # Drop shards (and their compressed siblings) of months that are gone from the export
+        live_files = {shard['file'] for shard in shards} | {'manifest.js'}
+        for filename in os.listdir(self.dataset_dir):
+            root, ext = os.path.splitext(filename)
+            source = root if ext in COMPRESSED_SUFFIXES else filename
+            if source.endswith('.js') and source not in live_files:
+                os.remove(os.path.join(self.dataset_dir, filename))
+
+        self.manifest = {
+            'dataset': self.name,
+            'format': self.js_format,
+            'rows': self.count,
+            'shards': shards,
+        }
+        f = self.open_file(os.path.join(self.dataset_dir, 'manifest.js'))
+        f.write(f'// VITAR Sport Analytics - {self.title} Shards\n')
+        f.write('// Generated from Pohoda XML exports\n\n')
+        f.write(f'registerManifest({json.dumps(self.name)}, ')
+        f.write(json.dumps(self.manifest, ensure_ascii=False, indent=2))
+        f.write(');\n')
+
+    def report(self):
+        print(f"Exported {len(self.manifest['shards'])} monthly shards of {self.name} to: {self.dataset_dir}")
+
+
+# ============================================================================
+# DELTA EXPORTS
+# ============================================================================
+#
+# With --deltas each dataset is also kept under deltas/<dataset>/ as an
+# immutable base snapshot plus a chain of immutable delta files, named
+# after their content hash so browsers and CDNs can cache them for good;
+# a daily update then only costs the new delta. Rows are grouped by their
+# document number (order_number / invoice_number, for items too). Each
+# run compares the groups with the previous run and, if anything changed,
+# appends a delta with the groups that were added or changed plus the
+# numbers of the documents that are gone. manifest.js lists the base and
+# the deltas in order for loadDeltas() in loader.js; state.json keeps the
+# hash of every group for the next run.
+#
+# The chain is compacted into a new base when the base is from an earlier
+# calendar month, the --js-format changed, or the deltas would grow past
+# half the rows of the base.
+
+DELTAS_DIR = 'deltas'
+DELTA_STATE_FILE = 'state.json'
+
+
+class DeltaSink(Sink):
+    """
+    Sink writing rows as the base or next delta of dataset `name`.
+
+    key names the row field rows are grouped by. Files no longer listed in
+    the manifest are removed. report() prints what was written.
+    """
+
+    def __init__(self, output_dir, name, key, title, js_format='rows'):
+        self.dataset_dir = os.path.join(output_dir, DELTAS_DIR, name)
+        self.name = name
+        self.key = key
+        self.title = title
+        self.js_format = js_format
+
+    def open(self):
+        # key -> compact JSON of its rows, decoded again only for the rows written out
+        self.groups = {}
+        self.written = None
+
+    def write(self, row, record=None):
+        self.groups.setdefault(row[self.key] or '', []).append(_compact_encoder.encode(row))
+        self.count += 1
+
+    def _load_state(self):
+        try:
+            with open(os.path.join(self.dataset_dir, DELTA_STATE_FILE), encoding='utf-8') as f:
+                state = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if not os.path.exists(os.path.join(self.dataset_dir, state['base']['file'])):
+            return None
+        return state
+
+    def _write_file(self, prefix, call, groups, deleted=None):
+        """
+        Write the rows of groups as <prefix>-<hash>.js, wrapped in a call
+        starting with `call` (plus the deleted keys, if given).
+
+        Returns the manifest entry of the file.
+        """
+        path = os.path.join(self.dataset_dir, f'{prefix}.new.js')
+        with AtomicFile(path) as f:
+            f.write(f'// VITAR Sport Analytics - {self.title} ({prefix})\n')
+            f.write('// Generated from Pohoda XML exports\n\n')
+            f.write(call)
+            rows = (json.loads(text) for texts in groups for text in texts)
+            count = _write_js_rows(f, rows, self.js_format)
+            if deleted is not None:
+                f.write(f', {json.dumps(deleted, ensure_ascii=False)}')
+            f.write(');\n')
+
+        sha256 = file_sha256(path)
+        filename = f'{prefix}-{sha256[:12]}.js'
+        os.replace(path, os.path.join(self.dataset_dir, filename))
+        return {'file': filename, 'rows': count, 'sha256': sha256}
+
+    def close(self):
+        os.makedirs(self.dataset_dir, exist_ok=True)
+        month = datetime.date.today().strftime('%Y-%m')
+        name = json.dumps(self.name)
+        hashes = {key: hashlib.sha256('\n'.join(texts).encode('utf-8')).hexdigest()[:16]
+                  for key, texts in self.groups.items()}
+
+        state = self._load_state()
+        if state is not None and (state['format'] != self.js_format or state['month'] != month):
+            state = None
+        if state is not None:
+            changed = [key for key, digest in hashes.items() if state['hashes'].get(key) != digest]
+            deleted = [key for key in state['hashes'] if key not in hashes]
+            delta_rows = sum(delta['rows'] for delta in state['deltas'])
+            delta_rows += sum(len(self.groups[key]) for key in changed)
+            if delta_rows * 2 > state['base']['rows']:
+                state = None
+            elif changed or deleted:
+                seq = len(state['deltas']) + 1
+                delta = {'seq': seq}
+                delta.update(self._write_file(f'delta-{seq:04d}', f'registerDelta({name}, {seq}, ',
+                                              [self.groups[key] for key in changed], deleted))
+                delta['deleted'] = len(deleted)
+                state['deltas'].append(delta)
+                self.written = delta
+            else:
+                self.written = {}
+
+        if state is None:
+            base = self._write_file('base', f'registerDeltaBase({name}, ', self.groups.values())
+            state = {'format': self.js_format, 'month': month, 'base': base, 'deltas': []}
+            self.written = base
+        state['hashes'] = hashes
+        self.groups = {}
+
+        manifest = {
+            'dataset': self.name,
+            'key': self.key,
+            'format': self.js_format,
+            'rows': self.count,
+            'base': state['base'],
+            'deltas': state['deltas'],
+        }
+        with AtomicFile(os.path.join(self.dataset_dir, 'manifest.js')) as f:
+            f.write(f'// VITAR Sport Analytics - {self.title} Deltas\n')
+            f.write('// Generated from Pohoda XML exports\n\n')
+            f.write(f'registerDeltaManifest({name}, ')
+            f.write(json.dumps(manifest, ensure_ascii=False, indent=2))
+            f.write(');\n')
+        with AtomicFile(os.path.join(self.dataset_dir, DELTA_STATE_FILE)) as f:
+            json.dump(state, f, ensure_ascii=False, separators=(',', ':'))
+
+        # Drop the previous base and deltas (and their compressed siblings) after a compaction
+        live_files = {entry['file'] for entry in [state['base']] + state['deltas']}
+        live_files |= {'manifest.js', DELTA_STATE_FILE}
+        for filename in os.listdir(self.dataset_dir):
+            root, ext = os.path.splitext(filename)
+            source = root if ext in COMPRESSED_SUFFIXES else filename
+            if source not in live_files:
+                os.remove(os.path.join(self.dataset_dir, filename))
+
+    def report(self):
+        if not self.written:
+            print(f"No changes in {self.name} since the last delta export: {self.dataset_dir}")
+        elif 'seq' in self.written:
+            print(f"Exported delta {self.written['seq']} of {self.name} ({self.written['rows']} rows changed, "
+                  f"{self.written['deleted']} documents removed) to: {self.dataset_dir}")
+        else:
+            print(f"Exported new delta base of {self.name} ({self.count} rows) to: {self.dataset_dir}")
+
+
+# ============================================================================
+# PRECOMPRESSED FILES
+# ============================================================================
+#
+# With --compress every exported data file gets .gz (and, when the brotli
+# package is installed, .br) siblings at maximum compression, so a static
+# host can serve them without compressing per request. AtomicFile keeps
+# the mtime of unchanged files, so a sibling newer than its source is up
+# to date and is not compressed again.
+
+COMPRESSED_SUFFIXES = ('.gz', '.br')
+
+# Exported data files, relative to the output directory
+DATA_FILE_PATTERNS = (
+    'data.js', 'items.js', 'invoices_data.js', 'invoices_items.js',
+    'sponsoring_data.js', 'sponsoring_items.js', 'stock_data.js', 'cube_*.js', 'fulfillment.js', 'customers.js',
+    '*items.bin', '*items.json',
+    os.path.join(SHARDS_DIR, '*', '*.js'),
+    os.path.join(DELTAS_DIR, '*', '*.js'),
+)
+
+
+def compress_file(path):
+    """
+    Write the compressed siblings of `path` that are missing or stale.
+
+    Returns the list of files written.
+    """
+    compressors = [('.gz', lambda data: gzip.compress(data, compresslevel=9, mtime=0))]
+    if brotli is not None:
+        compressors.append(('.br', lambda data: brotli.compress(data, quality=11)))
+
+    source_mtime = os.path.getmtime(path)
+    data = None
+    written = []
+    for suffix, compress in compressors:
+        target = path + suffix
+        if os.path.exists(target) and os.path.getmtime(target) >= source_mtime:
+            continue
+        if data is None:
+            with open(path, 'rb') as f:
+                data = f.read()
+        with AtomicFile(target, 'wb') as f:
+            f.write(compress(data))
+        written.append(target)
+    return written
 
-    return items
 
+def compress_outputs(output_dir, workers=1):
+    """Precompress all exported data files in output_dir, in parallel."""
+    paths = sorted(path for pattern in DATA_FILE_PATTERNS
+                   for path in glob.glob(os.path.join(output_dir, pattern)))
+    # zlib and brotli release the GIL while compressing, so threads suffice
+    with ThreadPoolExecutor(max_workers=max(1, min(workers, len(paths)))) as pool:
+        written = [target for targets in pool.map(compress_file, paths) for target in targets]
 
-def parse_order(order_element):
-    """Parse a single order element and return order data."""
-    header = order_element.find('.//ord:orderHeader', NS)
-    summary = order_element.find('.//ord:orderSummary', NS)
+    formats = 'gzip + brotli' if brotli is not None else 'gzip'
+    print(f"Compressed {len(paths)} data files ({formats}): {len(written)} written, "
+          f"{len(paths) * (2 if brotli is not None else 1) - len(written)} up to date")
 
-    if header is None:
-        return None, []
 
-    # Get order number
-    order_number = get_text(header, './/ord:numberOrder')
-    internal_number = get_text(header, './/ord:number//typ:numberRequested')
+# ============================================================================
+# AGGREGATE CUBE
+# ============================================================================
+#
+# The summary views of the dashboard only need totals per month, channel,
+# salesperson, supplier, country and brand. Each view (orders, invoices,
+# sponsoring) gets a cube file with two fact tables, both in the selected
+# --js-format:
+# - documents: document header totals and document counts per
+#              month x channel x salesperson x supplier x country
+# - items:     item totals, quantities, line counts and the number of
+#              documents with such items, per the same cells x brand
+# Amounts are given with and without VAT, in CZK and EUR.
 
-    # Get dates
-    order_date = get_text(header, './/ord:date')
-    date_from = get_text(header, './/ord:dateFrom')
-    date_to = get_text(header, './/ord:dateTo')
+CUBE_DIMENSIONS = ('month', 'channel', 'salesperson', 'supplier', 'country')
+CUBE_MEASURES = ('total_czk', 'total_czk_bez_dph', 'total_eur', 'total_eur_bez_dph')
 
-    # Get currency (check foreignCurrency for EUR)
-    currency = 'CZK'
-    foreign_currency_ids = None
-    if summary is not None:
-        foreign_curr = summary.find('.//ord:foreignCurrency//typ:currency//typ:ids', NS)
-        if foreign_curr is not None and foreign_curr.text:
-            foreign_currency_ids = foreign_curr.text.strip()
-            if foreign_currency_ids == 'EUR':
-                currency = 'EUR'
-
-    # Get centre (Kdo řeší)
-    centre = get_text(header, './/ord:centre//typ:ids')
-
-    # Get customer info from partnerIdentity
-    partner = header.find('.//ord:partnerIdentity', NS)
-    company = ''
-    customer_name = ''
-    city = ''
-    street = ''
-    zip_code = ''
-    customer_country = ''
-    ico = ''
-    dic = ''
-    email = ''
-    phone = ''
-
-    if partner is not None:
-        address = partner.find('.//typ:address', NS)
-        if address is not None:
-            company = get_text(address, './/typ:company')
-            customer_name = get_text(address, './/typ:name')
-            city = get_text(address, './/typ:city')
-            street = get_text(address, './/typ:street')
-            zip_code = get_text(address, './/typ:zip')
-            customer_country = get_text(address, './/typ:country//typ:ids')
-            ico = get_text(address, './/typ:ico')
-            dic = get_text(address, './/typ:dic')
-            email = get_text(address, './/typ:email')
-            phone = get_text(address, './/typ:mobilPhone') or get_text(address, './/typ:phone')
-
-    # Get payment type
-    payment_type = get_text(header, './/ord:paymentType//typ:ids')
-
-    # Get price level
-    price_level = get_text(header, './/ord:priceLevel//typ:ids')
-
-    # Get status flags
-    is_executed = get_text(header, './/ord:isExecuted') == 'true'
-    is_delivered = get_text(header, './/ord:isDelivered') == 'true'
-
-    # Get notes
-    note = get_text(header, './/ord:note')
-    int_note = get_text(header, './/ord:intNote')
 
-    # Get totals from summary - use foreignCurrency for EUR orders, homeCurrency for CZK
-    total_czk = Decimal('0')
-    total_czk_bez_dph = Decimal('0')
-    total_eur = Decimal('0')
-    total_eur_bez_dph = Decimal('0')
-
-    if summary is not None:
-        if currency == 'EUR':
-            # For EUR orders, get the EUR amount from foreignCurrency
-            foreign_curr_sum = summary.find('.//ord:foreignCurrency', NS)
-            if foreign_curr_sum is not None:
-                eur_sum = get_text(foreign_curr_sum, './/typ:priceSum', '0')
-                total_eur = Decimal(eur_sum)
-                # For EUR/SK orders, VAT is typically 0 or handled differently
-                # Use priceSum as bez DPH value (SK market is essentially without VAT)
-                total_eur_bez_dph = total_eur
-            # Also get CZK equivalent from homeCurrency
-            home_curr = summary.find('.//ord:homeCurrency', NS)
-            if home_curr is not None:
-                price_none = Decimal(get_text(home_curr, './/typ:priceNone', '0'))
-                price_low = Decimal(get_text(home_curr, './/typ:priceLowSum', '0'))
-                price_high = Decimal(get_text(home_curr, './/typ:priceHighSum', '0'))
-                total_czk = price_none + price_low + price_high
-        else:
-            # For CZK orders
-            home_curr = summary.find('.//ord:homeCurrency', NS)
-            if home_curr is not None:
-                # With VAT (priceSum = priceLowSum + priceHighSum)
-                price_low_sum = Decimal(get_text(home_curr, './/typ:priceLowSum', '0'))
-                price_high_sum = Decimal(get_text(home_curr, './/typ:priceHighSum', '0'))
-                total_czk = price_low_sum + price_high_sum
-                # Without VAT (price = priceLow + priceHigh)
-                price_low = Decimal(get_text(home_curr, './/typ:priceLow', '0'))
-                price_high = Decimal(get_text(home_curr, './/typ:priceHigh', '0'))
-                total_czk_bez_dph = price_low + price_high
+def _cube_sort_key(cell):
+    return tuple('' if value is None else value for value in cell)
 
-    # Classify order
-    channel, salesperson, country, supplier = classify_order(order_number, currency, centre)
 
-    order_data = {
-        'order_number': order_number,
-        'internal_number': internal_number,
-        'date': order_date,
-        'date_from': date_from,
-        'date_to': date_to,
-        'company': company,
-        'customer_name': customer_name,
-        'city': city,
-        'street': street,
-        'zip': zip_code,
-        'customer_country': customer_country,
-        'ico': ico,
-        'dic': dic,
-        'email': email,
-        'phone': phone,
-        'currency': currency,
-        'centre': centre,
-        'channel': channel,
-        'salesperson': salesperson,
-        'country': country,
-        'supplier': supplier,
-        'payment_type': payment_type,
-        'price_level': price_level,
-        'is_executed': is_executed,
-        'is_delivered': is_delivered,
-        'note': note,
-        'int_note': int_note,
-        'total_czk': total_czk,
-        'total_czk_bez_dph': total_czk_bez_dph,
-        'total_eur': total_eur,
-        'total_eur_bez_dph': total_eur_bez_dph,
-    }
+def build_cube(documents, items, number_field):
+    """
+    Aggregate documents and their items into cube rows.
 
-    # Parse order items
-    items = parse_order_items(order_element, order_data)
+    number_field names the document number on items ('order_number' or
+    'invoice_number'), used to count distinct documents per item cell.
+    Returns (document rows, item rows) as lists of dicts.
+    """
+    document_store = build_order_store(documents)
+    document_cells = document_store.group_by(CUBE_DIMENSIONS, CUBE_MEASURES)
+
+    item_store = ColumnStore.from_records(
+        items,
+        ITEM_DIMENSIONS + (number_field, ('brand', 'product_name', classify_brand)),
+        ITEM_MEASURES,
+    )
+    item_dimensions = CUBE_DIMENSIONS + ('brand',)
+    item_cells = item_store.group_by(item_dimensions, ITEM_MEASURES)
+    document_counts = defaultdict(int)
+    for cell in item_store.group_by(item_dimensions + (number_field,)):
+        document_counts[cell[:-1]] += 1
+
+    def amounts(totals):
+        return {name: fixed_to_float(total, MONEY_DIGITS) for name, total in zip(CUBE_MEASURES, totals)}
+
+    document_rows = []
+    for cell in sorted(document_cells, key=_cube_sort_key):
+        count, *totals = document_cells[cell]
+        row = dict(zip(CUBE_DIMENSIONS, cell))
+        row['salesperson'] = row['salesperson'] or None
+        row['count'] = count
+        row.update(amounts(totals))
+        document_rows.append(row)
+
+    item_rows = []
+    for cell in sorted(item_cells, key=_cube_sort_key):
+        lines, quantity, *totals = item_cells[cell]
+        row = dict(zip(item_dimensions, cell))
+        row['salesperson'] = row['salesperson'] or None
+        row['count'] = document_counts[cell]
+        row['lines'] = lines
+        row['quantity'] = fixed_to_float(quantity, QUANTITY_DIGITS)
+        row.update(amounts(totals))
+        item_rows.append(row)
+
+    return document_rows, item_rows
+
+
+def export_cube_to_js(view, documents, items, number_field, output_dir, js_format='rows'):
+    """Export the aggregate cube of one dashboard view to cube_<view>.js."""
+    document_rows, item_rows = build_cube(documents, items, number_field)
+
+    cube_file = os.path.join(output_dir, f'cube_{view}.js')
+    with AtomicFile(cube_file) as f:
+        f.write(f'// VITAR Sport Analytics - Aggregate Cube ({view})\n')
+        f.write('// Generated from Pohoda XML exports\n\n')
+        f.write(f'const {view}Cube = {{\n')
+        f.write(f'  "dimensions": {json.dumps(list(CUBE_DIMENSIONS))},\n')
+        f.write('  "documents": ')
+        _write_js_rows(f, document_rows, js_format)
+        f.write(',\n  "items": ')
+        _write_js_rows(f, item_rows, js_format)
+        f.write('\n};\n')
 
-    return order_data, items
+    print(f"Exported {len(document_rows)} document cells and {len(item_rows)} item cells to: {cube_file}")
 
 
 # ============================================================================
@@ -307,214 +2339,115 @@ def parse_order(order_element):
 def parse_invoice_items(invoice_element, invoice_info):
     """Parse invoice items and return list of item data."""
     items = []
-    detail = invoice_element.find('.//inv:invoiceDetail', NS)
+    detail = invoice_element.find('inv:invoiceDetail', NS)
 
     if detail is None:
         return items
 
-    for item in detail.findall('.//inv:invoiceItem', NS):
-        product_name = get_text(item, './/inv:text')
-        product_code = get_text(item, './/inv:code')
-        quantity = Decimal(get_text(item, './/inv:quantity', '0'))
-        unit = get_text(item, './/inv:unit')
-        discount = Decimal(get_text(item, './/inv:discountPercentage', '0'))
-
-        # Get EAN
-        ean = get_text(item, './/inv:stockItem//typ:stockItem//typ:EAN')
-
-        # Get price from homeCurrency
-        home_curr = item.find('.//inv:homeCurrency', NS)
-        if home_curr is not None:
-            unit_price = Decimal(get_text(home_curr, './/typ:unitPrice', '0'))
-            price_without_vat = Decimal(get_text(home_curr, './/typ:price', '0'))  # bez DPH
-            price_sum = Decimal(get_text(home_curr, './/typ:priceSum', '0'))  # s DPH
-        else:
-            unit_price = Decimal('0')
-            price_without_vat = Decimal('0')
-            price_sum = Decimal('0')
-
-        # Get EUR price if available
-        foreign_curr = item.find('.//inv:foreignCurrency', NS)
-        price_sum_eur = Decimal('0')
-        price_without_vat_eur = Decimal('0')
-        if foreign_curr is not None:
-            price_without_vat_eur = Decimal(get_text(foreign_curr, './/typ:price', '0'))  # bez DPH
-            price_sum_eur = Decimal(get_text(foreign_curr, './/typ:priceSum', '0'))  # s DPH
+    for item in detail.findall('inv:invoiceItem', NS):
+        fields = extract_invoice_item_fields(item)
 
         # Skip items with no product code (like shipping, discounts)
-        if not product_code:
+        if not fields['product_code']:
             continue
 
-        items.append({
-            'invoice_number': invoice_info['invoice_number'],
-            'order_number': invoice_info['order_number'],
-            'date': invoice_info['date'],
-            'company': invoice_info['company'],
-            'currency': invoice_info['currency'],
-            'channel': invoice_info['channel'],
-            'salesperson': invoice_info['salesperson'],
-            'country': invoice_info['country'],
-            'supplier': invoice_info['supplier'],
-            'product_code': product_code,
-            'product_name': product_name,
-            'ean': ean,
-            'quantity': quantity,
-            'unit': unit,
-            'unit_price': unit_price,
-            'discount_percent': discount,
-            'total_czk': price_sum if invoice_info['currency'] != 'EUR' else Decimal('0'),
-            'total_czk_bez_dph': price_without_vat if invoice_info['currency'] != 'EUR' else Decimal('0'),
-            'total_eur': price_sum_eur if invoice_info['currency'] == 'EUR' else Decimal('0'),
-            'total_eur_bez_dph': price_without_vat_eur if invoice_info['currency'] == 'EUR' else Decimal('0'),
-        })
+        is_eur = invoice_info.currency == 'EUR'
+        items.append(InvoiceItem(
+            invoice=invoice_info,
+            product_code=intern(fields['product_code']),
+            product_name=intern(fields['product_name']),
+            ean=intern(fields['ean']),
+            quantity=to_fixed(fields['quantity'], QUANTITY_DIGITS),
+            unit=intern(fields['unit']),
+            unit_price=to_fixed(fields['unit_price'], UNIT_PRICE_DIGITS),
+            discount_percent=to_fixed(fields['discount_percent'], QUANTITY_DIGITS),
+            total_czk=to_fixed(fields['price_sum'], MONEY_DIGITS) if not is_eur else 0,
+            total_czk_bez_dph=to_fixed(fields['price'], MONEY_DIGITS) if not is_eur else 0,
+            total_eur=to_fixed(fields['foreign_price_sum'], MONEY_DIGITS) if is_eur else 0,
+            total_eur_bez_dph=to_fixed(fields['foreign_price'], MONEY_DIGITS) if is_eur else 0,
+        ))
 
     return items
 
 
 def parse_invoice(invoice_element):
     """Parse a single invoice element and return invoice data."""
-    header = invoice_element.find('.//inv:invoiceHeader', NS)
-    summary = invoice_element.find('.//inv:invoiceSummary', NS)
-
-    if header is None:
+    if invoice_element.find('inv:invoiceHeader', NS) is None:
         return None, []
 
-    # Get invoice number
-    invoice_number = get_text(header, './/inv:number//typ:numberRequested')
-    sym_var = get_text(header, './/inv:symVar')
-
-    # Get linked order number
-    order_number = get_text(header, './/inv:numberOrder')
-
-    # Get dates
-    invoice_date = get_text(header, './/inv:date')
-    date_tax = get_text(header, './/inv:dateTax')
-    date_due = get_text(header, './/inv:dateDue')
+    fields = extract_invoice_fields(invoice_element)
 
     # Get currency (check foreignCurrency for EUR)
-    currency = 'CZK'
-    if summary is not None:
-        foreign_curr = summary.find('.//inv:foreignCurrency//typ:currency//typ:ids', NS)
-        if foreign_curr is not None and foreign_curr.text:
-            if foreign_curr.text.strip() == 'EUR':
-                currency = 'EUR'
-
-    # Get centre (Kdo řeší) - invoices might not have this, use order number prefix
-    centre = get_text(header, './/inv:centre//typ:ids')
-
-    # Get customer info from partnerIdentity
-    partner = header.find('.//inv:partnerIdentity', NS)
-    company = ''
-    customer_name = ''
-    city = ''
-    street = ''
-    zip_code = ''
-    customer_country = ''
-    ico = ''
-    dic = ''
-    email = ''
-    phone = ''
-
-    if partner is not None:
-        address = partner.find('.//typ:address', NS)
-        if address is not None:
-            company = get_text(address, './/typ:company')
-            customer_name = get_text(address, './/typ:name')
-            city = get_text(address, './/typ:city')
-            street = get_text(address, './/typ:street')
-            zip_code = get_text(address, './/typ:zip')
-            customer_country = get_text(address, './/typ:country//typ:ids')
-            ico = get_text(address, './/typ:ico')
-            dic = get_text(address, './/typ:dic')
-            email = get_text(address, './/typ:email')
-            phone = get_text(address, './/typ:mobilPhone') or get_text(address, './/typ:phone')
-
-    # Get payment type
-    payment_type = get_text(header, './/inv:paymentType//typ:ids')
-
-    # Get price level (important for identifying Sponzoring)
-    price_level = get_text(header, './/inv:priceLevel//typ:ids')
-
-    # Get accounting info
-    accounting = get_text(header, './/inv:accounting//typ:ids')
-
-    # Check if paid (liquidation date exists)
-    liquidation_date = get_text(header, './/inv:liquidation//typ:date')
-    is_paid = bool(liquidation_date)
+    currency = 'EUR' if fields['foreign_currency'] == 'EUR' else 'CZK'
 
     # Get totals from summary
-    total_czk = Decimal('0')
-    total_czk_bez_dph = Decimal('0')
-    total_eur = Decimal('0')
-    total_eur_bez_dph = Decimal('0')
-
-    if summary is not None:
-        if currency == 'EUR':
-            # For EUR invoices, get the EUR amount from foreignCurrency
-            foreign_curr_sum = summary.find('.//inv:foreignCurrency', NS)
-            if foreign_curr_sum is not None:
-                eur_sum = get_text(foreign_curr_sum, './/typ:priceSum', '0')
-                total_eur = Decimal(eur_sum)
-                # For EUR/SK invoices, VAT is typically 0 or handled differently
-                # Use priceSum as bez DPH value (SK market is essentially without VAT)
-                total_eur_bez_dph = total_eur
-            # Also get CZK equivalent from homeCurrency
-            home_curr = summary.find('.//inv:homeCurrency', NS)
-            if home_curr is not None:
-                price_none = Decimal(get_text(home_curr, './/typ:priceNone', '0'))
-                price_low = Decimal(get_text(home_curr, './/typ:priceLowSum', '0'))
-                price_high = Decimal(get_text(home_curr, './/typ:priceHighSum', '0'))
-                total_czk = price_none + price_low + price_high
-        else:
-            # For CZK invoices
-            home_curr = summary.find('.//inv:homeCurrency', NS)
-            if home_curr is not None:
-                # With VAT
-                price_none = Decimal(get_text(home_curr, './/typ:priceNone', '0'))
-                price_low_sum = Decimal(get_text(home_curr, './/typ:priceLowSum', '0'))
-                price_high_sum = Decimal(get_text(home_curr, './/typ:priceHighSum', '0'))
-                total_czk = price_none + price_low_sum + price_high_sum
-                # Without VAT
-                price_low = Decimal(get_text(home_curr, './/typ:priceLow', '0'))
-                price_high = Decimal(get_text(home_curr, './/typ:priceHigh', '0'))
-                total_czk_bez_dph = price_none + price_low + price_high
+    total_czk = 0
+    total_czk_bez_dph = 0
+    total_eur = 0
+    total_eur_bez_dph = 0
+
+    if currency == 'EUR':
+        # For EUR invoices, get the EUR amount from foreignCurrency
+        total_eur = to_fixed(fields['foreign_price_sum'], MONEY_DIGITS)
+        # For EUR/SK invoices, VAT is typically 0 or handled differently
+        # Use priceSum as bez DPH value (SK market is essentially without VAT)
+        total_eur_bez_dph = total_eur
+        # Also get CZK equivalent from homeCurrency
+        total_czk = (to_fixed(fields['price_none'], MONEY_DIGITS) + to_fixed(fields['price_low_sum'], MONEY_DIGITS)
+                     + to_fixed(fields['price_high_sum'], MONEY_DIGITS))
+    else:
+        # For CZK invoices
+        price_none = to_fixed(fields['price_none'], MONEY_DIGITS)
+        # With VAT
+        total_czk = (price_none + to_fixed(fields['price_low_sum'], MONEY_DIGITS)
+                     + to_fixed(fields['price_high_sum'], MONEY_DIGITS))
+        # Without VAT
+        total_czk_bez_dph = (price_none + to_fixed(fields['price_low'], MONEY_DIGITS)
+                             + to_fixed(fields['price_high'], MONEY_DIGITS))
 
     # Classify invoice based on order number (same logic as orders)
+    # Invoices might not have centre (Kdo řeší), then order number prefix decides
+    order_number = fields['order_number']
+    centre = intern(fields['centre'])
     channel, salesperson, country, supplier = classify_order(order_number, currency, centre)
 
-    invoice_data = {
-        'invoice_number': invoice_number,
-        'sym_var': sym_var,
-        'order_number': order_number,
-        'date': invoice_date,
-        'date_tax': date_tax,
-        'date_due': date_due,
-        'company': company,
-        'customer_name': customer_name,
-        'city': city,
-        'street': street,
-        'zip': zip_code,
-        'customer_country': customer_country,
-        'ico': ico,
-        'dic': dic,
-        'email': email,
-        'phone': phone,
-        'currency': currency,
-        'centre': centre,
-        'channel': channel,
-        'salesperson': salesperson,
-        'country': country,
-        'supplier': supplier,
-        'payment_type': payment_type,
-        'price_level': price_level,
-        'accounting': accounting,
-        'is_paid': is_paid,
-        'liquidation_date': liquidation_date,
-        'total_czk': total_czk,
-        'total_czk_bez_dph': total_czk_bez_dph,
-        'total_eur': total_eur,
-        'total_eur_bez_dph': total_eur_bez_dph,
-    }
+    # Check if paid (liquidation date exists)
+    liquidation_date = fields['liquidation_date']
+
+    invoice_data = Invoice(
+        invoice_number=fields['invoice_number'],
+        sym_var=fields['sym_var'],
+        order_number=order_number,
+        date=intern(fields['date']),
+        date_tax=fields['date_tax'],
+        date_due=fields['date_due'],
+        company=intern(fields['company']),
+        customer_name=intern(fields['customer_name']),
+        city=intern(fields['city']),
+        street=intern(fields['street']),
+        zip=intern(fields['zip']),
+        customer_country=intern(fields['customer_country']),
+        ico=intern(fields['ico']),
+        dic=intern(fields['dic']),
+        email=intern(fields['email']),
+        phone=fields['mobil_phone'] or fields['phone'],
+        customer_id=customer_id(fields['ico'], fields['company'] or fields['customer_name'], fields['zip']),
+        currency=currency,
+        centre=centre,
+        channel=channel,
+        salesperson=salesperson,
+        country=country,
+        supplier=supplier,
+        payment_type=intern(fields['payment_type']),
+        price_level=intern(fields['price_level']),
+        accounting=intern(fields['accounting']),
+        is_paid=bool(liquidation_date),
+        liquidation_date=liquidation_date,
+        total_czk=total_czk,
+        total_czk_bez_dph=total_czk_bez_dph,
+        total_eur=total_eur,
+        total_eur_bez_dph=total_eur_bez_dph,
+    )
 
     # Parse invoice items
     items = parse_invoice_items(invoice_element, invoice_data)
@@ -527,19 +2460,8 @@ def parse_invoice_xml_file(filepath):
     invoices = []
     all_items = []
 
-    # Read file with correct encoding
-    with open(filepath, 'rb') as f:
-        content = f.read()
-
-    # Try to parse
-    try:
-        root = ET.fromstring(content)
-    except ET.ParseError as e:
-        print(f"Error parsing {filepath}: {e}")
-        return invoices, all_items
-
-    # Find all invoices
-    for invoice in root.findall('.//inv:invoice', NS):
+    # Stream invoices one at a time (encoding is taken from the XML declaration)
+    for invoice in iter_xml_records(filepath, 'inv:invoice'):
         invoice_data, items = parse_invoice(invoice)
         if invoice_data:
             invoices.append(invoice_data)
@@ -548,18 +2470,37 @@ def parse_invoice_xml_file(filepath):
     return invoices, all_items
 
 
-def analyze_invoices(xml_dir):
-    """Analyze all invoice XML files in directory."""
+def _parse_invoice_file_task(filepath):
+    """Process-pool task: parse one invoice file, returning ((invoices, items), error message)."""
+    try:
+        return parse_invoice_xml_file(filepath), None
+    except XML_PARSE_ERRORS as e:
+        return ([], []), str(e)
+
+
+def analyze_invoices(xml_dir, workers=1, cache_dir=None, executor=None):
+    """
+    Analyze all invoice XML files in directory.
+
+    Files are parsed by `workers` processes (or the shared process pool
+    `executor`); unchanged files are loaded from the parse cache in
+    cache_dir when one is given.
+    """
     all_invoices = []
     all_items = []
 
     # Parse all XML files
     xml_files = sorted(glob.glob(os.path.join(xml_dir, '*.xml')))
+    results = parse_files_cached('invoices', _parse_invoice_file_task, xml_files,
+                                 workers=workers, cache_dir=cache_dir, executor=executor)
 
-    for filepath in xml_files:
+    for filepath, (((invoices, items), error), from_cache) in zip(xml_files, results):
         filename = os.path.basename(filepath)
-        print(f"Processing {filename}...")
-        invoices, items = parse_invoice_xml_file(filepath)
+        print(f"Processing {filename}...{' (cached)' if from_cache else ''}")
+        if error:
+            # Printed here rather than in the task, whose output is lost in a worker process
+            print(f"  Error parsing: {error}")
+            continue
         all_invoices.extend(invoices)
         all_items.extend(items)
         print(f"  Found {len(invoices)} invoices, {len(items)} items")
@@ -570,122 +2511,100 @@ def analyze_invoices(xml_dir):
     return all_invoices, all_items
 
 
-def export_invoices_to_js(invoices, items, output_dir):
-    """Export invoice data to JavaScript files for web dashboard."""
-    import json
-
-    # Separate regular invoices from sponsoring
-    regular_invoices = [inv for inv in invoices if inv['price_level'] != 'Sponzoring']
-    sponsoring_invoices = [inv for inv in invoices if inv['price_level'] == 'Sponzoring']
-
-    # Get invoice numbers for filtering items
-    regular_inv_numbers = set(inv['invoice_number'] for inv in regular_invoices)
-    sponsoring_inv_numbers = set(inv['invoice_number'] for inv in sponsoring_invoices)
-
-    regular_items = [item for item in items if item['invoice_number'] in regular_inv_numbers]
-    sponsoring_items = [item for item in items if item['invoice_number'] in sponsoring_inv_numbers]
-
-    def invoice_to_dict(inv):
-        return {
-            'invoice_number': inv['invoice_number'],
-            'order_number': inv['order_number'],
-            'date': inv['date'],
-            'date_due': inv['date_due'],
-            'company': inv['company'],
-            'customer_name': inv['customer_name'],
-            'city': inv['city'],
-            'zip': inv['zip'],
-            'customer_country': inv['customer_country'],
-            'ico': inv['ico'],
-            'email': inv['email'],
-            'phone': inv['phone'],
-            'currency': inv['currency'],
-            'centre': inv['centre'],
-            'channel': inv['channel'],
-            'salesperson': inv['salesperson'] if inv['salesperson'] else None,
-            'country': inv['country'],
-            'supplier': inv['supplier'],
-            'payment_type': inv['payment_type'],
-            'price_level': inv['price_level'],
-            'is_paid': inv['is_paid'],
-            'liquidation_date': inv['liquidation_date'],
-            'total_czk': float(inv['total_czk']),
-            'total_czk_bez_dph': float(inv.get('total_czk_bez_dph', 0)),
-            'total_eur': float(inv['total_eur']),
-            'total_eur_bez_dph': float(inv.get('total_eur_bez_dph', 0))
-        }
-
-    def item_to_dict(item):
-        return {
-            'invoice_number': item['invoice_number'],
-            'order_number': item['order_number'],
-            'date': item['date'],
-            'company': item['company'],
-            'currency': item['currency'],
-            'channel': item['channel'],
-            'salesperson': item['salesperson'] if item['salesperson'] else None,
-            'country': item['country'],
-            'supplier': item['supplier'],
-            'product_code': item['product_code'],
-            'product_name': item['product_name'],
-            'ean': item['ean'],
-            'quantity': float(item['quantity']),
-            'unit': item['unit'],
-            'unit_price': float(item['unit_price']),
-            'discount_percent': float(item['discount_percent']),
-            'total_czk': float(item['total_czk']),
-            'total_czk_bez_dph': float(item.get('total_czk_bez_dph', 0)),
-            'total_eur': float(item['total_eur']),
-            'total_eur_bez_dph': float(item.get('total_eur_bez_dph', 0)),
-        }
-
-    # Export regular invoices
-    invoices_file = os.path.join(output_dir, 'invoices_data.js')
-    invoices_list = [invoice_to_dict(inv) for inv in regular_invoices]
-
-    with open(invoices_file, 'w', encoding='utf-8') as f:
-        f.write('// VITAR Sport Analytics - Invoices Data (excluding Sponzoring)\n')
-        f.write('// Generated from Pohoda XML exports\n\n')
-        f.write('const invoicesData = ')
-        f.write(json.dumps(invoices_list, ensure_ascii=False, indent=2))
-        f.write(';\n')
-    print(f"Exported {len(invoices_list)} regular invoices to: {invoices_file}")
-
-    # Export regular invoice items
-    items_file = os.path.join(output_dir, 'invoices_items.js')
-    items_list = [item_to_dict(item) for item in regular_items]
-
-    with open(items_file, 'w', encoding='utf-8') as f:
-        f.write('// VITAR Sport Analytics - Invoice Items Data (excluding Sponzoring)\n')
-        f.write('// Generated from Pohoda XML exports\n\n')
-        f.write('const invoiceItemsData = ')
-        f.write(json.dumps(items_list, ensure_ascii=False, indent=2))
-        f.write(';\n')
-    print(f"Exported {len(items_list)} regular invoice items to: {items_file}")
-
-    # Export sponsoring invoices
-    sponsoring_file = os.path.join(output_dir, 'sponsoring_data.js')
-    sponsoring_list = [invoice_to_dict(inv) for inv in sponsoring_invoices]
-
-    with open(sponsoring_file, 'w', encoding='utf-8') as f:
-        f.write('// VITAR Sport Analytics - Sponsoring Invoices Data\n')
-        f.write('// Generated from Pohoda XML exports\n\n')
-        f.write('const sponsoringData = ')
-        f.write(json.dumps(sponsoring_list, ensure_ascii=False, indent=2))
-        f.write(';\n')
-    print(f"Exported {len(sponsoring_list)} sponsoring invoices to: {sponsoring_file}")
+def invoice_branch(invoice):
+    """Dashboard view an invoice belongs to: 'sponsoring' or 'regular'."""
+    return 'sponsoring' if invoice['price_level'] == 'Sponzoring' else 'regular'
 
-    # Export sponsoring items
-    sponsoring_items_file = os.path.join(output_dir, 'sponsoring_items.js')
-    sponsoring_items_list = [item_to_dict(item) for item in sponsoring_items]
 
-    with open(sponsoring_items_file, 'w', encoding='utf-8') as f:
-        f.write('// VITAR Sport Analytics - Sponsoring Items Data\n')
-        f.write('// Generated from Pohoda XML exports\n\n')
-        f.write('const sponsoringItemsData = ')
-        f.write(json.dumps(sponsoring_items_list, ensure_ascii=False, indent=2))
-        f.write(';\n')
-    print(f"Exported {len(sponsoring_items_list)} sponsoring items to: {sponsoring_items_file}")
+def export_invoices_to_js(invoices, items, output_dir, js_format='rows', shards=False, binary=False,
+                          deltas=False, sorted_rows=False):
+    """Export invoice data to JavaScript files for web dashboard."""
+    invoices_title = 'Invoices Data (excluding Sponzoring)'
+    items_title = 'Invoice Items Data (excluding Sponzoring)'
+    sponsoring_title = 'Sponsoring Invoices Data'
+    sponsoring_items_title = 'Sponsoring Items Data'
+
+    # Invoices are split into regular and sponsoring in one pass, items by their invoice
+    invoices_out = FanOutWriter(EXPORT_SCHEMAS['invoice'], split=invoice_branch)
+    regular_js = invoices_out.route(JsDataSink(
+        os.path.join(output_dir, 'invoices_data.js'), 'invoicesData', invoices_title, js_format), 'regular')
+    sponsoring_js = invoices_out.route(JsDataSink(
+        os.path.join(output_dir, 'sponsoring_data.js'), 'sponsoringData', sponsoring_title, js_format), 'sponsoring')
+    regular_invoices = invoices_out.route(RecordSink(), 'regular')
+    sponsoring_invoices = invoices_out.route(RecordSink(), 'sponsoring')
+    if shards:
+        regular_shards = invoices_out.route(
+            ShardSink(output_dir, 'invoicesData', invoices_title, js_format, sorted_rows), 'regular')
+        sponsoring_shards = invoices_out.route(
+            ShardSink(output_dir, 'sponsoringData', sponsoring_title, js_format, sorted_rows), 'sponsoring')
+    if deltas:
+        regular_deltas = invoices_out.route(
+            DeltaSink(output_dir, 'invoicesData', 'invoice_number', invoices_title, js_format), 'regular')
+        sponsoring_deltas = invoices_out.route(
+            DeltaSink(output_dir, 'sponsoringData', 'invoice_number', sponsoring_title, js_format), 'sponsoring')
+
+    items_out = FanOutWriter(EXPORT_SCHEMAS['invoice_item'], split=lambda item: invoice_branch(item.invoice))
+    regular_items_js = items_out.route(JsDataSink(
+        os.path.join(output_dir, 'invoices_items.js'), 'invoiceItemsData', items_title, js_format), 'regular')
+    sponsoring_items_js = items_out.route(JsDataSink(
+        os.path.join(output_dir, 'sponsoring_items.js'), 'sponsoringItemsData', sponsoring_items_title, js_format),
+        'sponsoring')
+    regular_items = items_out.route(RecordSink(), 'regular')
+    sponsoring_items = items_out.route(RecordSink(), 'sponsoring')
+    if shards:
+        regular_items_shards = items_out.route(
+            ShardSink(output_dir, 'invoiceItemsData', items_title, js_format, sorted_rows), 'regular')
+        sponsoring_items_shards = items_out.route(
+            ShardSink(output_dir, 'sponsoringItemsData', sponsoring_items_title, js_format, sorted_rows),
+            'sponsoring')
+    if binary:
+        regular_items_binary = items_out.route(
+            BinaryColumnsSink(os.path.join(output_dir, 'invoices_items')), 'regular')
+        sponsoring_items_binary = items_out.route(
+            BinaryColumnsSink(os.path.join(output_dir, 'sponsoring_items')), 'sponsoring')
+    if deltas:
+        regular_items_deltas = items_out.route(
+            DeltaSink(output_dir, 'invoiceItemsData', 'invoice_number', items_title, js_format), 'regular')
+        sponsoring_items_deltas = items_out.route(
+            DeltaSink(output_dir, 'sponsoringItemsData', 'invoice_number', sponsoring_items_title, js_format),
+            'sponsoring')
+
+    invoices_out.write(invoices)
+    items_out.write(items)
+
+    # Regular invoices and items
+    print(f"Exported {regular_js.count} regular invoices to: {regular_js.path}")
+    if shards:
+        regular_shards.report()
+    if deltas:
+        regular_deltas.report()
+    print(f"Exported {regular_items_js.count} regular invoice items to: {regular_items_js.path}")
+    if shards:
+        regular_items_shards.report()
+    if binary:
+        regular_items_binary.report()
+    if deltas:
+        regular_items_deltas.report()
+
+    # Sponsoring invoices and items
+    print(f"Exported {sponsoring_js.count} sponsoring invoices to: {sponsoring_js.path}")
+    if shards:
+        sponsoring_shards.report()
+    if deltas:
+        sponsoring_deltas.report()
+    print(f"Exported {sponsoring_items_js.count} sponsoring items to: {sponsoring_items_js.path}")
+    if shards:
+        sponsoring_items_shards.report()
+    if binary:
+        sponsoring_items_binary.report()
+    if deltas:
+        sponsoring_items_deltas.report()
+
+    # Export aggregate cubes of both views
+    export_cube_to_js('invoices', regular_invoices.records, regular_items.records, 'invoice_number',
+                      output_dir, js_format)
+    export_cube_to_js('sponsoring', sponsoring_invoices.records, sponsoring_items.records, 'invoice_number',
+                      output_dir, js_format)
 
 
 # ============================================================================
@@ -697,19 +2616,8 @@ def parse_xml_file(filepath):
     orders = []
     all_items = []
 
-    # Read file with correct encoding
-    with open(filepath, 'rb') as f:
-        content = f.read()
-
-    # Try to parse
-    try:
-        root = ET.fromstring(content)
-    except ET.ParseError as e:
-        print(f"Error parsing {filepath}: {e}")
-        return orders, all_items
-
-    # Find all orders
-    for order in root.findall('.//ord:order', NS):
+    # Stream orders one at a time (encoding is taken from the XML declaration)
+    for order in iter_xml_records(filepath, 'ord:order'):
         order_data, items = parse_order(order)
         if order_data:
             orders.append(order_data)
@@ -718,18 +2626,37 @@ def parse_xml_file(filepath):
     return orders, all_items
 
 
-def analyze_orders(xml_dir):
-    """Analyze all XML files in directory and generate reports."""
+def _parse_order_file_task(filepath):
+    """Process-pool task: parse one order file, returning ((orders, items), error message)."""
+    try:
+        return parse_xml_file(filepath), None
+    except XML_PARSE_ERRORS as e:
+        return ([], []), str(e)
+
+
+def analyze_orders(xml_dir, workers=1, cache_dir=None, executor=None):
+    """
+    Analyze all order XML files in directory.
+
+    Files are parsed by `workers` processes (or the shared process pool
+    `executor`); unchanged files are loaded from the parse cache in
+    cache_dir when one is given.
+    """
     all_orders = []
     all_items = []
 
     # Parse all XML files
     xml_files = sorted(glob.glob(os.path.join(xml_dir, '*.xml')))
+    results = parse_files_cached('orders', _parse_order_file_task, xml_files,
+                                 workers=workers, cache_dir=cache_dir, executor=executor)
 
-    for filepath in xml_files:
+    for filepath, (((orders, items), error), from_cache) in zip(xml_files, results):
         filename = os.path.basename(filepath)
-        print(f"Processing {filename}...")
-        orders, items = parse_xml_file(filepath)
+        print(f"Processing {filename}...{' (cached)' if from_cache else ''}")
+        if error:
+            # Printed here rather than in the task, whose output is lost in a worker process
+            print(f"  Error parsing: {error}")
+            continue
         all_orders.extend(orders)
         all_items.extend(items)
         print(f"  Found {len(orders)} orders, {len(items)} items")
@@ -740,64 +2667,52 @@ def analyze_orders(xml_dir):
     return all_orders, all_items
 
 
-def generate_reports(orders):
-    """Generate various analytics reports."""
-
-    # Monthly totals by channel (CZK)
-    monthly_channel_czk = defaultdict(lambda: defaultdict(Decimal))
-    # Monthly totals by channel (EUR) - for SK markets
-    monthly_channel_eur = defaultdict(lambda: defaultdict(Decimal))
-
-    # Monthly totals by salesperson (for B2B) - CZK
-    monthly_salesperson_czk = defaultdict(lambda: defaultdict(Decimal))
-
-    # Monthly totals by supplier (CZK)
-    monthly_supplier_czk = defaultdict(lambda: defaultdict(Decimal))
-
-    # Order counts
-    monthly_channel_count = defaultdict(lambda: defaultdict(int))
-    monthly_salesperson_count = defaultdict(lambda: defaultdict(int))
+# Grouping sets behind the monthly tables of print_reports() and the summary CSVs
+REPORT_GROUPING_SETS = {
+    'channel': GroupingSet(('month', 'channel', 'currency')),
+    'b2b_salesperson': GroupingSet(('month', 'salesperson'), where={'channel': 'B2B'}),
+    'supplier': GroupingSet(('month', 'supplier')),
+}
 
-    for order in orders:
-        month = order['date'][:7] if order['date'] else 'Unknown'
-        channel = order['channel']
-        total_czk = order['total_czk']
-        total_eur = order['total_eur']
-        currency = order['currency']
-
-        # Track by currency
-        if currency == 'EUR':
-            monthly_channel_eur[month][channel] += total_eur
-        else:
-            monthly_channel_czk[month][channel] += total_czk
 
-        monthly_channel_count[month][channel] += 1
+def generate_reports(orders, grouping_sets=None):
+    """
+    Generate various analytics reports (amounts in fixed-point haléře / cents).
 
-        if channel == 'B2B':
-            salesperson = order['salesperson']
-            monthly_salesperson_czk[month][salesperson] += total_czk
-            monthly_salesperson_count[month][salesperson] += 1
+    The monthly tables are pivots of REPORT_GROUPING_SETS. Extra
+    grouping_sets {name: GroupingSet} are rolled up in the same pass; the
+    cells of all sets are returned under 'rollup'.
+    """
+    rollup = Rollup({**REPORT_GROUPING_SETS, **(grouping_sets or {})}, ORDER_MEASURES)
+    cells = rollup.run(orders)
+    total_czk = ORDER_MEASURES.index('total_czk')
+    total_eur = ORDER_MEASURES.index('total_eur')
 
-        monthly_supplier_czk[month][order['supplier']] += total_czk
+    # Track by currency: EUR orders count in EUR (SK markets), the rest in CZK
+    by_channel = cells['channel']
+    channel_dimensions = REPORT_GROUPING_SETS['channel'].dimensions
+    czk_cells = {key: values for key, values in by_channel.items() if key[2] != 'EUR'}
+    eur_cells = {key: values for key, values in by_channel.items() if key[2] == 'EUR'}
 
     return {
-        'monthly_channel_czk': dict(monthly_channel_czk),
-        'monthly_channel_eur': dict(monthly_channel_eur),
-        'monthly_channel_count': dict(monthly_channel_count),
-        'monthly_salesperson_czk': dict(monthly_salesperson_czk),
-        'monthly_salesperson_count': dict(monthly_salesperson_count),
-        'monthly_supplier_czk': dict(monthly_supplier_czk),
+        'monthly_channel_czk': pivot(czk_cells, 'month', 'channel', total_czk, channel_dimensions),
+        'monthly_channel_eur': pivot(eur_cells, 'month', 'channel', total_eur, channel_dimensions),
+        'monthly_channel_count': pivot(by_channel, 'month', 'channel', 'count', channel_dimensions),
+        'monthly_salesperson_czk': pivot(cells['b2b_salesperson'], 'month', 'salesperson', total_czk),
+        'monthly_salesperson_count': pivot(cells['b2b_salesperson'], 'month', 'salesperson', 'count'),
+        'monthly_supplier_czk': pivot(cells['supplier'], 'month', 'supplier', total_czk),
+        'rollup': cells,
     }
 
 
 def format_czk(amount):
-    """Format amount in CZK."""
-    return f"{amount:,.2f} Kč".replace(',', ' ').replace('.', ',')
+    """Format a fixed-point amount (haléře) in CZK."""
+    return f"{fixed_to_float(amount, MONEY_DIGITS):,.2f} Kč".replace(',', ' ').replace('.', ',')
 
 
 def format_eur(amount):
-    """Format amount in EUR."""
-    return f"{amount:,.2f} €".replace(',', ' ').replace('.', ',')
+    """Format a fixed-point amount (cents) in EUR."""
+    return f"{fixed_to_float(amount, MONEY_DIGITS):,.2f} €".replace(',', ' ').replace('.', ',')
 
 
 def print_reports(reports):
@@ -818,13 +2733,13 @@ def print_reports(reports):
     print(f"{'CZ CELKEM':>25}")
     print("-" * (12 + 25*len(channels_cz) + 25))
 
-    grand_totals_cz = defaultdict(Decimal)
+    grand_totals_cz = defaultdict(int)
 
     for month in months:
         print(f"{month:<12}", end='')
-        month_total = Decimal('0')
+        month_total = 0
         for ch in channels_cz:
-            amount = reports['monthly_channel_czk'].get(month, {}).get(ch, Decimal('0'))
+            amount = reports['monthly_channel_czk'].get(month, {}).get(ch, 0)
             grand_totals_cz[ch] += amount
             month_total += amount
             print(f"{format_czk(amount):>25}", end='')
@@ -832,7 +2747,7 @@ def print_reports(reports):
 
     print("-" * (12 + 25*len(channels_cz) + 25))
     print(f"{'CELKEM':<12}", end='')
-    total_cz = Decimal('0')
+    total_cz = 0
     for ch in channels_cz:
         total_cz += grand_totals_cz[ch]
         print(f"{format_czk(grand_totals_cz[ch]):>25}", end='')
@@ -851,13 +2766,13 @@ def print_reports(reports):
     print(f"{'SK CELKEM':>25}")
     print("-" * (12 + 25*len(channels_sk) + 25))
 
-    grand_totals_sk = defaultdict(Decimal)
+    grand_totals_sk = defaultdict(int)
 
     for month in months:
         print(f"{month:<12}", end='')
-        month_total = Decimal('0')
+        month_total = 0
         for ch in channels_sk:
-            amount = reports['monthly_channel_eur'].get(month, {}).get(ch, Decimal('0'))
+            amount = reports['monthly_channel_eur'].get(month, {}).get(ch, 0)
             grand_totals_sk[ch] += amount
             month_total += amount
             print(f"{format_eur(amount):>25}", end='')
@@ -865,7 +2780,7 @@ def print_reports(reports):
 
     print("-" * (12 + 25*len(channels_sk) + 25))
     print(f"{'CELKEM':<12}", end='')
-    total_sk = Decimal('0')
+    total_sk = 0
     for ch in channels_sk:
         total_sk += grand_totals_sk[ch]
         print(f"{format_eur(grand_totals_sk[ch]):>25}", end='')
@@ -884,13 +2799,13 @@ def print_reports(reports):
     print(f"{'B2B CELKEM':>22}")
     print("-" * (12 + 22*len(salespeople) + 22))
 
-    sp_totals = defaultdict(Decimal)
+    sp_totals = defaultdict(int)
 
     for month in months:
         print(f"{month:<12}", end='')
-        month_total = Decimal('0')
+        month_total = 0
         for sp in salespeople:
-            amount = reports['monthly_salesperson_czk'].get(month, {}).get(sp, Decimal('0'))
+            amount = reports['monthly_salesperson_czk'].get(month, {}).get(sp, 0)
             sp_totals[sp] += amount
             month_total += amount
             print(f"{format_czk(amount):>22}", end='')
@@ -898,7 +2813,7 @@ def print_reports(reports):
 
     print("-" * (12 + 22*len(salespeople) + 22))
     print(f"{'CELKEM':<12}", end='')
-    total_b2b = Decimal('0')
+    total_b2b = 0
     for sp in salespeople:
         total_b2b += sp_totals[sp]
         print(f"{format_czk(sp_totals[sp]):>22}", end='')
@@ -917,13 +2832,13 @@ def print_reports(reports):
     print(f"{'CELKEM':>25}")
     print("-" * (12 + 25*len(suppliers) + 25))
 
-    sup_totals = defaultdict(Decimal)
+    sup_totals = defaultdict(int)
 
     for month in months:
         print(f"{month:<12}", end='')
-        month_total = Decimal('0')
+        month_total = 0
         for sup in suppliers:
-            amount = reports['monthly_supplier_czk'].get(month, {}).get(sup, Decimal('0'))
+            amount = reports['monthly_supplier_czk'].get(month, {}).get(sup, 0)
             sup_totals[sup] += amount
             month_total += amount
             print(f"{format_czk(amount):>25}", end='')
@@ -931,7 +2846,7 @@ def print_reports(reports):
 
     print("-" * (12 + 25*len(suppliers) + 25))
     print(f"{'CELKEM':<12}", end='')
-    total_sup = Decimal('0')
+    total_sup = 0
     for sup in suppliers:
         total_sup += sup_totals[sup]
         print(f"{format_czk(sup_totals[sup]):>25}", end='')
@@ -971,47 +2886,94 @@ def print_reports(reports):
     print(f"{total_count:>20}")
 
 
+def export_orders(orders, items, reports, output_dir, js_format='rows', shards=False, binary=False,
+                  deltas=False, csv_files=True, js_files=True, sorted_rows=False):
+    """
+    Export orders to the CSV files and / or the dashboard JS files.
+
+    Each order is converted once and written to all_orders.csv and data.js
+    (plus its shards) in the same pass.
+    """
+    schema = EXPORT_SCHEMAS['order']
+    orders_out = FanOutWriter(schema)
+    if csv_files:
+        orders_csv = orders_out.route(CsvSink(os.path.join(output_dir, 'all_orders.csv'), schema.fields))
+    if js_files:
+        orders_js = orders_out.route(
+            JsDataSink(os.path.join(output_dir, 'data.js'), 'ordersData', 'Orders Data', js_format),
+            view='dashboard')
+        if shards:
+            orders_shards = orders_out.route(
+                ShardSink(output_dir, 'ordersData', 'Orders Data', js_format, sorted_rows), view='dashboard')
+        if deltas:
+            orders_deltas = orders_out.route(
+                DeltaSink(output_dir, 'ordersData', 'order_number', 'Orders Data', js_format), view='dashboard')
+    orders_out.write(orders)
+
+    if csv_files:
+        print(f"\nExported orders to: {orders_csv.path}")
+        export_monthly_summaries(reports, output_dir)
+
+    if not js_files:
+        return
+
+    print(f"Exported {orders_js.count} orders to: {orders_js.path}")
+    if shards:
+        orders_shards.report()
+    if deltas:
+        orders_deltas.report()
+
+    # Export items
+    items_out = FanOutWriter(EXPORT_SCHEMAS['order_item'])
+    items_js = items_out.route(
+        JsDataSink(os.path.join(output_dir, 'items.js'), 'itemsData', 'Order Items Data', js_format))
+    if shards:
+        items_shards = items_out.route(
+            ShardSink(output_dir, 'itemsData', 'Order Items Data', js_format, sorted_rows))
+    if binary:
+        items_binary = items_out.route(BinaryColumnsSink(os.path.join(output_dir, 'items')))
+    if deltas:
+        items_deltas = items_out.route(
+            DeltaSink(output_dir, 'itemsData', 'order_number', 'Order Items Data', js_format))
+    items_out.write(items)
+
+    print(f"Exported {items_js.count} items to: {items_js.path}")
+    if shards:
+        items_shards.report()
+    if binary:
+        items_binary.report()
+    if deltas:
+        items_deltas.report()
+
+    # Export aggregate cube
+    export_cube_to_js('orders', orders, items, 'order_number', output_dir, js_format)
+
+
 def export_to_csv(orders, reports, output_dir):
     """Export data to CSV files."""
+    export_orders(orders, None, reports, output_dir, js_files=False)
 
-    months = sorted(set(list(reports['monthly_channel_czk'].keys()) + list(reports['monthly_channel_eur'].keys())))
 
-    # Export all orders
-    orders_file = os.path.join(output_dir, 'all_orders.csv')
-    with open(orders_file, 'w', newline='', encoding='utf-8') as f:
-        writer = csv.DictWriter(f, fieldnames=[
-            'order_number', 'internal_number', 'date', 'date_from', 'date_to',
-            'company', 'customer_name', 'city', 'street', 'zip', 'customer_country',
-            'ico', 'dic', 'email', 'phone', 'currency', 'centre',
-            'channel', 'salesperson', 'country', 'supplier',
-            'payment_type', 'price_level', 'is_executed', 'is_delivered',
-            'note', 'int_note', 'total_czk', 'total_czk_bez_dph', 'total_eur', 'total_eur_bez_dph'
-        ])
-        writer.writeheader()
-        for order in orders:
-            row = order.copy()
-            row['total_czk'] = float(row['total_czk'])
-            row['total_czk_bez_dph'] = float(row.get('total_czk_bez_dph', 0))
-            row['total_eur'] = float(row['total_eur'])
-            row['total_eur_bez_dph'] = float(row.get('total_eur_bez_dph', 0))
-            writer.writerow(row)
-    print(f"\nExported orders to: {orders_file}")
+def export_monthly_summaries(reports, output_dir):
+    """Export the monthly CZ, SK and B2B summaries to CSV files."""
+
+    months = sorted(set(list(reports['monthly_channel_czk'].keys()) + list(reports['monthly_channel_eur'].keys())))
 
     # Export CZ market summary (CZK)
     summary_cz_file = os.path.join(output_dir, 'monthly_summary_CZ_CZK.csv')
     channels_cz = ['ESHOP_ENERVIT_CZ', 'ESHOP_ROYALBAY_CZ', 'B2B']
 
-    with open(summary_cz_file, 'w', newline='', encoding='utf-8') as f:
+    with AtomicFile(summary_cz_file, newline='') as f:
         writer = csv.writer(f)
         writer.writerow(['Měsíc'] + channels_cz + ['CZ CELKEM (CZK)'])
         for month in months:
             row = [month]
-            total = Decimal('0')
+            total = 0
             for ch in channels_cz:
-                amount = reports['monthly_channel_czk'].get(month, {}).get(ch, Decimal('0'))
-                row.append(float(amount))
+                amount = reports['monthly_channel_czk'].get(month, {}).get(ch, 0)
+                row.append(fixed_to_float(amount, MONEY_DIGITS))
                 total += amount
-            row.append(float(total))
+            row.append(fixed_to_float(total, MONEY_DIGITS))
             writer.writerow(row)
     print(f"Exported CZ summary to: {summary_cz_file}")
 
@@ -1019,17 +2981,17 @@ def export_to_csv(orders, reports, output_dir):
     summary_sk_file = os.path.join(output_dir, 'monthly_summary_SK_EUR.csv')
     channels_sk = ['ESHOP_ENERVIT_SK', 'ESHOP_ROYALBAY_SK', 'B2B']
 
-    with open(summary_sk_file, 'w', newline='', encoding='utf-8') as f:
+    with AtomicFile(summary_sk_file, newline='') as f:
         writer = csv.writer(f)
         writer.writerow(['Měsíc'] + channels_sk + ['SK CELKEM (EUR)'])
         for month in months:
             row = [month]
-            total = Decimal('0')
+            total = 0
             for ch in channels_sk:
-                amount = reports['monthly_channel_eur'].get(month, {}).get(ch, Decimal('0'))
-                row.append(float(amount))
+                amount = reports['monthly_channel_eur'].get(month, {}).get(ch, 0)
+                row.append(fixed_to_float(amount, MONEY_DIGITS))
                 total += amount
-            row.append(float(total))
+            row.append(fixed_to_float(total, MONEY_DIGITS))
             writer.writerow(row)
     print(f"Exported SK summary to: {summary_sk_file}")
 
@@ -1037,99 +2999,24 @@ def export_to_csv(orders, reports, output_dir):
     b2b_file = os.path.join(output_dir, 'b2b_by_salesperson.csv')
     salespeople = ['Karolina', 'Jirka', 'Štěpán', 'VITAR Sport']
 
-    with open(b2b_file, 'w', newline='', encoding='utf-8') as f:
+    with AtomicFile(b2b_file, newline='') as f:
         writer = csv.writer(f)
         writer.writerow(['Měsíc'] + salespeople + ['B2B CELKEM (CZK)'])
         for month in months:
             row = [month]
-            total = Decimal('0')
+            total = 0
             for sp in salespeople:
-                amount = reports['monthly_salesperson_czk'].get(month, {}).get(sp, Decimal('0'))
-                row.append(float(amount))
+                amount = reports['monthly_salesperson_czk'].get(month, {}).get(sp, 0)
+                row.append(fixed_to_float(amount, MONEY_DIGITS))
                 total += amount
-            row.append(float(total))
+            row.append(fixed_to_float(total, MONEY_DIGITS))
             writer.writerow(row)
     print(f"Exported B2B breakdown to: {b2b_file}")
 
 
-def export_to_js(orders, items, output_dir):
+def export_to_js(orders, items, output_dir, js_format='rows', shards=False, binary=False, deltas=False):
     """Export data to JavaScript files for web dashboard."""
-    import json
-
-    # Export orders
-    orders_file = os.path.join(output_dir, 'data.js')
-    orders_list = []
-    for order in orders:
-        orders_list.append({
-            'order_number': order['order_number'],
-            'internal_number': order['internal_number'],
-            'date': order['date'],
-            'company': order['company'],
-            'customer_name': order['customer_name'],
-            'city': order['city'],
-            'zip': order['zip'],
-            'customer_country': order['customer_country'],
-            'ico': order['ico'],
-            'email': order['email'],
-            'phone': order['phone'],
-            'currency': order['currency'],
-            'centre': order['centre'],
-            'channel': order['channel'],
-            'salesperson': order['salesperson'] if order['salesperson'] else None,
-            'country': order['country'],
-            'supplier': order['supplier'],
-            'payment_type': order['payment_type'],
-            'price_level': order['price_level'],
-            'is_executed': order['is_executed'],
-            'is_delivered': order['is_delivered'],
-            'total_czk': float(order['total_czk']),
-            'total_czk_bez_dph': float(order.get('total_czk_bez_dph', 0)),
-            'total_eur': float(order['total_eur']),
-            'total_eur_bez_dph': float(order.get('total_eur_bez_dph', 0))
-        })
-
-    with open(orders_file, 'w', encoding='utf-8') as f:
-        f.write('// VITAR Sport Analytics - Orders Data\n')
-        f.write('// Generated from Pohoda XML exports\n\n')
-        f.write('const ordersData = ')
-        f.write(json.dumps(orders_list, ensure_ascii=False, indent=2))
-        f.write(';\n')
-    print(f"Exported {len(orders_list)} orders to: {orders_file}")
-
-    # Export items
-    items_file = os.path.join(output_dir, 'items.js')
-    items_list = []
-    for item in items:
-        items_list.append({
-            'order_number': item['order_number'],
-            'date': item['date'],
-            'company': item['company'],
-            'currency': item['currency'],
-            'channel': item['channel'],
-            'salesperson': item['salesperson'] if item['salesperson'] else None,
-            'country': item['country'],
-            'supplier': item['supplier'],
-            'product_code': item['product_code'],
-            'product_name': item['product_name'],
-            'ean': item['ean'],
-            'quantity': float(item['quantity']),
-            'delivered': float(item['delivered']),
-            'unit': item['unit'],
-            'unit_price': float(item['unit_price']),
-            'discount_percent': float(item['discount_percent']),
-            'total_czk': float(item['total_czk']),
-            'total_czk_bez_dph': float(item.get('total_czk_bez_dph', 0)),
-            'total_eur': float(item.get('total_eur', 0)),
-            'total_eur_bez_dph': float(item.get('total_eur_bez_dph', 0)),
-        })
-
-    with open(items_file, 'w', encoding='utf-8') as f:
-        f.write('// VITAR Sport Analytics - Order Items Data\n')
-        f.write('// Generated from Pohoda XML exports\n\n')
-        f.write('const itemsData = ')
-        f.write(json.dumps(items_list, ensure_ascii=False, indent=2))
-        f.write(';\n')
-    print(f"Exported {len(items_list)} items to: {items_file}")
+    export_orders(orders, items, None, output_dir, js_format, shards, binary, deltas, csv_files=False)
 
 
 # ============================================================================
@@ -1138,239 +3025,747 @@ def export_to_js(orders, items, output_dir):
 
 def parse_stock_item(stock_element):
     """Parse a single stock item from XML."""
-    header = stock_element.find('.//stk:stockHeader', NS)
-    if header is None:
+    if stock_element.find('stk:stockHeader', NS) is None:
         return None
 
-    code = get_text(header, './/stk:code')
-    name = get_text(header, './/stk:name')
-    name_complement = get_text(header, './/stk:nameComplement')
-    ean = get_text(header, './/stk:EAN')
-    unit = get_text(header, './/stk:unit')
-    count = Decimal(get_text(header, './/stk:count', '0'))
-    selling_price = Decimal(get_text(header, './/stk:sellingPrice', '0'))
-    purchase_price = Decimal(get_text(header, './/stk:purchasingPrice', '0'))
+    fields = extract_stock_fields(stock_element)
+    name = fields['name']
+    name_complement = fields['name_complement']
 
-    return {
-        'code': code,
-        'name': name,
-        'name_complement': name_complement,
-        'full_name': f"{name} {name_complement}".strip() if name_complement else name,
-        'ean': ean,
-        'unit': unit,
-        'count': count,
-        'selling_price': selling_price,
-        'purchase_price': purchase_price,
-    }
+    return StockItem(
+        code=fields['code'],
+        name=name,
+        name_complement=name_complement,
+        full_name=f"{name} {name_complement}".strip() if name_complement else name,
+        ean=fields['ean'],
+        unit=intern(fields['unit']),
+        count=to_fixed(fields['count'], QUANTITY_DIGITS),
+        selling_price=to_fixed(fields['selling_price'], UNIT_PRICE_DIGITS),
+        purchase_price=to_fixed(fields['purchase_price'], UNIT_PRICE_DIGITS),
+    )
 
 
-def analyze_stock(stock_dir):
-    """Analyze stock from XML exports."""
-    all_stock = []
+def parse_stock_xml_file(filepath, brand):
+    """Parse a Pohoda XML stock export file and return list of stock items."""
+    stock = []
 
-    # Process ENERVIT stock
-    en_files = glob.glob(os.path.join(stock_dir, '*EN*.xml')) + glob.glob(os.path.join(stock_dir, '*en*.xml'))
-    for xml_file in en_files:
-        print(f"Processing {os.path.basename(xml_file)} (ENERVIT)...")
-        try:
-            tree = ET.parse(xml_file)
-            root = tree.getroot()
+    # Stream stock cards one at a time; a broken file contributes nothing
+    for stock_element in iter_xml_records(filepath, 'stk:stock'):
+        item = parse_stock_item(stock_element)
+        if item:
+            item['brand'] = brand
+            stock.append(item)
 
-            for stock_element in root.findall('.//stk:stock', NS):
-                item = parse_stock_item(stock_element)
-                if item:
-                    item['brand'] = 'ENERVIT'
-                    all_stock.append(item)
+    return stock
 
-            print(f"  Found {len([s for s in all_stock if s['brand'] == 'ENERVIT'])} ENERVIT items")
-        except ET.ParseError as e:
-            print(f"  Error parsing: {e}")
 
-    # Process ROYALBAY stock
+def _parse_stock_file_task(filepath, brand):
+    """Process-pool task: parse one stock file, returning (items, error message)."""
+    try:
+        return parse_stock_xml_file(filepath, brand), None
+    except XML_PARSE_ERRORS as e:
+        return [], str(e)
+
+
+def analyze_stock(stock_dir, workers=1, cache_dir=None, executor=None):
+    """
+    Analyze stock from XML exports.
+
+    Files are parsed by `workers` processes (or the shared process pool
+    `executor`); unchanged files are loaded from the parse cache in
+    cache_dir when one is given.
+    """
+    all_stock = []
+
+    # ENERVIT files first, then ROYALBAY
+    en_files = glob.glob(os.path.join(stock_dir, '*EN*.xml')) + glob.glob(os.path.join(stock_dir, '*en*.xml'))
     rb_files = glob.glob(os.path.join(stock_dir, '*RB*.xml')) + glob.glob(os.path.join(stock_dir, '*rb*.xml'))
-    for xml_file in rb_files:
-        print(f"Processing {os.path.basename(xml_file)} (ROYALBAY)...")
-        try:
-            tree = ET.parse(xml_file)
-            root = tree.getroot()
+    xml_files = en_files + rb_files
+    brands = ['ENERVIT'] * len(en_files) + ['ROYALBAY'] * len(rb_files)
+    results = parse_files_cached('stock', _parse_stock_file_task, xml_files, brands,
+                                 workers=workers, cache_dir=cache_dir, executor=executor)
+
+    for xml_file, brand, ((stock, error), from_cache) in zip(xml_files, brands, results):
+        print(f"Processing {os.path.basename(xml_file)} ({brand})...{' (cached)' if from_cache else ''}")
+        if error:
+            print(f"  Error parsing: {error}")
+            continue
 
-            count_before = len(all_stock)
-            for stock_element in root.findall('.//stk:stock', NS):
-                item = parse_stock_item(stock_element)
-                if item:
-                    item['brand'] = 'ROYALBAY'
-                    all_stock.append(item)
+        count_before = len(all_stock)
+        all_stock.extend(stock)
 
+        if brand == 'ENERVIT':
+            print(f"  Found {len([s for s in all_stock if s['brand'] == 'ENERVIT'])} ENERVIT items")
+        else:
             print(f"  Found {len(all_stock) - count_before} ROYALBAY items")
-        except ET.ParseError as e:
-            print(f"  Error parsing: {e}")
 
     print(f"\nTotal stock items: {len(all_stock)}")
     return all_stock
 
 
 def calculate_stock_predictions(stock_items, order_items):
-    """Calculate average daily sales and days remaining for each stock item."""
-    from datetime import datetime, timedelta
-
-    # Get date range from orders (use last 90 days for average)
-    dates = [item['date'] for item in order_items if item.get('date')]
-    if not dates:
+    """Calculate sales velocities, trend, days remaining and forecast stock-out dates for each stock item."""
+    index = SalesIndex.from_items(order_items)
+    if not index.days:
         return stock_items
 
-    dates.sort()
-    end_date = datetime.strptime(dates[-1], '%Y-%m-%d')
-    start_date = end_date - timedelta(days=90)
-    start_date_str = start_date.strftime('%Y-%m-%d')
-
-    # Calculate total quantity sold per product code in last 90 days
-    sales_by_code = defaultdict(Decimal)
-    for item in order_items:
-        if item.get('date', '') >= start_date_str:
-            code = item.get('product_code', '')
-            qty = Decimal(str(item.get('quantity', 0)))
-            if code:
-                sales_by_code[code] += qty
-
-    # Calculate predictions
     days_in_period = 90
     for stock_item in stock_items:
         code = stock_item['code']
-        total_sold = sales_by_code.get(code, Decimal('0'))
+
+        # The original 90-day window runs from 90 days before the last sales date through that day
+        total_sold = index.sold(code, days_in_period + 1)
 
         # Average daily sales
-        avg_daily = total_sold / days_in_period if days_in_period > 0 else Decimal('0')
         stock_item['total_sold_90d'] = total_sold
-        stock_item['avg_daily_sales'] = avg_daily
+        stock_item['avg_daily_sales'] = total_sold / (days_in_period * _POW10[QUANTITY_DIGITS])
 
-        # Days remaining
-        if avg_daily > 0:
-            days_remaining = stock_item['count'] / avg_daily
-            stock_item['days_remaining'] = int(days_remaining)
+        # Days remaining = count / (total_sold / days), truncated, in exact integer arithmetic
+        if total_sold > 0:
+            count = stock_item['count']
+            days_remaining = abs(count) * days_in_period // total_sold
+            stock_item['days_remaining'] = days_remaining if count >= 0 else -days_remaining
         else:
             # No sales in last 90 days
             stock_item['days_remaining'] = -1  # -1 means no sales data
 
+        # Velocity per window and the trend of the last 30 days against the 30 before
+        for days in SALES_WINDOWS:
+            stock_item[f'avg_daily_{days}d'] = index.sold(code, days) / (days * _POW10[QUANTITY_DIGITS])
+        stock_item['trend_30d'] = index.trend(code, 30)
+
+    forecasts = forecast_demand(index, {stock_item['code']: stock_item['count'] for stock_item in stock_items})
+    for stock_item in stock_items:
+        for name, value in forecasts.get(stock_item['code'], {}).items():
+            stock_item[name] = value
+
     return stock_items
 
 
-def export_stock_to_js(stock_items, output_dir):
+def export_stock_to_js(stock_items, output_dir, js_format='rows'):
     """Export stock data to JavaScript file."""
-    import json
 
     stock_file = os.path.join(output_dir, 'stock_data.js')
-    stock_list = []
-
-    for item in stock_items:
-        stock_list.append({
-            'code': item['code'],
-            'name': item['name'],
-            'full_name': item['full_name'],
-            'ean': item['ean'],
-            'unit': item['unit'],
-            'brand': item['brand'],
-            'count': float(item['count']),
-            'selling_price': float(item['selling_price']),
-            'purchase_price': float(item['purchase_price']),
-            'total_sold_90d': float(item.get('total_sold_90d', 0)),
-            'avg_daily_sales': float(item.get('avg_daily_sales', 0)),
-            'days_remaining': item.get('days_remaining', -1),
-        })
-
-    with open(stock_file, 'w', encoding='utf-8') as f:
-        f.write('// VITAR Sport Analytics - Stock Data\n')
+    count = write_js_data(stock_file, 'stockData', map(EXPORT_SCHEMAS['stock'].to_row, stock_items),
+                          'Stock Data', js_format)
+
+    print(f"Exported {count} stock items to: {stock_file}")
+
+
+# ============================================================================
+# CUSTOMER DIMENSION
+# ============================================================================
+#
+# Orders and invoices each carry the full partner identity. Parsing gives
+# every document a customer_id instead, derived from the ICO (company ID)
+# or, without one, from the normalized company (or person) name and zip
+# code, so spelling and spacing variants of one partner share an id. The
+# id is a hash of that key: it is the same in every stage, worker process
+# and run, so ids in data files and deltas never shift.
+#
+# Dashboard data files carry the id instead of the identity, except for
+# the document's own city, which the city filter works on. customers.js
+# holds one row per customer with the identity (company, contacts) from
+# its latest document and precomputed lifetime totals of its orders and
+# (non-sponsoring) invoices.
+
+CUSTOMER_ID_LENGTH = 12  # hex digits of the hashed key
+
+
+def _normalize_name(text):
+    """Case- and punctuation-insensitive form of a name: 'Sport, s.r.o.' -> 'sport s r o'."""
+    return ' '.join(''.join(char if char.isalnum() else ' ' for char in text.casefold()).split())
+
+
+def customer_key(ico, name, zip_code):
+    """Deduplication key of a partner, or None for documents without one."""
+    ico = ''.join(char for char in ico or '' if char.isdigit()).lstrip('0')
+    if ico:
+        return f'ico:{ico}'
+    name = _normalize_name(name or '')
+    if name:
+        return f"name:{name}|{''.join((zip_code or '').split())}"
+    return None
+
+
+def customer_id(ico, name, zip_code):
+    """Compact id of the partner of a document (see customer_key), or None."""
+    key = customer_key(ico, name, zip_code)
+    if key is None:
+        return None
+    return intern(hashlib.sha1(key.encode('utf-8')).hexdigest()[:CUSTOMER_ID_LENGTH])
+
+
+# The identity fields data.js exposed before the customer dimension; street and
+# DIC stay out of the published files
+CUSTOMER_IDENTITY_FIELDS = (
+    'company', 'customer_name', 'city', 'zip', 'customer_country', 'ico', 'email', 'phone',
+)
+CUSTOMER_TOTALS = ('total_czk', 'total_czk_bez_dph', 'total_eur', 'total_eur_bez_dph')
+
+
+def build_customers(orders, invoices):
+    """
+    Customer rows from orders and invoices, ordered by customer id.
+
+    Identity fields come from the latest document of each customer; order
+    and invoice totals stay fixed-point.
+    """
+    customers = {}
+    latest = {}
+
+    def customer_of(document):
+        cid = document['customer_id']
+        if cid is None:
+            return None
+        customer = customers.get(cid)
+        if customer is None:
+            customers[cid] = customer = {
+                'customer_id': cid, 'first_date': None, 'last_date': None, 'orders': 0, 'invoices': 0,
+                **{name: 0 for name in CUSTOMER_TOTALS},
+                **{f'invoiced_{name[6:]}': 0 for name in CUSTOMER_TOTALS},
+            }
+        date = document['date'] or ''
+        if cid not in latest or date >= (latest[cid]['date'] or ''):
+            latest[cid] = document
+        if date and (customer['first_date'] is None or date < customer['first_date']):
+            customer['first_date'] = date
+        if date and (customer['last_date'] is None or date > customer['last_date']):
+            customer['last_date'] = date
+        return customer
+
+    for order in orders:
+        customer = customer_of(order)
+        if customer is not None:
+            customer['orders'] += 1
+            for name in CUSTOMER_TOTALS:
+                customer[name] += order[name]
+    for invoice in invoices:
+        customer = customer_of(invoice)
+        if customer is not None and invoice_branch(invoice) == 'regular':
+            customer['invoices'] += 1
+            for name in CUSTOMER_TOTALS:
+                customer[f'invoiced_{name[6:]}'] += invoice[name]
+
+    rows = []
+    for cid in sorted(customers):
+        document = latest[cid]
+        row = {'customer_id': cid}
+        row.update((name, document[name]) for name in CUSTOMER_IDENTITY_FIELDS)
+        row.update(customers[cid])
+        rows.append(row)
+    return rows
+
+
+_CUSTOMER_CONVERTERS = {
+    **{name: _money for name in CUSTOMER_TOTALS},
+    **{f'invoiced_{name[6:]}': _money for name in CUSTOMER_TOTALS},
+}
+
+
+def _customer_rows(rows):
+    """Customer rows with their fixed-point totals converted for export."""
+    for row in rows:
+        row = dict(row)
+        for name, converter in _CUSTOMER_CONVERTERS.items():
+            row[name] = converter(row[name])
+        yield row
+
+
+def export_customers_to_js(orders, invoices, output_dir, js_format='rows'):
+    """Build the customer dimension and export customers.js."""
+    customers = build_customers(orders, invoices)
+    by_ico = sum(1 for customer in customers if customer_key(customer['ico'], None, None))
+    print(f"Customers: {len(customers)} ({by_ico} by ICO, {len(customers) - by_ico} by name and zip)")
+
+    customers_file = os.path.join(output_dir, 'customers.js')
+    count = write_js_data(customers_file, 'customersData', _customer_rows(customers), 'Customers', js_format)
+    print(f"Exported {count} customers to: {customers_file}")
+
+
+# ============================================================================
+# ORDER FULFILLMENT
+# ============================================================================
+#
+# Invoices name the order they bill in order_number. The join hashes both
+# sides on it once (orders by number, invoices and invoiced quantities by
+# order number and product code), so linking stays linear in the number
+# of documents and items. Each order becomes one linked row: its invoices,
+# lead time from the order date to the first invoice, ordered, invoiced
+# and unbilled amounts without VAT, and a status:
+#
+#   invoiced - every ordered quantity is invoiced (or invoiced at all,
+#              for orders without items)
+#   partial  - invoiced, but some lines are still open
+#   open     - no invoice yet
+#
+# Lines compare ordered and invoiced quantity per order and product code.
+# The summary gives fulfillment rates, unbilled backlog and lead time
+# distributions per channel and salesperson; lead times are whole days,
+# so their percentiles come from a day histogram instead of a sort.
+
+FULFILLMENT_PERCENTILES = (50, 75, 90)
+
+
+def index_by(records, key):
+    """Hash index of records on the value of key: {value: [records]}, empty values left out."""
+    index = defaultdict(list)
+    for record in records:
+        value = record[key]
+        if value:
+            index[value].append(record)
+    return index
+
+
+def _lead_time(order_date, invoice_dates):
+    """Days from the order to its first invoice, or None."""
+    try:
+        return (datetime.date.fromisoformat(min(invoice_dates)) - datetime.date.fromisoformat(order_date)).days
+    except (TypeError, ValueError):
+        return None
+
+
+def _percentiles(histogram, count):
+    """Nearest-rank percentiles (FULFILLMENT_PERCENTILES) of a {value: count} histogram."""
+    values = sorted(histogram)
+    result = {}
+    for percentile in FULFILLMENT_PERCENTILES:
+        rank = max(-(-percentile * count // 100), 1)
+        seen = 0
+        for value in values:
+            seen += histogram[value]
+            if seen >= rank:
+                result[f'lead_time_p{percentile}'] = value
+                break
+    return result
+
+
+def join_orders_invoices(orders, order_items, invoices, invoice_items):
+    """
+    Link orders with their invoices and order lines with invoiced quantities.
+
+    Returns (order rows, line rows, number of invoices naming an unknown
+    order); rows are dicts with fixed-point amounts and quantities.
+    """
+    invoices_by_order = index_by(invoices, 'order_number')
+    invoiced = defaultdict(int)
+    for item in invoice_items:
+        if item['order_number']:
+            invoiced[item['order_number'], item['product_code']] += item['quantity']
+
+    ordered = {}
+    for item in order_items:
+        key = (item['order_number'], item['product_code'])
+        line = ordered.get(key)
+        if line is None:
+            ordered[key] = line = {
+                'order_number': key[0], 'product_code': key[1], 'product_name': item['product_name'],
+                'ordered': 0, 'delivered': 0, 'invoiced': invoiced.get(key, 0),
+            }
+        line['ordered'] += item['quantity']
+        line['delivered'] += item['delivered']
+
+    open_orders = set()
+    for line in ordered.values():
+        line['open'] = max(line['ordered'] - line['invoiced'], 0)
+        if line['open']:
+            open_orders.add(line['order_number'])
+
+    order_rows = []
+    order_numbers = set()
+    for order in orders:
+        number = order['order_number']
+        order_numbers.add(number)
+        linked = invoices_by_order.get(number, ()) if number else ()
+        row = {
+            'order_number': number, 'date': order['date'], 'channel': order['channel'],
+            'salesperson': order['salesperson'], 'currency': order['currency'],
+            'invoice_numbers': [invoice['invoice_number'] for invoice in linked],
+            'lead_time_days': _lead_time(order['date'], [invoice['date'] for invoice in linked]) if linked else None,
+            'status': 'open' if not linked else 'partial' if number in open_orders else 'invoiced',
+        }
+        for currency in ('czk', 'eur'):
+            total = f'total_{currency}_bez_dph'
+            row[f'ordered_{currency}'] = order[total]
+            row[f'invoiced_{currency}'] = sum(invoice[total] for invoice in linked)
+            row[f'unbilled_{currency}'] = max(row[f'ordered_{currency}'] - row[f'invoiced_{currency}'], 0)
+        order_rows.append(row)
+
+    unmatched = sum(len(linked) for number, linked in invoices_by_order.items() if number not in order_numbers)
+    return order_rows, list(ordered.values()), unmatched
+
+
+def summarize_fulfillment(order_rows, line_rows):
+    """Fulfillment summary rows per channel and salesperson, plus an all-channels row first."""
+    lines_by_order = defaultdict(lambda: [0, 0])
+    for line in line_rows:
+        totals = lines_by_order[line['order_number']]
+        totals[0] += line['ordered']
+        totals[1] += line['invoiced']
+
+    groups = {}
+    for row in order_rows:
+        for key in ((None, None), (row['channel'], row['salesperson'] or None)):
+            group = groups.get(key)
+            if group is None:
+                groups[key] = group = {
+                    'channel': key[0], 'salesperson': key[1], 'orders': 0,
+                    'invoiced_orders': 0, 'partial_orders': 0, 'open_orders': 0,
+                    'ordered_quantity': 0, 'invoiced_quantity': 0, 'unbilled_czk': 0, 'unbilled_eur': 0,
+                    'lead_times': defaultdict(int),
+                }
+            group['orders'] += 1
+            group[f"{row['status']}_orders"] += 1
+            ordered, invoiced = lines_by_order.get(row['order_number'], (0, 0))
+            group['ordered_quantity'] += ordered
+            group['invoiced_quantity'] += invoiced
+            group['unbilled_czk'] += row['unbilled_czk']
+            group['unbilled_eur'] += row['unbilled_eur']
+            if row['lead_time_days'] is not None:
+                group['lead_times'][row['lead_time_days']] += 1
+
+    summary = []
+    for key in sorted(groups, key=lambda key: (key[0] is not None, key[0] or '', key[1] or '')):
+        group = groups[key]
+        lead_times = group.pop('lead_times')
+        count = sum(lead_times.values())
+        group['fulfillment_rate'] = (group['invoiced_orders'] + group['partial_orders']) / group['orders']
+        group['quantity_rate'] = (min(group['invoiced_quantity'] / group['ordered_quantity'], 1.0)
+                                  if group['ordered_quantity'] else None)
+        group['lead_time_count'] = count
+        group['lead_time_mean'] = sum(days * n for days, n in lead_times.items()) / count if count else None
+        group['lead_time_min'] = min(lead_times) if count else None
+        group['lead_time_max'] = max(lead_times) if count else None
+        for percentile in FULFILLMENT_PERCENTILES:
+            group[f'lead_time_p{percentile}'] = None
+        group.update(_percentiles(lead_times, count))
+        group['lead_time_histogram'] = {str(days): lead_times[days] for days in sorted(lead_times)}
+        summary.append(group)
+    return summary
+
+
+_FULFILLMENT_CONVERTERS = {
+    'ordered_czk': _money, 'ordered_eur': _money, 'invoiced_czk': _money, 'invoiced_eur': _money,
+    'unbilled_czk': _money, 'unbilled_eur': _money,
+    'ordered': _quantity, 'delivered': _quantity, 'invoiced': _quantity, 'open': _quantity,
+    'ordered_quantity': _quantity, 'invoiced_quantity': _quantity,
+}
+
+
+def _fulfillment_rows(rows):
+    """Fulfillment rows with their fixed-point fields converted for export."""
+    for row in rows:
+        row = dict(row)
+        for name in _FULFILLMENT_CONVERTERS.keys() & row.keys():
+            row[name] = _FULFILLMENT_CONVERTERS[name](row[name])
+        yield row
+
+
+def export_fulfillment_to_js(orders, order_items, invoices, invoice_items, output_dir, js_format='rows'):
+    """Join orders with invoices and export fulfillment.js."""
+    order_rows, line_rows, unmatched = join_orders_invoices(orders, order_items, invoices, invoice_items)
+    summary = summarize_fulfillment(order_rows, line_rows)
+
+    total = summary[0] if summary else None
+    if total:
+        print(f"Invoiced orders: {total['invoiced_orders'] + total['partial_orders']} of {total['orders']} "
+              f"({total['fulfillment_rate'] * 100:.1f} %), {total['partial_orders']} partially")
+        print(f"Unbilled backlog: {format_czk(total['unbilled_czk'])}, {format_eur(total['unbilled_eur'])}")
+        if total['lead_time_count']:
+            print(f"Lead time to invoice: median {total['lead_time_p50']} days, "
+                  f"90 % within {total['lead_time_p90']} days")
+    if unmatched:
+        print(f"Invoices naming an unknown order: {unmatched}")
+
+    fulfillment_file = os.path.join(output_dir, 'fulfillment.js')
+    with AtomicFile(fulfillment_file) as f:
+        f.write('// VITAR Sport Analytics - Order Fulfillment\n')
         f.write('// Generated from Pohoda XML exports\n\n')
-        f.write('const stockData = ')
-        f.write(json.dumps(stock_list, ensure_ascii=False, indent=2))
-        f.write(';\n')
+        f.write('const fulfillmentData = {\n')
+        f.write('  "summary": ')
+        _write_js_rows(f, _fulfillment_rows(summary), js_format)
+        f.write(',\n  "orders": ')
+        _write_js_rows(f, _fulfillment_rows(order_rows), js_format)
+        f.write(',\n  "lines": ')
+        _write_js_rows(f, _fulfillment_rows(line_rows), js_format)
+        f.write('\n};\n')
 
-    print(f"Exported {len(stock_list)} stock items to: {stock_file}")
+    print(f"Exported {len(order_rows)} linked orders and {len(line_rows)} lines to: {fulfillment_file}")
 
 
-def main():
-    """Main entry point."""
-    # Directory with XML exports
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    xml_dir = os.path.join(script_dir, 'xml-exports')
+# ============================================================================
+# PIPELINE
+# ============================================================================
 
-    if not os.path.exists(xml_dir):
-        print(f"Error: XML directory not found: {xml_dir}")
-        return
+def sort_records(records, number_field):
+    """
+    Sort documents or items by date, then document number (--sort-rows).
 
-    # Check for subdirectories (new structure)
-    orders_dir = os.path.join(xml_dir, 'objednavky')
-    invoices_dir = os.path.join(xml_dir, 'faktury')
+    The sort is stable, so items keep their order within a document. With
+    the order fixed by the data rather than by the XML files, a daily
+    update only changes the lines and month shards of the changed records.
+    """
+    return sorted(records, key=lambda record: (record['date'] or '', record[number_field] or ''))
 
-    print("VITAR Sport Analytics - Pohoda XML Analysis")
-    print("="*50)
 
-    # ========================================
-    # PROCESS ORDERS
-    # ========================================
-    if os.path.exists(orders_dir):
-        print("\n" + "="*50)
-        print("OBJEDNÁVKY (Orders)")
-        print("="*50)
+class StageOutput:
+    """
+    Stand-in for sys.stdout while pipeline stages run in parallel threads.
+
+    Text printed by a thread that registered a stage is buffered per stage
+    and released in stage order, so the console log reads exactly like a
+    serial run. Other threads write straight through.
+    """
 
-        orders, order_items = analyze_orders(orders_dir)
+    def __init__(self, stream):
+        self.stream = stream
+        self.buffers = {}
+        self.stage_of_thread = {}
 
-        if orders:
-            # Generate reports
-            reports = generate_reports(orders)
+    def begin(self, stage):
+        self.buffers.setdefault(stage, [])
+        self.stage_of_thread[threading.get_ident()] = stage
 
-            # Print reports
-            print_reports(reports)
+    def end(self):
+        self.stage_of_thread.pop(threading.get_ident(), None)
 
-            # Export to CSV
-            export_to_csv(orders, reports, script_dir)
+    def release(self, stage):
+        self.stream.write(''.join(self.buffers.pop(stage, [])))
+        self.stream.flush()
 
-            # Export to JavaScript for web dashboard
-            export_to_js(orders, order_items, script_dir)
-        else:
-            print("No orders found!")
-    else:
+    def write(self, text):
+        stage = self.stage_of_thread.get(threading.get_ident())
+        if stage is None:
+            return self.stream.write(text)
+        self.buffers[stage].append(text)
+        return len(text)
+
+    def flush(self):
+        self.stream.flush()
+
+
+def run_stage(output, stage, fn, *args):
+    """Run one pipeline stage with its console output captured under `stage`."""
+    output.begin(stage)
+    try:
+        return fn(*args)
+    finally:
+        output.end()
+
+
+def process_orders(orders_dir, output_dir, workers=1, cache_dir=None, executor=None, js_format='rows',
+                   shards=False, binary=False, deltas=False, sort_rows=False):
+    """Order stage: parse, report, export CSV and JS. Returns the orders and order items."""
+    if not os.path.exists(orders_dir):
         print(f"Orders directory not found: {orders_dir}")
+        return [], []
+
+    print("\n" + "="*50)
+    print("OBJEDNÁVKY (Orders)")
+    print("="*50)
 
-    # ========================================
-    # PROCESS INVOICES
-    # ========================================
-    if os.path.exists(invoices_dir):
-        print("\n" + "="*50)
-        print("FAKTÚRY (Invoices)")
-        print("="*50)
+    orders, order_items = analyze_orders(orders_dir, workers, cache_dir, executor)
+    if sort_rows:
+        orders = sort_records(orders, 'order_number')
+        order_items = sort_records(order_items, 'order_number')
 
-        invoices, invoice_items = analyze_invoices(invoices_dir)
+    if orders:
+        # Generate reports
+        reports = generate_reports(orders)
 
-        if invoices:
-            # Export invoices to JavaScript for web dashboard
-            export_invoices_to_js(invoices, invoice_items, script_dir)
-        else:
-            print("No invoices found!")
+        # Print reports
+        print_reports(reports)
+
+        # Export to CSV and JavaScript for web dashboard in one pass
+        export_orders(orders, order_items, reports, output_dir, js_format, shards, binary, deltas,
+                      sorted_rows=sort_rows)
     else:
+        print("No orders found!")
+
+    return orders, order_items
+
+
+def process_invoices(invoices_dir, output_dir, workers=1, cache_dir=None, executor=None, js_format='rows',
+                     shards=False, binary=False, deltas=False, sort_rows=False):
+    """Invoice stage: parse and export JS. Returns the invoices and invoice items."""
+    if not os.path.exists(invoices_dir):
         print(f"Invoices directory not found: {invoices_dir}")
+        return [], []
 
-    # ========================================
-    # PROCESS STOCK
-    # ========================================
-    stock_dir = os.path.join(xml_dir, 'sklad')
-    if os.path.exists(stock_dir):
-        print("\n" + "="*50)
-        print("SKLAD (Stock)")
-        print("="*50)
-
-        stock_items = analyze_stock(stock_dir)
-
-        if stock_items and order_items:
-            # Calculate predictions based on order history
-            stock_items = calculate_stock_predictions(stock_items, order_items)
-            export_stock_to_js(stock_items, script_dir)
-        elif stock_items:
-            print("Warning: No order items for predictions, exporting stock without predictions")
-            export_stock_to_js(stock_items, script_dir)
-        else:
-            print("No stock items found!")
+    print("\n" + "="*50)
+    print("FAKTÚRY (Invoices)")
+    print("="*50)
+
+    invoices, invoice_items = analyze_invoices(invoices_dir, workers, cache_dir, executor)
+    if sort_rows:
+        invoices = sort_records(invoices, 'invoice_number')
+        invoice_items = sort_records(invoice_items, 'invoice_number')
+
+    if invoices:
+        # Export invoices to JavaScript for web dashboard
+        export_invoices_to_js(invoices, invoice_items, output_dir, js_format, shards, binary, deltas, sort_rows)
     else:
+        print("No invoices found!")
+
+    return invoices, invoice_items
+
+
+def process_stock(stock_dir, output_dir, orders_future, workers=1, cache_dir=None, executor=None,
+                  js_format='rows', sort_rows=False):
+    """
+    Stock stage: parse, predict and export JS.
+
+    Stock files are parsed right away; only the prediction step waits for
+    the order stage to deliver its items through orders_future.
+    """
+    if not os.path.exists(stock_dir):
         print(f"Stock directory not found: {stock_dir}")
+        return
+
+    print("\n" + "="*50)
+    print("SKLAD (Stock)")
+    print("="*50)
+
+    stock_items = analyze_stock(stock_dir, workers, cache_dir, executor)
+    if sort_rows:
+        stock_items.sort(key=lambda item: item['code'] or '')
+    order_items = orders_future.result()[1] if stock_items else None
+
+    if stock_items and order_items:
+        # Calculate predictions based on order history
+        stock_items = calculate_stock_predictions(stock_items, order_items)
+        export_stock_to_js(stock_items, output_dir, js_format)
+    elif stock_items:
+        print("Warning: No order items for predictions, exporting stock without predictions")
+        export_stock_to_js(stock_items, output_dir, js_format)
+    else:
+        print("No stock items found!")
+
+
+def process_fulfillment(orders_future, invoices_future, output_dir, js_format='rows'):
+    """Fulfillment stage: join the orders and invoices of the other stages and export JS."""
+    orders, order_items = orders_future.result()
+    invoices, invoice_items = invoices_future.result()
+    if not orders or not invoices:
+        return
+
+    print("\n" + "="*50)
+    print("PLNENIE OBJEDNÁVOK (Fulfillment)")
+    print("="*50)
+
+    export_fulfillment_to_js(orders, order_items, invoices, invoice_items, output_dir, js_format)
+
+
+def process_customers(orders_future, invoices_future, output_dir, js_format='rows'):
+    """Customer stage: build the customer dimension from orders and invoices and export JS."""
+    orders = orders_future.result()[0]
+    invoices = invoices_future.result()[0]
+    if not orders and not invoices:
+        return
+
+    print("\n" + "="*50)
+    print("ZÁKAZNÍCI (Customers)")
+    print("="*50)
+
+    export_customers_to_js(orders, invoices, output_dir, js_format)
+
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description='VITAR Sport Analytics - Pohoda XML Analysis')
+    parser.add_argument('-j', '--workers', type=int, default=1,
+                        help='number of parser processes (0 = one per CPU core, default: 1)')
+    parser.add_argument('--cache-dir',
+                        help='directory of the per-file parse cache (default: xml-exports/.cache)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='parse every XML file, ignoring the parse cache')
+    parser.add_argument('--xml-backend', choices=('auto', 'lxml', 'etree'), default='auto',
+                        help='XML parser (default: auto = lxml if installed, else ElementTree)')
+    parser.add_argument('--js-format', choices=JS_FORMATS, default='rows',
+                        help='dashboard data file format (default: rows; columnar needs loader.js; '
+                             'lines = one row per line)')
+    parser.add_argument('--sort-rows', action='store_true',
+                        help='sort rows by date and document number, for small diffs of committed data files')
+    parser.add_argument('--shards', action='store_true',
+                        help='also write month shards of the dated datasets under shards/ (holds each '
+                             'dataset in memory until it is written, or one month at a time with --sort-rows)')
+    parser.add_argument('--binary', action='store_true',
+                        help='also write item datasets as typed-array column blobs (.bin + .json header)')
+    parser.add_argument('--deltas', action='store_true',
+                        help='also keep the datasets as a cacheable base plus daily deltas under deltas/')
+    parser.add_argument('--compress', action='store_true',
+                        help='write .gz (and .br with brotli installed) siblings of the data files')
+    args = parser.parse_args(argv)
+    if args.xml_backend not in XML_BACKENDS and args.xml_backend != 'auto':
+        parser.error(f"--xml-backend {args.xml_backend}: lxml is not installed")
+    return args
+
+
+def main(argv=None):
+    """
+    Main entry point.
+
+    With more than one worker the order, invoice and stock stages run
+    concurrently and share one process pool for XML parsing; each stage
+    exports as soon as its own inputs are ready, and the fulfillment and
+    customer stages once orders and invoices are both in. Console output is still
+    printed in the serial order.
+    """
+    args = parse_args(argv)
+    workers = resolve_workers(args.workers)
+    backend = use_xml_backend(args.xml_backend)
+
+    # Directory with XML exports
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    xml_dir = os.path.join(script_dir, 'xml-exports')
+
+    if not os.path.exists(xml_dir):
+        print(f"Error: XML directory not found: {xml_dir}")
+        return
+
+    cache_dir = None if args.no_cache else (args.cache_dir or os.path.join(xml_dir, '.cache'))
+
+    # Check for subdirectories (new structure)
+    orders_dir = os.path.join(xml_dir, 'objednavky')
+    invoices_dir = os.path.join(xml_dir, 'faktury')
+    stock_dir = os.path.join(xml_dir, 'sklad')
+
+    print("VITAR Sport Analytics - Pohoda XML Analysis")
+    print("="*50)
+
+    # A single stage thread runs the stages one after another, in submit order
+    output = StageOutput(sys.stdout)
+    pool = (ProcessPoolExecutor(max_workers=workers, initializer=use_xml_backend, initargs=(backend.name,))
+            if workers > 1 else nullcontext())
+    sys.stdout = output
+    try:
+        with pool as executor, ThreadPoolExecutor(max_workers=5 if workers > 1 else 1) as stages:
+            orders_future = stages.submit(run_stage, output, 'orders', process_orders,
+                                          orders_dir, script_dir, workers, cache_dir, executor, args.js_format,
+                                          args.shards, args.binary, args.deltas, args.sort_rows)
+            invoices_future = stages.submit(run_stage, output, 'invoices', process_invoices,
+                                            invoices_dir, script_dir, workers, cache_dir, executor, args.js_format,
+                                            args.shards, args.binary, args.deltas, args.sort_rows)
+            stock_future = stages.submit(run_stage, output, 'stock', process_stock,
+                                         stock_dir, script_dir, orders_future, workers, cache_dir, executor,
+                                         args.js_format, args.sort_rows)
+            fulfillment_future = stages.submit(run_stage, output, 'fulfillment', process_fulfillment,
+                                               orders_future, invoices_future, script_dir, args.js_format)
+            customers_future = stages.submit(run_stage, output, 'customers', process_customers,
+                                             orders_future, invoices_future, script_dir, args.js_format)
+
+            for stage, future in (('orders', orders_future), ('invoices', invoices_future),
+                                  ('stock', stock_future), ('fulfillment', fulfillment_future),
+                                  ('customers', customers_future)):
+                try:
+                    future.result()
+                finally:
+                    output.release(stage)
+    finally:
+        sys.stdout = output.stream
+
+    if args.compress:
+        compress_outputs(script_dir, workers)
 
     print("\n" + "="*50)
     print("Analýza dokončena!")
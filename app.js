@@ -99,6 +99,33 @@ function getDiffClass(diff) {
     return 'neutral';
 }
 
+// Customers by id (customers.js); orders and invoices carry only customer_id
+const customersById = new Map(
+    (typeof customersData !== 'undefined' ? customersData : []).map(customer => [customer.customer_id, customer])
+);
+
+// Partner identity of an order or invoice (older data files have it inline).
+// Company and contacts are the customer's latest; the city filter uses the document's own city.
+function getCustomer(doc) {
+    return customersById.get(doc.customer_id) || doc;
+}
+
+// Linked order rows of fulfillment.js by order number (invoices, status, lead time)
+const fulfillmentByOrder = new Map(
+    (typeof fulfillmentData !== 'undefined' ? fulfillmentData.orders : []).map(row => [row.order_number, row])
+);
+
+// Invoicing of an order for the status tooltip, e.g. "Fakturováno (240100001), 5 dní"
+function formatFulfillment(order) {
+    const row = fulfillmentByOrder.get(order.order_number);
+    if (!row) return '';
+    const labels = { invoiced: 'Fakturováno', partial: 'Částečně fakturováno', open: 'Nefakturováno' };
+    let text = labels[row.status];
+    if (row.invoice_numbers.length) text += ` (${row.invoice_numbers.join(', ')})`;
+    if (row.lead_time_days !== null) text += `, ${row.lead_time_days} dní`;
+    return text;
+}
+
 // Get current data based on view
 function getCurrentData() {
     if (currentView === 'orders') return ordersData;
@@ -645,6 +672,7 @@ function updateOrdersTable(orders) {
 
     let html = '';
     limitedOrders.forEach(order => {
+        const customer = getCustomer(order);
         const channelClass = order.channel.includes('ENERVIT') ? 'badge-enervit' :
                             order.channel.includes('ROYALBAY') ? 'badge-royalbay' : 'badge-b2b';
         const amount = order.currency === 'EUR' ?
@@ -674,7 +702,7 @@ function updateOrdersTable(orders) {
                 <tr>
                     <td>${order.invoice_number}</td>
                     <td>${order.date}</td>
-                    <td>${order.company || '-'}</td>
+                    <td>${customer.company || '-'}</td>
                     <td>${order.city || '-'}</td>
                     <td><span class="badge ${channelClass}">${order.channel}</span></td>
                     <td>${order.payment_type || '-'}</td>
@@ -687,12 +715,12 @@ function updateOrdersTable(orders) {
                 <tr>
                     <td>${order.order_number}</td>
                     <td>${order.date}</td>
-                    <td>${order.company || '-'}</td>
+                    <td>${customer.company || '-'}</td>
                     <td>${order.city || '-'}</td>
                     <td><span class="badge ${channelClass}">${order.channel}</span></td>
                     <td>${order.salesperson || '-'}</td>
                     <td>${order.payment_type || '-'}</td>
-                    <td>${statusHtml}</td>
+                    <td title="${formatFulfillment(order)}">${statusHtml}</td>
                     <td class="text-right">${amount}</td>
                 </tr>
             `;
@@ -711,20 +739,21 @@ function updateOrdersTable(orders) {
 function updateTop10CustomersTable(orders) {
     const tbody = document.querySelector('#top10CustomersTable tbody');
 
-    // Aggregate by customer
-    const customers = {};
+    // Aggregate by customer id, names are looked up in customers.js
+    const customers = new Map();
     orders.forEach(order => {
-        const company = order.company || 'Neznámý';
-        if (!customers[company]) {
-            customers[company] = { count: 0, total: 0 };
+        const key = order.customer_id || order.company || '';
+        if (!customers.has(key)) {
+            const customer = getCustomer(order);
+            customers.set(key, { name: customer.company || customer.customer_name || 'Neznámý', count: 0, total: 0 });
         }
-        customers[company].count++;
-        customers[company].total += getPriceField(order, 'CZK');
+        const customer = customers.get(key);
+        customer.count++;
+        customer.total += getPriceField(order, 'CZK');
     });
 
     // Sort by total and get top 10
-    const sorted = Object.entries(customers)
-        .map(([name, data]) => ({ name, ...data }))
+    const sorted = [...customers.values()]
         .sort((a, b) => b.total - a.total)
         .slice(0, 10);
 
@@ -1228,11 +1257,12 @@ function updateOverdueTable(invoices) {
         else if (category === 'critical') rowClass = 'overdue-row-critical';
 
         let statusClass = 'overdue-' + category;
+        const customer = getCustomer(inv);
 
         html += `
             <tr class="${rowClass}">
                 <td>${inv.invoice_number}</td>
-                <td>${inv.company || inv.customer_name || '-'}</td>
+                <td>${customer.company || customer.customer_name || '-'}</td>
                 <td>${inv.salesperson || inv.centre || 'VITAR Sport'}</td>
                 <td>${inv.date_due}</td>
                 <td><strong>${daysOverdue}</strong> dní</td>
@@ -1346,6 +1376,25 @@ function updateStockSummary() {
     `;
 }
 
+// Sales trend of the last 30 days against the 30 before (trend_30d), e.g. ▲ 12 %
+function formatSalesTrend(trend) {
+    if (trend === null || trend === undefined) return '';
+    const percent = Math.round(trend * 100);
+    if (percent === 0) return '';
+    const color = percent > 0 ? '#2e7d32' : '#c62828';
+    return ` <small style="color:${color};">${percent > 0 ? '▲' : '▼'} ${Math.abs(percent)} %</small>`;
+}
+
+// Forecast stock-out date with its 80 % band (stockout_date*), for the days remaining tooltip
+function formatStockoutForecast(item) {
+    if (item.forecast_30d === undefined) return '';
+    const format = date => date ? new Date(date).toLocaleDateString('cs-CZ') : 'později než za rok';
+    const band = item.stockout_date_early || item.stockout_date_late
+        ? ` (${format(item.stockout_date_early)} – ${format(item.stockout_date_late)})`
+        : '';
+    return `Prognóza vyprodání: ${format(item.stockout_date)}${band}, prodej za 30 dní: ${item.forecast_30d.toFixed(1)}`;
+}
+
 // Update stock table
 function updateStockTable(items) {
     const tbody = document.querySelector('#stockTable tbody');
@@ -1362,6 +1411,10 @@ function updateStockTable(items) {
 
         const daysText = item.days_remaining === -1 ? '-' : `${item.days_remaining}`;
         const avgDaily = item.avg_daily_sales.toFixed(1);
+        const velocities = [7, 30, 365]
+            .filter(days => item[`avg_daily_${days}d`] !== undefined)
+            .map(days => `${days}d: ${item[`avg_daily_${days}d`].toFixed(1)}`)
+            .join(', ');
 
         html += `
             <tr class="${rowClass}">
@@ -1369,9 +1422,9 @@ function updateStockTable(items) {
                 <td>${item.full_name}</td>
                 <td><span class="badge badge-${item.brand === 'ENERVIT' ? 'enervit' : 'royalbay'}">${item.brand}</span></td>
                 <td class="text-right">${item.count.toLocaleString('cs-CZ')} ${item.unit}</td>
-                <td class="text-right">${avgDaily}</td>
+                <td class="text-right" title="${velocities}">${avgDaily}${formatSalesTrend(item.trend_30d)}</td>
                 <td class="text-right">${item.total_sold_90d.toLocaleString('cs-CZ')}</td>
-                <td class="text-right"><strong>${daysText}</strong></td>
+                <td class="text-right" title="${formatStockoutForecast(item)}"><strong>${daysText}</strong></td>
                 <td><span class="badge stock-${status}">${statusText}</span></td>
             </tr>
         `;
@@ -1804,7 +1857,7 @@ function generateMonthlySummary(selectedMonth) {
         salespersonStats[sp].totalEUR += o.total_eur || 0;
 
         // Track customer
-        const customer = o.company || 'Neznámý';
+        const customer = getCustomer(o).company || 'Neznámý';
         salespersonStats[sp].customers[customer] = (salespersonStats[sp].customers[customer] || 0) + (o.total_czk || 0) + ((o.total_eur || 0) * 25);
     });
 
@@ -1852,7 +1905,7 @@ function generateMonthlySummary(selectedMonth) {
     // === TOP 5 CUSTOMERS (skip empty/unknown) ===
     const customerTotals = {};
     monthOrders.forEach(o => {
-        const customer = o.company;
+        const customer = getCustomer(o).company;
         // Skip empty or unknown customers (eshop orders)
         if (!customer || customer === 'Neznámý' || customer.trim() === '') {
             return;
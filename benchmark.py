@@ -0,0 +1,499 @@
+#!/usr/bin/env python3
+"""
+VITAR Sport Analytics - Benchmark
+Synthetic Pohoda XML exports and a per-stage benchmark of analytics.py.
+
+Real exports contain customer data and can't leave the company, so the
+generator writes realistic fake ones with the same namespaces and structure:
+- objednavky/ - ord:order documents, one file per month
+- faktury/    - inv:invoice documents, one file per month
+- sklad/      - stk:stock cards, one file per brand (EN, RB)
+
+Documents cover every order number prefix classify_order() knows
+(11YY, 12YY, 22YY and B2B), CZK and EUR currencies, B2B centres and the
+'Sponzoring' price level. Every invoice bills the order generated with
+it, so the order/invoice join sees invoiced, partly invoiced and open
+orders. Scale 1 is about the size of a real year of
+exports; scales 10 and 100 multiply the number of documents and products.
+
+Usage:
+    python3 benchmark.py generate DIR [--scale N] [--seed N]
+    python3 benchmark.py run [--scale 1 10 100] [--label TEXT] [--no-memory]
+
+Each run times and memory-profiles (tracemalloc peak) the parse,
+report, export, prediction and join stages and appends the results to
+benchmark-results.json, printing them next to the previous run.
+"""
+
+import argparse
+import calendar
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+from xml.sax.saxutils import escape
+
+import analytics
+
+
+# ============================================================================
+# SYNTHETIC EXPORT GENERATOR
+# ============================================================================
+
+NS_DECL = ' '.join(f'xmlns:{prefix}="{uri}"' for prefix, uri in analytics.NS.items())
+
+# Documents per month and products per brand at scale 1
+ORDERS_PER_MONTH = 120
+PRODUCTS_PER_BRAND = 80
+
+# Order number prefix -> share of documents (anything not 11/12/22 is B2B)
+ORDER_PREFIXES = {'11': 0.35, '12': 0.15, '22': 0.2, '30': 0.15, '45': 0.1, '99': 0.05}
+CENTRES = ['KPR', 'JGO', 'OJO', 'ABC', '']
+PRICE_LEVELS = {'': 0.8, 'VO': 0.15, 'Sponzoring': 0.05}
+
+COMPANIES = [
+    ('Berani Zlín, s.r.o.', '12345678', '760 01', 'Zlín', 'CZ'),
+    ('Sport Žilina a.s.', '36123456', '010 01', 'Žilina', 'SK'),
+    ('Běžec s.r.o.', '87654321', '602 00', 'Brno', 'CZ'),
+    ('Cyklo Košice s.r.o.', '44556677', '040 01', 'Košice', 'SK'),
+    ('', '', '110 00', 'Praha', 'CZ'),
+    ('', '', '811 01', 'Bratislava', 'SK'),
+]
+CUSTOMER_NAMES = ['Jan Novák', 'Petra Svobodová', 'Tomáš Dvořák', 'Lucia Horváthová', 'Martin Kováč']
+
+ENERVIT_PRODUCTS = ['Gel', 'Isotonic Drink', 'Protein Bar', 'Carbo Flow', 'Salt Caps', 'Recovery Drink']
+ENERVIT_FLAVOURS = ['pomeranč', 'citron', 'třešeň', 'kola', 'čokoláda', 'neutrální']
+ROYALBAY_PRODUCTS = ['Kompresní podkolenky', 'Kompresní návleky', 'Ponožky Classic', 'Triko Air']
+ROYALBAY_SIZES = ['S', 'M', 'L', 'XL']
+
+
+def build_catalog(rng, scale):
+    """Return {brand: [(code, name, name_complement, ean), ...]} of synthetic products."""
+    catalog = {'EN': [], 'RB': []}
+    for i in range(PRODUCTS_PER_BRAND * scale):
+        catalog['EN'].append((
+            f"E{10000 + i}",
+            f"ENERVIT {rng.choice(ENERVIT_PRODUCTS)} {rng.choice(ENERVIT_FLAVOURS)}",
+            rng.choice(['25 ml', '60 ml', '500 g', '']),
+            f"80{i:011d}",
+        ))
+        catalog['RB'].append((
+            f"RB{20000 + i}",
+            f"ROYAL BAY {rng.choice(ROYALBAY_PRODUCTS)}",
+            rng.choice(ROYALBAY_SIZES),
+            f"85{i:011d}",
+        ))
+    return catalog
+
+
+def _weighted(rng, weights):
+    return rng.choices(list(weights), weights=list(weights.values()))[0]
+
+
+def _amount(rng, low=10, high=5000):
+    return f"{rng.uniform(low, high):.2f}"
+
+
+def _address(rng):
+    company, ico, zip_code, city, country = rng.choice(COMPANIES)
+    return (
+        f"<typ:address><typ:company>{escape(company)}</typ:company>"
+        f"<typ:name>{rng.choice(CUSTOMER_NAMES)}</typ:name><typ:city>{city}</typ:city>"
+        f"<typ:street>Hlavní {rng.randint(1, 200)}</typ:street><typ:zip>{zip_code}</typ:zip>"
+        f"<typ:ico>{ico}</typ:ico><typ:dic>{country}{ico}</typ:dic>"
+        f"<typ:country><typ:ids>{country}</typ:ids></typ:country>"
+        f"<typ:phone>+420 555 {rng.randint(100000, 999999)}</typ:phone>"
+        f"<typ:email>obchod{rng.randint(1, 999)}@example.cz</typ:email></typ:address>"
+    )
+
+
+def _items(rng, p, kind, products, eur):
+    """Detail element of a document ('ord'/'order' or 'inv'/'invoice')."""
+    items = []
+    for _ in range(rng.randint(1, 6)):
+        code, name, complement, ean = rng.choice(products)
+        quantity = rng.choice(['1', '2', '3', '6', '12', '24', '0.5'])
+        foreign = (f"<{p}:foreignCurrency><typ:unitPrice>{_amount(rng, 1, 50)}</typ:unitPrice>"
+                   f"<typ:price>{_amount(rng)}</typ:price><typ:priceVAT>1.00</typ:priceVAT>"
+                   f"<typ:priceSum>{_amount(rng)}</typ:priceSum></{p}:foreignCurrency>") if eur else ''
+        items.append(
+            f"<{p}:{kind}Item><{p}:text>{escape(f'{name} {complement}'.strip())}</{p}:text>"
+            f"<{p}:quantity>{quantity}</{p}:quantity>"
+            + (f"<ord:delivered>{quantity}</ord:delivered>" if p == 'ord' else '') +
+            f"<{p}:unit>ks</{p}:unit><{p}:discountPercentage>{rng.choice(['0', '0', '5', '12.5'])}</{p}:discountPercentage>"
+            f"<{p}:homeCurrency><typ:unitPrice>{_amount(rng, 20, 1500)}</typ:unitPrice>"
+            f"<typ:price>{_amount(rng)}</typ:price><typ:priceVAT>21.00</typ:priceVAT>"
+            f"<typ:priceSum>{_amount(rng)}</typ:priceSum></{p}:homeCurrency>{foreign}"
+            f"<{p}:code>{code}</{p}:code>"
+            f"<{p}:stockItem><typ:store><typ:ids>SKLAD</typ:ids></typ:store>"
+            f"<typ:stockItem><typ:ids>{code}</typ:ids><typ:EAN>{ean}</typ:EAN></typ:stockItem></{p}:stockItem>"
+            f"</{p}:{kind}Item>"
+        )
+
+    # Shipping line without a product code (skipped by the parser)
+    if rng.random() < 0.6:
+        items.append(
+            f"<{p}:{kind}Item><{p}:text>Doprava</{p}:text><{p}:quantity>1</{p}:quantity><{p}:unit>ks</{p}:unit>"
+            f"<{p}:homeCurrency><typ:unitPrice>99</typ:unitPrice><typ:price>81.82</typ:price>"
+            f"<typ:priceVAT>17.18</typ:priceVAT><typ:priceSum>99</typ:priceSum></{p}:homeCurrency></{p}:{kind}Item>"
+        )
+    return f"<{p}:{kind}Detail>{''.join(items)}</{p}:{kind}Detail>"
+
+
+def _summary(rng, p, kind, eur):
+    foreign = (f"<{p}:foreignCurrency><typ:currency><typ:ids>EUR</typ:ids></typ:currency>"
+               f"<typ:rate>25.1</typ:rate><typ:amount>1</typ:amount>"
+               f"<typ:priceSum>{_amount(rng, 10, 2000)}</typ:priceSum></{p}:foreignCurrency>") if eur else ''
+    return (
+        f"<{p}:{kind}Summary><{p}:roundingDocument>math2one</{p}:roundingDocument>"
+        f"<{p}:homeCurrency><typ:priceNone>{_amount(rng, 0, 100)}</typ:priceNone>"
+        f"<typ:priceLow>{_amount(rng)}</typ:priceLow><typ:priceLowVAT>12.00</typ:priceLowVAT>"
+        f"<typ:priceLowSum>{_amount(rng)}</typ:priceLowSum><typ:priceHigh>{_amount(rng, 100, 40000)}</typ:priceHigh>"
+        f"<typ:priceHighVAT>21.00</typ:priceHighVAT><typ:priceHighSum>{_amount(rng, 100, 50000)}</typ:priceHighSum>"
+        f"</{p}:homeCurrency>{foreign}</{p}:{kind}Summary>"
+    )
+
+
+def _document_header(rng, year, seq):
+    """Order number, currency, centre and price level of one document."""
+    prefix = _weighted(rng, ORDER_PREFIXES)
+    order_number = f"{prefix}{year % 100:02d}{seq:06d}"
+    if prefix == '12':
+        eur = True
+    elif prefix == '11':
+        eur = False
+    else:
+        eur = rng.random() < 0.3
+    centre = rng.choice(CENTRES) if prefix not in ('11', '12', '22') else ''
+    return order_number, eur, centre, _weighted(rng, PRICE_LEVELS)
+
+
+def generate_order(rng, seq, date, catalog):
+    """
+    One dat:dataPackItem with an ord:order document.
+
+    Returns (XML, order) where order holds what generate_invoice() needs to
+    bill it: number, currency, centre, price level and the seed of its lines.
+    """
+    order_number, eur, centre, price_level = _document_header(rng, date.year, seq)
+    items_seed = rng.getrandbits(32)
+    products = catalog['RB'] if order_number.startswith('22') else catalog['EN']
+    day = date.isoformat()
+    header = (
+        f"<ord:orderHeader><ord:orderType>receivedOrder</ord:orderType>"
+        f"<ord:number><typ:numberRequested>{seq}</typ:numberRequested></ord:number>"
+        f"<ord:numberOrder>{order_number}</ord:numberOrder><ord:date>{day}</ord:date>"
+        f"<ord:dateFrom>{day}</ord:dateFrom><ord:dateTo>{(date + timedelta(days=14)).isoformat()}</ord:dateTo>"
+        f"<ord:text>Objednávka</ord:text><ord:partnerIdentity>{_address(rng)}</ord:partnerIdentity>"
+        f"<ord:paymentType><typ:ids>{rng.choice(['dobírka', 'převodem', 'kartou'])}</typ:ids></ord:paymentType>"
+        f"<ord:priceLevel><typ:ids>{price_level}</typ:ids></ord:priceLevel>"
+        + (f"<ord:centre><typ:ids>{centre}</typ:ids></ord:centre>" if centre else '') +
+        f"<ord:isExecuted>{rng.choice(['true', 'false'])}</ord:isExecuted><ord:isDelivered>false</ord:isDelivered>"
+        f"<ord:note>Poznámka &amp; doprava</ord:note><ord:intNote></ord:intNote></ord:orderHeader>"
+    )
+    xml = (f'<dat:dataPackItem id="ORD{seq}" version="2.0"><ord:order version="2.0">{header}'
+           f'{_items(random.Random(items_seed), "ord", "order", products, eur)}{_summary(rng, "ord", "order", eur)}'
+           f'</ord:order></dat:dataPackItem>')
+    return xml, (order_number, eur, centre, price_level, items_seed)
+
+
+def generate_invoice(rng, seq, date, catalog, order):
+    """
+    One dat:dataPackItem with an inv:invoice document billing `order` (from generate_order()).
+
+    Invoices are dated 0-10 days after the order. Most bill the order's
+    lines as ordered; some bill other lines (partly invoiced orders) and
+    some don't name the order at all (orders left open).
+    """
+    order_number, eur, centre, price_level, items_seed = order
+    if rng.random() < 0.15:
+        items_seed = rng.getrandbits(32)
+    products = catalog['RB'] if order_number.startswith('22') else catalog['EN']
+    date = date + timedelta(days=rng.randint(0, 10))
+    day = date.isoformat()
+    paid = rng.random() < 0.7
+    header = (
+        f"<inv:invoiceHeader><inv:invoiceType>issuedInvoice</inv:invoiceType>"
+        f"<inv:number><typ:numberRequested>{date.year % 100:02d}{seq:07d}</typ:numberRequested></inv:number>"
+        f"<inv:symVar>{seq}</inv:symVar>"
+        + (f"<inv:numberOrder>{order_number}</inv:numberOrder>" if rng.random() < 0.9 else '') +
+        f"<inv:date>{day}</inv:date><inv:dateTax>{day}</inv:dateTax>"
+        f"<inv:dateDue>{(date + timedelta(days=14)).isoformat()}</inv:dateDue>"
+        f"<inv:accounting><typ:ids>3Fv</typ:ids></inv:accounting>"
+        f"<inv:partnerIdentity>{_address(rng)}</inv:partnerIdentity>"
+        f"<inv:paymentType><typ:ids>draft</typ:ids></inv:paymentType>"
+        + (f"<inv:centre><typ:ids>{centre}</typ:ids></inv:centre>" if centre else '') +
+        f"<inv:priceLevel><typ:ids>{price_level}</typ:ids></inv:priceLevel>"
+        + (f"<inv:liquidation><typ:date>{(date + timedelta(days=rng.randint(0, 30))).isoformat()}</typ:date>"
+           f"<typ:amountHome>1</typ:amountHome></inv:liquidation>" if paid else '') +
+        f"</inv:invoiceHeader>"
+    )
+    return (f'<dat:dataPackItem id="INV{seq}" version="2.0"><inv:invoice version="2.0">{header}'
+            f'{_items(random.Random(items_seed), "inv", "invoice", products, eur)}'
+            f'{_summary(rng, "inv", "invoice", eur)}'
+            f'</inv:invoice></dat:dataPackItem>')
+
+
+def generate_stock_card(rng, product):
+    """One dat:dataPackItem with an stk:stock card."""
+    code, name, complement, ean = product
+    return (
+        f'<dat:dataPackItem id="STK{code}" version="2.0"><stk:stock version="2.0"><stk:stockHeader>'
+        f"<stk:stockType>card</stk:stockType><stk:code>{code}</stk:code><stk:EAN>{ean}</stk:EAN>"
+        f"<stk:name>{escape(name)}</stk:name>"
+        + (f"<stk:nameComplement>{escape(complement)}</stk:nameComplement>" if complement else '') +
+        f"<stk:unit>ks</stk:unit><stk:count>{rng.randint(0, 3000)}</stk:count>"
+        f"<stk:purchasingPrice>{rng.uniform(5, 600):.3f}</stk:purchasingPrice>"
+        f"<stk:sellingPrice>{rng.uniform(10, 1200):.4f}</stk:sellingPrice>"
+        f"</stk:stockHeader></stk:stock></dat:dataPackItem>"
+    )
+
+
+def write_export(path, items):
+    """Write dataPackItem strings as a Windows-1250 Pohoda data pack."""
+    with open(path, 'w', encoding='cp1250', newline='') as f:
+        f.write('<?xml version="1.0" encoding="Windows-1250"?>\n')
+        f.write(f'<dat:dataPack {NS_DECL} id="benchmark" ico="12345678" application="Benchmark" '
+                f'version="2.0" note="Synthetic export">\n')
+        for item in items:
+            f.write(item)
+            f.write('\n')
+        f.write('</dat:dataPack>\n')
+
+
+def generate_exports(output_dir, scale=1, seed=1, months=12, end_date=None):
+    """
+    Write a synthetic xml-exports tree under output_dir.
+
+    Returns the number of (orders, invoices, stock cards) generated.
+    """
+    rng = random.Random(seed)
+    end_date = end_date or datetime(2025, 12, 31).date()
+    catalog = build_catalog(rng, scale)
+
+    for sub in ('objednavky', 'faktury', 'sklad'):
+        os.makedirs(os.path.join(output_dir, sub), exist_ok=True)
+
+    per_month = ORDERS_PER_MONTH * scale
+    seq = 0
+    year, month = end_date.year, end_date.month
+    periods = []
+    for _ in range(months):
+        periods.append((year, month))
+        year, month = (year, month - 1) if month > 1 else (year - 1, 12)
+
+    for year, month in reversed(periods):
+        days = range(1, calendar.monthrange(year, month)[1] + 1)
+        orders = []
+        invoices = []
+        for _ in range(per_month):
+            seq += 1
+            date = datetime(year, month, rng.choice(days)).date()
+            xml, order = generate_order(rng, seq, date, catalog)
+            orders.append(xml)
+            invoices.append(generate_invoice(rng, seq, date, catalog, order))
+        write_export(os.path.join(output_dir, 'objednavky', f'Objednavky_{year}_{month:02d}.xml'), orders)
+        write_export(os.path.join(output_dir, 'faktury', f'Faktury_{year}_{month:02d}.xml'), invoices)
+
+    for brand, products in catalog.items():
+        write_export(os.path.join(output_dir, 'sklad', f'Zasoby_{brand}.xml'),
+                     [generate_stock_card(rng, product) for product in products])
+
+    return seq, seq, sum(len(products) for products in catalog.values())
+
+
+# ============================================================================
+# BENCHMARK RUNNER
+# ============================================================================
+
+RESULTS_FILE = 'benchmark-results.json'
+
+
+def measure(fn, *args, memory=True):
+    """
+    Run fn(*args) with its console output suppressed.
+
+    Returns (result, seconds, peak traced bytes). The time comes from an
+    untraced run; with memory=True the call is repeated under tracemalloc
+    to get its peak allocation (None otherwise).
+    """
+    with contextlib.redirect_stdout(io.StringIO()):
+        start = time.perf_counter()
+        result = fn(*args)
+        seconds = time.perf_counter() - start
+
+        peak = None
+        if memory:
+            tracemalloc.start()
+            try:
+                fn(*args)
+                peak = tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+    return result, seconds, peak
+
+
+def benchmark_stages(xml_dir, output_dir, memory=True):
+    """Time each pipeline stage on the exports in xml_dir. Returns {stage: metrics}."""
+    results = {}
+
+    def run(stage, fn, *args):
+        result, seconds, peak = measure(fn, *args, memory=memory)
+        results[stage] = {'seconds': round(seconds, 4), 'peak_bytes': peak}
+        return result
+
+    orders, order_items = run('parse_orders', analytics.analyze_orders, os.path.join(xml_dir, 'objednavky'))
+    invoices, invoice_items = run('parse_invoices', analytics.analyze_invoices, os.path.join(xml_dir, 'faktury'))
+    stock_items = run('parse_stock', analytics.analyze_stock, os.path.join(xml_dir, 'sklad'))
+
+    reports = run('generate_reports', analytics.generate_reports, orders)
+    run('export_to_csv', analytics.export_to_csv, orders, reports, output_dir)
+    run('export_to_js', analytics.export_to_js, orders, order_items, output_dir)
+    run('export_invoices_to_js', analytics.export_invoices_to_js, invoices, invoice_items, output_dir)
+    run('calculate_stock_predictions', analytics.calculate_stock_predictions, stock_items, order_items)
+    run('export_fulfillment_to_js', analytics.export_fulfillment_to_js,
+        orders, order_items, invoices, invoice_items, output_dir)
+    run('export_customers_to_js', analytics.export_customers_to_js, orders, invoices, output_dir)
+
+    results['records'] = {
+        'orders': len(orders), 'order_items': len(order_items),
+        'invoices': len(invoices), 'invoice_items': len(invoice_items),
+        'stock_items': len(stock_items),
+    }
+    return results
+
+
+def load_results(path):
+    """Previously stored benchmark runs (oldest first)."""
+    if not os.path.exists(path):
+        return []
+    with open(path, encoding='utf-8') as f:
+        return json.load(f)
+
+
+def save_results(path, runs):
+    """Store benchmark runs as JSON (written atomically)."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(runs, f, ensure_ascii=False, indent=2)
+        f.write('\n')
+    os.replace(tmp_path, path)
+
+
+def format_bytes(value):
+    if value is None:
+        return '-'
+    return f"{value / (1024 * 1024):.1f} MB"
+
+
+def print_comparison(run, previous=None):
+    """Print one run's stage metrics, with the change against a previous run."""
+    print(f"\nBenchmark: {run['label']} ({run['timestamp']}, xml backend {run['xml_backend']}, "
+          f"numpy {'yes' if run['numpy'] else 'no'})")
+    if previous:
+        print(f"Compared to: {previous['label']} ({previous['timestamp']})")
+
+    for scale, stages in run['scales'].items():
+        before = (previous or {}).get('scales', {}).get(scale, {})
+        print(f"\nScale {scale}x - {stages['records']['orders']} orders, "
+              f"{stages['records']['invoices']} invoices, {stages['records']['stock_items']} stock items")
+        print(f"{'Stage':<30}{'Time':>12}{'Change':>10}{'Peak memory':>16}{'Change':>10}")
+        print("-" * 78)
+        for stage, metrics in stages.items():
+            if stage == 'records':
+                continue
+            old = before.get(stage, {})
+            print(f"{stage:<30}{metrics['seconds']:>11.3f}s{_change(metrics['seconds'], old.get('seconds')):>10}"
+                  f"{format_bytes(metrics['peak_bytes']):>16}"
+                  f"{_change(metrics['peak_bytes'], old.get('peak_bytes')):>10}")
+
+
+def _change(new, old):
+    if new is None or not old:
+        return ''
+    return f"{(new - old) / old * 100:+.0f}%"
+
+
+def run_benchmark(scales, label=None, seed=1, memory=True, results_path=RESULTS_FILE, data_dir=None):
+    """Generate exports for each scale, benchmark them and store the results."""
+    run = {
+        'label': label or datetime.now().strftime('%Y-%m-%d %H:%M'),
+        'timestamp': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'xml_backend': analytics.xml_backend.name,
+        'numpy': analytics.np is not None,
+        'seed': seed,
+        'scales': {},
+    }
+
+    for scale in scales:
+        with tempfile.TemporaryDirectory(prefix='vitar-benchmark-') as tmp:
+            xml_dir = os.path.join(data_dir, f'scale-{scale}') if data_dir else os.path.join(tmp, 'xml-exports')
+            if not os.path.isdir(xml_dir):
+                print(f"Generating scale {scale}x exports...")
+                generate_exports(xml_dir, scale=scale, seed=seed)
+            print(f"Benchmarking scale {scale}x...")
+            run['scales'][str(scale)] = benchmark_stages(xml_dir, tmp, memory=memory)
+
+    runs = load_results(results_path)
+    print_comparison(run, runs[-1] if runs else None)
+    runs.append(run)
+    save_results(results_path, runs)
+    print(f"\nResults saved to: {results_path}")
+    return run
+
+
+def parse_args(argv=None):
+    """Parse command line options."""
+    parser = argparse.ArgumentParser(description='VITAR Sport Analytics - Benchmark')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help='write synthetic Pohoda XML exports')
+    generate.add_argument('output_dir', help='directory to write objednavky/, faktury/ and sklad/ into')
+    generate.add_argument('--scale', type=int, default=1, help='size multiplier (default: 1)')
+    generate.add_argument('--seed', type=int, default=1, help='random seed (default: 1)')
+    generate.add_argument('--months', type=int, default=12, help='months of history (default: 12)')
+
+    run = commands.add_parser('run', help='benchmark the pipeline stages on synthetic exports')
+    run.add_argument('--scale', type=int, nargs='+', default=[1, 10, 100],
+                     help='scales to benchmark (default: 1 10 100)')
+    run.add_argument('--seed', type=int, default=1, help='random seed (default: 1)')
+    run.add_argument('--label', help='name of this run in the results file')
+    run.add_argument('--results', default=RESULTS_FILE,
+                     help=f'JSON file the runs are appended to (default: {RESULTS_FILE})')
+    run.add_argument('--data-dir',
+                     help='keep generated exports in DATA_DIR/scale-N and reuse them in later runs')
+    run.add_argument('--no-memory', action='store_true',
+                     help='skip the tracemalloc pass (timings only)')
+    run.add_argument('--xml-backend', choices=('auto', 'lxml', 'etree'), default='auto',
+                     help='XML parser used by analytics.py (default: auto)')
+
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    """Main entry point."""
+    args = parse_args(argv)
+
+    if args.command == 'generate':
+        orders, invoices, stock = generate_exports(args.output_dir, args.scale, args.seed, args.months)
+        print(f"Generated {orders} orders, {invoices} invoices and {stock} stock cards in {args.output_dir}")
+        return
+
+    try:
+        analytics.use_xml_backend(args.xml_backend)
+    except ValueError as e:
+        sys.exit(f"Error: {e}")
+    run_benchmark(args.scale, args.label, args.seed, not args.no_memory, args.results, args.data_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+// VITAR Sport Analytics - Data Loader
+// Decodes columnar data files (analytics.py --js-format columnar), loads
+// month shards on demand (analytics.py --shards), binary item columns
+// (analytics.py --binary) and base + delta datasets (analytics.py --deltas)
+
+// Turn a columnar table {length, columns} back into an array of row objects.
+// A column is either a plain array of values, or {values, codes} for
+// dictionary-encoded strings.
+function decodeColumns(table) {
+    const names = Object.keys(table.columns);
+    const columns = names.map(name => {
+        const column = table.columns[name];
+        if (Array.isArray(column)) return column;
+        return column.codes.map(code => column.values[code]);
+    });
+
+    const rows = new Array(table.length);
+    for (let i = 0; i < table.length; i++) {
+        const row = {};
+        for (let c = 0; c < names.length; c++) {
+            row[names[c]] = columns[c][i];
+        }
+        rows[i] = row;
+    }
+    return rows;
+}
+
+// Month shards: dataset -> manifest, and dataset -> month -> rows
+const shardManifests = {};
+const shardRows = {};
+const shardBaseUrl = 'shards';
+
+// Called by shards/<dataset>/manifest.js
+function registerManifest(dataset, manifest) {
+    shardManifests[dataset] = manifest;
+}
+
+// Called by shards/<dataset>/<month>.js
+function registerShard(dataset, month, rows) {
+    if (!shardRows[dataset]) shardRows[dataset] = {};
+    shardRows[dataset][month] = rows;
+}
+
+function loadScript(src) {
+    return new Promise((resolve, reject) => {
+        const script = document.createElement('script');
+        script.src = src;
+        script.onload = resolve;
+        script.onerror = () => reject(new Error(`Failed to load ${src}`));
+        document.head.appendChild(script);
+    });
+}
+
+// Load (once) and return the manifest of a dataset, e.g. 'ordersData'
+async function loadManifest(dataset) {
+    if (!shardManifests[dataset]) {
+        await loadScript(`${shardBaseUrl}/${dataset}/manifest.js?t=${Date.now()}`);
+    }
+    return shardManifests[dataset];
+}
+
+// Months available in a dataset, without loading any rows
+async function getShardMonths(dataset) {
+    const manifest = await loadManifest(dataset);
+    return manifest.shards.map(shard => shard.month);
+}
+
+// Load the given months of a dataset (all months when omitted) and return
+// their rows in month order. Shards already loaded are not fetched again;
+// the content hash in the URL makes browsers refetch only changed shards.
+async function loadMonths(dataset, months) {
+    const manifest = await loadManifest(dataset);
+    const wanted = manifest.shards.filter(shard => !months || months.includes(shard.month));
+    const loaded = shardRows[dataset] || {};
+
+    await Promise.all(wanted
+        .filter(shard => !loaded[shard.month])
+        .map(shard => loadScript(`${shardBaseUrl}/${dataset}/${shard.file}?v=${shard.sha256.substring(0, 12)}`)));
+
+    return wanted.flatMap(shard => shardRows[dataset][shard.month]);
+}
+
+// Load binary columns written by analytics.py --binary, e.g.
+// loadBinaryColumns('items') for items.json + items.bin. Returns
+// {length, columns}: numeric columns are Float64Array views of the fetched
+// buffer (no copy), string columns {codes: Int32Array, values} and
+// boolean columns Int32Array (0/1). Assumes a little-endian host, as are
+// all platforms browsers run on.
+async function loadBinaryColumns(name) {
+    const [header, buffer] = await Promise.all([
+        fetch(`${name}.json`).then(response => response.json()),
+        fetch(`${name}.bin`).then(response => response.arrayBuffer())
+    ]);
+
+    const columns = {};
+    header.columns.forEach(column => {
+        if (column.type === 'float64') {
+            columns[column.name] = new Float64Array(buffer, column.offset, header.length);
+        } else if (column.type === 'string') {
+            columns[column.name] = {
+                codes: new Int32Array(buffer, column.offset, header.length),
+                values: column.values
+            };
+        } else {
+            columns[column.name] = new Int32Array(buffer, column.offset, header.length);
+        }
+    });
+    return { length: header.length, columns };
+}
+
+// Array of row objects (like itemsData) from loadBinaryColumns() output
+function binaryColumnsToRows(table) {
+    const names = Object.keys(table.columns);
+    const getters = names.map(name => {
+        const column = table.columns[name];
+        if (column.codes) return i => column.values[column.codes[i]];
+        if (column instanceof Int32Array) return i => column[i] === 1;
+        return i => column[i];
+    });
+
+    const rows = new Array(table.length);
+    for (let i = 0; i < table.length; i++) {
+        const row = {};
+        for (let c = 0; c < names.length; c++) {
+            row[names[c]] = getters[c](i);
+        }
+        rows[i] = row;
+    }
+    return rows;
+}
+
+// Delta exports: dataset -> manifest, base rows and seq -> delta
+const deltaManifests = {};
+const deltaBases = {};
+const deltaChanges = {};
+const deltaBaseUrl = 'deltas';
+
+// Called by deltas/<dataset>/manifest.js
+function registerDeltaManifest(dataset, manifest) {
+    deltaManifests[dataset] = manifest;
+}
+
+// Called by deltas/<dataset>/base-<hash>.js
+function registerDeltaBase(dataset, rows) {
+    deltaBases[dataset] = rows;
+}
+
+// Called by deltas/<dataset>/delta-<seq>-<hash>.js
+function registerDelta(dataset, seq, rows, deleted) {
+    if (!deltaChanges[dataset]) deltaChanges[dataset] = {};
+    deltaChanges[dataset][seq] = { rows, deleted };
+}
+
+// Load a dataset written by analytics.py --deltas, e.g. 'ordersData', and
+// return its current rows. Rows are grouped by the manifest's key (the
+// document number); the base is applied first, then each delta in order
+// replaces all rows of the documents it contains and drops its deleted
+// ones. Base and delta files never change once written, so the browser
+// cache only misses on deltas added since the last visit.
+async function loadDeltas(dataset) {
+    await loadScript(`${deltaBaseUrl}/${dataset}/manifest.js?t=${Date.now()}`);
+    const manifest = deltaManifests[dataset];
+    const files = [manifest.base, ...manifest.deltas].map(entry => entry.file);
+    await Promise.all(files.map(file => loadScript(`${deltaBaseUrl}/${dataset}/${file}`)));
+
+    const groups = new Map();
+    const keyOf = row => row[manifest.key] || '';
+    deltaBases[dataset].forEach(row => {
+        const key = keyOf(row);
+        if (!groups.has(key)) groups.set(key, []);
+        groups.get(key).push(row);
+    });
+
+    manifest.deltas.forEach(delta => {
+        const change = deltaChanges[dataset][delta.seq];
+        change.deleted.forEach(key => groups.delete(key));
+        const replaced = new Set();
+        change.rows.forEach(row => {
+            const key = keyOf(row);
+            if (!replaced.has(key)) {
+                groups.set(key, []);
+                replaced.add(key);
+            }
+            groups.get(key).push(row);
+        });
+    });
+
+    return Array.from(groups.values()).flat();
+}
@@ -0,0 +1,891 @@
+"""
+Tests of analytics.py.
+
+Run with:  python -m pytest -q   (or: python -m unittest test_analytics)
+"""
+
+import datetime
+import io
+import json
+import os
+import random
+import tempfile
+import unittest
+import xml.etree.ElementTree as ET
+from collections import defaultdict
+from contextlib import redirect_stdout
+from decimal import Decimal
+from types import SimpleNamespace
+from unittest import mock
+
+import analytics
+import benchmark
+from analytics import (INVOICE_FIELDS, INVOICE_ITEM_FIELDS, MONEY_DIGITS, ORDER_FIELDS, ORDER_ITEM_FIELDS,
+                       QUANTITY_DIGITS, STOCK_FIELDS, UNIT_PRICE_DIGITS, ColumnStore, DeltaSink, GroupingSet, Invoice,
+                       InvoiceItem, Order, OrderItem, Rollup, SalesIndex, ShardSink, StockItem, build_customers,
+                       calculate_stock_predictions, compile_field_map, customer_id, customer_key, fixed_to_float,
+                       generate_reports, join_orders_invoices, order_month, parse_files_cached, qualify_tag,
+                       summarize_fulfillment, to_fixed)
+
+
+class FixedPointTest(unittest.TestCase):
+
+    def test_round_trip(self):
+        for text in ('0', '1', '-1', '1.5', '0.05', '-12.34', '1065.29', '99999999.99', '0.10'):
+            for digits in (MONEY_DIGITS, QUANTITY_DIGITS, UNIT_PRICE_DIGITS):
+                with self.subTest(text=text, digits=digits):
+                    self.assertEqual(fixed_to_float(to_fixed(text, digits), digits), float(text))
+
+    def test_fast_path_matches_decimal(self):
+        for text in ('1', '1.5', '1.25', '-0.01', '7.000', '12', '-3.5'):
+            with self.subTest(text=text):
+                self.assertEqual(to_fixed(text, 3), int(Decimal(text) * 1000))
+
+    def test_extra_places_round_half_away_from_zero(self):
+        self.assertEqual(to_fixed('1.005', 2), 101)
+        self.assertEqual(to_fixed('-1.005', 2), -101)
+        self.assertEqual(to_fixed('1.004', 2), 100)
+        self.assertEqual(to_fixed('1e2', 2), 10000)
+
+    def test_quantity_precision(self):
+        # Pohoda exports quantities with up to 4 decimals; they must stay exact
+        self.assertGreaterEqual(QUANTITY_DIGITS, 4)
+        for text in ('0.0001', '2.1234', '-0.3333', '1500.0625'):
+            with self.subTest(text=text):
+                quantity = to_fixed(text, QUANTITY_DIGITS)
+                self.assertEqual(Decimal(quantity) / 10 ** QUANTITY_DIGITS, Decimal(text))
+                self.assertEqual(fixed_to_float(quantity, QUANTITY_DIGITS), float(text))
+
+    def test_sums_are_exact(self):
+        total = sum(to_fixed('0.1', MONEY_DIGITS) for _ in range(10))
+        self.assertEqual(total, to_fixed('1', MONEY_DIGITS))
+        self.assertEqual(fixed_to_float(total, MONEY_DIGITS), 1.0)
+
+    def test_malformed_input_raises(self):
+        for text in ('', 'abc', '1.2.3'):
+            with self.subTest(text=text):
+                with self.assertRaises(Exception):
+                    to_fixed(text, MONEY_DIGITS)
+
+
+FIELD_MAPS = {
+    'ord:order': ORDER_FIELDS,
+    'ord:orderItem': ORDER_ITEM_FIELDS,
+    'inv:invoice': INVOICE_FIELDS,
+    'inv:invoiceItem': INVOICE_ITEM_FIELDS,
+    'stk:stock': STOCK_FIELDS,
+}
+
+
+def build_record(tag, fields, text_of):
+    """Record element with the elements of a field map; text_of(name) gives the text, None leaves it out."""
+    record = ET.Element(qualify_tag(tag))
+    for name, spec in fields.items():
+        text = text_of(name)
+        if text is None:
+            continue
+        element = record
+        for part in (spec[0] if isinstance(spec, tuple) else spec).split('/'):
+            child = element.find(qualify_tag(part))
+            element = child if child is not None else ET.SubElement(element, qualify_tag(part))
+        element.text = text
+    return record
+
+
+def lookup_fields(record, fields):
+    """The per-field './/' descendant lookups the parsers used before field maps."""
+    result = {}
+    for name, spec in fields.items():
+        path, default = spec if isinstance(spec, tuple) else (spec, '')
+        element = record.find('.//' + path.replace('/', '//'), analytics.NS)
+        result[name] = element.text.strip() if element is not None and element.text else default
+    return result
+
+
+class FieldMapTest(unittest.TestCase):
+
+    def check(self, text_of):
+        for tag, fields in FIELD_MAPS.items():
+            record = build_record(tag, fields, text_of)
+            expected = lookup_fields(record, fields)
+            with self.subTest(tag=tag):
+                self.assertEqual(compile_field_map(fields)(record), expected)
+                if analytics.lxml_etree is not None:
+                    lxml_record = analytics.lxml_etree.fromstring(ET.tostring(record))
+                    self.assertEqual(compile_field_map(fields)(lxml_record), expected)
+
+    def test_all_fields_present(self):
+        self.check(lambda name: f'  {name} value\n')
+
+    def test_missing_and_empty_fields_use_defaults(self):
+        self.check(lambda name: None if len(name) % 3 == 0 else '' if len(name) % 3 == 1 else name)
+
+    def test_no_fields(self):
+        self.check(lambda name: None)
+
+    def test_first_match_wins(self):
+        record = build_record('ord:orderItem', ORDER_ITEM_FIELDS, lambda name: name)
+        ET.SubElement(record, qualify_tag('ord:code')).text = 'second'
+        self.assertEqual(compile_field_map(ORDER_ITEM_FIELDS)(record)['product_code'], 'product_code')
+        self.assertEqual(compile_field_map(ORDER_ITEM_FIELDS)(record), lookup_fields(record, ORDER_ITEM_FIELDS))
+
+    def test_shared_tags_stay_apart(self):
+        # typ:price is both the home and the foreign currency price of an invoice item
+        record = build_record('inv:invoiceItem', INVOICE_ITEM_FIELDS,
+                              {'price': '100', 'foreign_price': '4'}.get)
+        fields = compile_field_map(INVOICE_ITEM_FIELDS)(record)
+        self.assertEqual((fields['price'], fields['foreign_price'], fields['price_sum']), ('100', '4', '0'))
+
+
+@unittest.skipIf(analytics.lxml_etree is None, 'lxml is not installed')
+class XmlBackendTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        tmp = tempfile.TemporaryDirectory()
+        cls.addClassCleanup(tmp.cleanup)
+        benchmark.generate_exports(tmp.name, months=1)
+        cls.exports = {kind: os.path.join(tmp.name, kind, os.listdir(os.path.join(tmp.name, kind))[0])
+                       for kind in ('objednavky', 'faktury')}
+
+    def setUp(self):
+        self.addCleanup(analytics.use_xml_backend, analytics.xml_backend.name)
+
+    def per_backend(self, fn):
+        results = {}
+        for name in ('etree', 'lxml'):
+            self.assertEqual(analytics.use_xml_backend(name).name, name)
+            results[name] = fn()
+        return results['etree'], results['lxml']
+
+    def test_records(self):
+        for kind, tag, extract in (('objednavky', 'ord:order', 'extract_order_fields'),
+                                   ('faktury', 'inv:invoice', 'extract_invoice_fields')):
+            with self.subTest(tag=tag):
+                etree, lxml = self.per_backend(lambda: [
+                    getattr(analytics, extract)(record)
+                    for record in analytics.iter_xml_records(self.exports[kind], tag)])
+                self.assertEqual(len(etree), benchmark.ORDERS_PER_MONTH)
+                self.assertEqual(lxml, etree)
+
+    def test_parsed_documents(self):
+        for kind, parse in (('objednavky', analytics.parse_xml_file),
+                            ('faktury', analytics.parse_invoice_xml_file)):
+            with self.subTest(kind=kind):
+                etree, lxml = self.per_backend(lambda: [
+                    [record.copy() for record in records] for records in parse(self.exports[kind])])
+                self.assertTrue(etree[0] and etree[1])
+                self.assertEqual(lxml, etree)
+
+
+def without_numpy():
+    """Patch analytics to take its pure-Python paths."""
+    return mock.patch.object(analytics, 'np', None)
+
+
+class ColumnStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        rng = random.Random(1)
+        self.records = [
+            SimpleNamespace(
+                date=rng.choice(['2024-01-05', '2024-01-20', '2024-02-01', '2024-03-15', '']),
+                channel=rng.choice(['B2B', 'B2C', 'Export']),
+                country=rng.choice(['CZ', 'SK', None]),
+                quantity=rng.randint(-5, 50) * 10 ** QUANTITY_DIGITS,
+                total=rng.randint(-10 ** 6, 10 ** 9),
+            )
+            for _ in range(500)
+        ]
+        self.store = ColumnStore.from_records(
+            self.records, ('date', ('month', 'date', order_month), 'channel', 'country'), ('quantity', 'total'))
+
+    def expected(self, dimensions, measures, keep=lambda record: True):
+        groups = defaultdict(lambda: [0] * (len(measures) + 1))
+        for record in self.records:
+            if keep(record):
+                totals = groups[tuple(getattr(record, name) if name != 'month' else order_month(record.date)
+                                      for name in dimensions)]
+                totals[0] += 1
+                for i, name in enumerate(measures, 1):
+                    totals[i] += getattr(record, name)
+        return {key: tuple(totals) for key, totals in groups.items()}
+
+    def check(self, dimensions, measures=(), where=None, keep=lambda record: True):
+        with without_numpy():
+            python = self.store.group_by(dimensions, measures, where)
+        self.assertEqual(python, self.expected(dimensions, measures, keep))
+        if analytics.np is None:
+            self.skipTest('numpy is not installed')
+        numpy = self.store.group_by(dimensions, measures, where)
+        self.assertEqual(numpy, python)
+        self.assertEqual(list(numpy), list(python))
+        self.assertTrue(all(type(value) is int for totals in numpy.values() for value in totals))
+
+    def test_one_dimension(self):
+        self.check(('channel',), ('quantity', 'total'))
+
+    def test_several_dimensions(self):
+        self.check(('month', 'channel', 'country'), ('quantity', 'total'))
+
+    def test_no_dimensions(self):
+        self.check((), ('total',))
+
+    def test_count_only(self):
+        self.check(('date', 'country'))
+
+    def test_where(self):
+        where = self.store.mask('channel', lambda channel: channel != 'B2C')
+        self.check(('month', 'country'), ('quantity',), where, lambda record: record.channel != 'B2C')
+
+    def test_where_selects_nothing(self):
+        where = self.store.mask('channel', lambda channel: False)
+        self.check(('channel',), ('total',), where, lambda record: False)
+
+    def test_empty_store(self):
+        self.records = []
+        self.store = ColumnStore.from_records([], ('channel',), ('total',))
+        self.check(('channel',), ('total',))
+
+
+def money(text):
+    return to_fixed(text, MONEY_DIGITS)
+
+
+def quantity(text):
+    return to_fixed(text, QUANTITY_DIGITS)
+
+
+def report_order(date, channel, salesperson, currency, czk, czk_bez_dph, eur, eur_bez_dph):
+    return Order(date=date, channel=channel, salesperson=salesperson, currency=currency, country='CZ',
+                 supplier='ENERVIT', total_czk=money(czk), total_czk_bez_dph=money(czk_bez_dph),
+                 total_eur=money(eur), total_eur_bez_dph=money(eur_bez_dph))
+
+
+def cell(count, czk, czk_bez_dph, eur, eur_bez_dph):
+    """Expected ORDER_MEASURES cell."""
+    return (count, money(czk), money(czk_bez_dph), money(eur), money(eur_bez_dph))
+
+
+class RollupTest(unittest.TestCase):
+
+    ORDERS = [
+        report_order('2024-01-10', 'B2B', 'Novák', 'CZK', '121', '100', '4.84', '4'),
+        report_order('2024-01-20', 'B2B', 'Svoboda', 'CZK', '242', '200', '9.68', '8'),
+        report_order('2024-01-31', 'B2C', '', 'EUR', '605', '500', '24.20', '20'),
+        report_order('2024-02-01', 'B2B', 'Novák', 'EUR', '1210', '1000', '48.40', '40'),
+        report_order('', 'B2C', '', 'CZK', '12.10', '10', '0.48', '0.40'),
+    ]
+
+    def run_rollup(self, grouping_sets):
+        with without_numpy():
+            python = Rollup(grouping_sets).run(self.ORDERS)
+        if analytics.np is not None:
+            self.assertEqual(Rollup(grouping_sets).run(self.ORDERS), python)
+        return python
+
+    def test_grouping_sets(self):
+        cells = self.run_rollup({
+            'channel': GroupingSet(('month', 'channel', 'currency')),
+            'b2b': GroupingSet(('month', 'salesperson'), where={'channel': 'B2B'}),
+            'b2b_eur': GroupingSet(('year',), where={'channel': 'B2B', 'currency': 'EUR'}),
+            'total': GroupingSet(()),
+        })
+        self.assertEqual(cells['channel'], {
+            ('2024-01', 'B2B', 'CZK'): cell(2, '363', '300', '14.52', '12'),
+            ('2024-01', 'B2C', 'EUR'): cell(1, '605', '500', '24.20', '20'),
+            ('2024-02', 'B2B', 'EUR'): cell(1, '1210', '1000', '48.40', '40'),
+            ('Unknown', 'B2C', 'CZK'): cell(1, '12.10', '10', '0.48', '0.40'),
+        })
+        self.assertEqual(cells['b2b'], {
+            ('2024-01', 'Novák'): cell(1, '121', '100', '4.84', '4'),
+            ('2024-01', 'Svoboda'): cell(1, '242', '200', '9.68', '8'),
+            ('2024-02', 'Novák'): cell(1, '1210', '1000', '48.40', '40'),
+        })
+        self.assertEqual(cells['b2b_eur'], {('2024',): cell(1, '1210', '1000', '48.40', '40')})
+        self.assertEqual(cells['total'], {(): cell(5, '2190.10', '1810', '87.60', '72.40')})
+
+    def test_time_grains(self):
+        cells = self.run_rollup({'week': GroupingSet(('week',)), 'quarter': GroupingSet(('quarter', 'currency'))})
+        self.assertEqual({key: value[0] for key, value in cells['week'].items()},
+                         {('2024-W02',): 1, ('2024-W03',): 1, ('2024-W05',): 2, ('Unknown',): 1})
+        self.assertEqual({key: value[0] for key, value in cells['quarter'].items()},
+                         {('2024-Q1', 'CZK'): 2, ('2024-Q1', 'EUR'): 2, ('Unknown', 'CZK'): 1})
+
+    def test_report_pivots(self):
+        reports = generate_reports(self.ORDERS)
+        self.assertEqual(reports['monthly_channel_czk'],
+                         {'2024-01': {'B2B': money('363')}, 'Unknown': {'B2C': money('12.10')}})
+        self.assertEqual(reports['monthly_channel_eur'],
+                         {'2024-01': {'B2C': money('24.20')}, '2024-02': {'B2B': money('48.40')}})
+        self.assertEqual(reports['monthly_channel_count'],
+                         {'2024-01': {'B2B': 2, 'B2C': 1}, '2024-02': {'B2B': 1}, 'Unknown': {'B2C': 1}})
+        self.assertEqual(reports['monthly_salesperson_czk'],
+                         {'2024-01': {'Novák': money('121'), 'Svoboda': money('242')},
+                          '2024-02': {'Novák': money('1210')}})
+        self.assertEqual(reports['monthly_salesperson_count'],
+                         {'2024-01': {'Novák': 1, 'Svoboda': 1}, '2024-02': {'Novák': 1}})
+        self.assertEqual(reports['monthly_supplier_czk'],
+                         {'2024-01': {'ENERVIT': money('968')}, '2024-02': {'ENERVIT': money('1210')},
+                          'Unknown': {'ENERVIT': money('12.10')}})
+
+
+def sale(date, code, quantity):
+    return SimpleNamespace(date=date, product_code=code, quantity=to_fixed(quantity, QUANTITY_DIGITS))
+
+
+class SalesIndexTest(unittest.TestCase):
+
+    ITEMS = [
+        sale('2024-01-01', 'A', '1'),
+        sale('2024-01-07', 'A', '2'),
+        sale('2024-01-08', 'A', '4'),
+        sale('2024-01-31', 'A', '8'),
+        sale('2024-01-31', 'A', '0.5'),
+        sale('2024-01-31', 'B', '3'),
+        sale('', 'A', '100'),
+        sale('not a date', 'A', '100'),
+        sale('2024-01-15', '', '100'),
+    ]
+
+    def indexes(self):
+        with without_numpy():
+            yield 'python', SalesIndex.from_items(self.ITEMS)
+        if analytics.np is not None:
+            yield 'numpy', SalesIndex.from_items(self.ITEMS)
+
+    def assertSold(self, index, code, days, as_of, quantity):
+        sold = index.sold(code, days, as_of)
+        self.assertIs(type(sold), int)
+        self.assertEqual(sold, to_fixed(quantity, QUANTITY_DIGITS), (code, days, as_of))
+
+    def test_span(self):
+        for backend, index in self.indexes():
+            with self.subTest(backend=backend):
+                self.assertEqual(index.days, 31)
+                self.assertEqual(index.last_day, 30)
+                self.assertEqual(index.day('2024-01-31'), 30)
+
+    def test_windows_end_at_last_day(self):
+        for backend, index in self.indexes():
+            with self.subTest(backend=backend):
+                self.assertSold(index, 'A', 1, None, '8.5')
+                self.assertSold(index, 'A', 7, None, '8.5')
+                self.assertSold(index, 'A', 24, None, '12.5')
+                self.assertSold(index, 'A', 30, None, '14.5')
+                self.assertSold(index, 'A', 31, None, '15.5')
+                self.assertSold(index, 'A', 365, None, '15.5')
+                self.assertSold(index, 'B', 1, None, '3')
+
+    def test_window_edges(self):
+        for backend, index in self.indexes():
+            with self.subTest(backend=backend):
+                # The as-of day is included, the day `days` before it is not
+                self.assertSold(index, 'A', 1, 0, '1')
+                self.assertSold(index, 'A', 7, 6, '3')
+                self.assertSold(index, 'A', 7, 7, '6')
+                self.assertSold(index, 'A', 6, 6, '2')
+                self.assertSold(index, 'A', 1, 29, '0')
+                # Windows starting before the first day are cut there
+                self.assertSold(index, 'A', 365, 6, '3')
+                # As-of days past the last day are cut there
+                self.assertSold(index, 'A', 7, 100, '8.5')
+
+    def test_no_sales(self):
+        for backend, index in self.indexes():
+            with self.subTest(backend=backend):
+                self.assertSold(index, 'A', 7, -1, '0')
+                self.assertSold(index, 'A', 365, -400, '0')
+                self.assertSold(index, 'B', 30, 29, '0')
+                self.assertSold(index, 'unknown', 365, None, '0')
+                self.assertSold(SalesIndex.from_items([]), 'A', 30, None, '0')
+
+    def test_trend(self):
+        for backend, index in self.indexes():
+            with self.subTest(backend=backend):
+                self.assertAlmostEqual(index.trend('A', 7, 13), 1 / 3)
+                self.assertEqual(index.trend('A', 7, 6), None)
+                self.assertEqual(index.trend('B', 7), None)
+
+
+def js_call_arguments(path):
+    """Arguments of the register*() call a delta export file makes."""
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    start = text.index('(', text.index('register'))
+    return json.loads('[' + text[start + 1:text.rindex(')')] + ']')
+
+
+def load_deltas(dataset_dir):
+    """Rows of a delta exported dataset, rebuilt the way loadDeltas() in loader.js does."""
+    manifest = js_call_arguments(os.path.join(dataset_dir, 'manifest.js'))[1]
+    key = manifest['key']
+    groups = {}
+    for row in js_call_arguments(os.path.join(dataset_dir, manifest['base']['file']))[1]:
+        groups.setdefault(row[key] or '', []).append(row)
+    for delta in manifest['deltas']:
+        _, seq, rows, deleted = js_call_arguments(os.path.join(dataset_dir, delta['file']))
+        assert seq == delta['seq']
+        for number in deleted:
+            groups.pop(number, None)
+        replaced = set()
+        for row in rows:
+            number = row[key] or ''
+            if number not in replaced:
+                groups[number] = []
+                replaced.add(number)
+            groups[number].append(row)
+    return manifest, [row for rows in groups.values() for row in rows]
+
+
+def by_document(rows):
+    groups = {}
+    for row in rows:
+        groups.setdefault(row['order_number'], []).append(row)
+    return groups
+
+
+class ShardSinkTest(unittest.TestCase):
+
+    ROWS = [{'order_number': f'O{n}', 'date': date} for n, date in enumerate(
+        ['2024-01-05', '2024-01-31', '2024-02-01', '2024-02-14', '2024-04-30'])]
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output_dir = tmp.name
+        self.dataset_dir = os.path.join(self.output_dir, 'shards', 'ordersData')
+
+    def shard_months(self):
+        return sorted(name[:-3] for name in os.listdir(self.dataset_dir) if name.endswith('.js'))
+
+    def test_sorted_rows_write_each_month_when_the_next_starts(self):
+        with ShardSink(self.output_dir, 'ordersData', 'Orders', 'lines', sorted_rows=True) as sink:
+            held = []
+            for row in self.ROWS:
+                sink.write(row)
+                held.append((sorted(sink.months), sorted(sink.shards)))
+        self.assertEqual(held[2], (['2024-02'], ['2024-01']))
+        self.assertEqual(held[4], (['2024-04'], ['2024-01', '2024-02']))
+        self.assertEqual([(shard['month'], shard['rows']) for shard in sink.manifest['shards']],
+                         [('2024-01', 2), ('2024-02', 2), ('2024-04', 1)])
+        self.assertEqual(self.shard_months(), ['2024-01', '2024-02', '2024-04', 'manifest'])
+
+    def test_same_shards_either_way(self):
+        contents = []
+        for sorted_rows in (False, True):
+            with ShardSink(self.output_dir, 'ordersData', 'Orders', 'rows', sorted_rows) as sink:
+                for row in self.ROWS:
+                    sink.write(row)
+            files = {}
+            for name in os.listdir(self.dataset_dir):
+                with open(os.path.join(self.dataset_dir, name), encoding='utf-8') as f:
+                    files[name] = f.read()
+            contents.append(files)
+        self.assertEqual(contents[0], contents[1])
+
+    def test_unsorted_rows_fail_without_touching_the_shards(self):
+        with ShardSink(self.output_dir, 'ordersData', 'Orders') as sink:
+            sink.write({'order_number': 'O9', 'date': '2023-12-24'})
+        with self.assertRaises(ValueError):
+            with ShardSink(self.output_dir, 'ordersData', 'Orders', sorted_rows=True) as sink:
+                for row in self.ROWS + self.ROWS[:1]:
+                    sink.write(row)
+        self.assertEqual(sorted(os.listdir(self.dataset_dir)), ['2023-12.js', 'manifest.js'])
+
+    def test_months_gone_from_the_export_are_removed(self):
+        with ShardSink(self.output_dir, 'ordersData', 'Orders', sorted_rows=True) as sink:
+            for row in self.ROWS:
+                sink.write(row)
+        with ShardSink(self.output_dir, 'ordersData', 'Orders', sorted_rows=True) as sink:
+            for row in self.ROWS[2:4]:
+                sink.write(row)
+        self.assertEqual(self.shard_months(), ['2024-02', 'manifest'])
+
+
+class DeltaSinkTest(unittest.TestCase):
+
+    ROWS = [{'order_number': 'O1', 'line': 1, 'total': 100}, {'order_number': 'O1', 'line': 2, 'total': 5}]
+    ROWS += [{'order_number': f'O{n}', 'line': 1, 'total': n * 100} for n in range(2, 11)]
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.output_dir = tmp.name
+        self.dataset_dir = os.path.join(self.output_dir, 'deltas', 'ordersData')
+
+    def export(self, rows, js_format='lines'):
+        with DeltaSink(self.output_dir, 'ordersData', 'order_number', 'Orders', js_format) as sink:
+            for row in rows:
+                sink.write(row)
+        manifest, loaded = load_deltas(self.dataset_dir)
+        self.assertEqual(by_document(loaded), by_document(rows))
+        self.assertEqual(manifest['rows'], len(rows))
+        self.assertEqual(set(os.listdir(self.dataset_dir)),
+                         {'manifest.js', 'state.json', manifest['base']['file']}
+                         | {delta['file'] for delta in manifest['deltas']})
+        return sink, manifest
+
+    def changed_rows(self):
+        rows = [dict(row) for row in self.ROWS if row['order_number'] != 'O3' and row['line'] == 1]
+        rows[1]['total'] = 250
+        rows.append({'order_number': 'O11', 'line': 1, 'total': 1100})
+        return rows
+
+    def test_base(self):
+        for js_format in ('rows', 'lines'):
+            with self.subTest(js_format=js_format):
+                sink, manifest = self.export(self.ROWS, js_format)
+                self.assertEqual(manifest['base']['rows'], len(self.ROWS))
+                self.assertEqual(manifest['deltas'], [])
+                self.assertIn(manifest['base']['sha256'][:12], manifest['base']['file'])
+
+    def test_delta_replaces_adds_and_removes_documents(self):
+        self.export(self.ROWS)
+        sink, manifest = self.export(self.changed_rows())
+        [delta] = manifest['deltas']
+        # O1 lost a line, O2 changed and O11 is new; O3 is gone
+        self.assertEqual((delta['seq'], delta['rows'], delta['deleted']), (1, 3, 1))
+        self.assertEqual(sink.written, delta)
+
+    def test_deltas_chain(self):
+        base = self.export(self.ROWS)[1]['base']
+        rows = self.changed_rows()
+        self.export(rows)
+        rows = [row for row in rows if row['order_number'] != 'O4']
+        sink, manifest = self.export(rows)
+        self.assertEqual(manifest['base'], base)
+        self.assertEqual([(delta['seq'], delta['rows'], delta['deleted']) for delta in manifest['deltas']],
+                         [(1, 3, 1), (2, 0, 1)])
+
+    def test_unchanged_export_adds_no_delta(self):
+        self.export(self.ROWS)
+        self.export(self.changed_rows())
+        sink, manifest = self.export(self.changed_rows())
+        self.assertEqual(sink.written, {})
+        self.assertEqual(len(manifest['deltas']), 1)
+
+    def test_compaction(self):
+        base = self.export(self.ROWS)[1]['base']
+        rows = [dict(row, total=row['total'] + 1) for row in self.ROWS]
+        sink, manifest = self.export(rows)
+        self.assertNotEqual(manifest['base'], base)
+        self.assertEqual(manifest['deltas'], [])
+
+    def test_format_change_writes_new_base(self):
+        self.export(self.ROWS, 'lines')
+        sink, manifest = self.export(self.changed_rows(), 'rows')
+        self.assertEqual(manifest['format'], 'rows')
+        self.assertEqual(manifest['deltas'], [])
+
+
+class FulfillmentJoinTest(unittest.TestCase):
+
+    def setUp(self):
+        self.orders = []
+        self.order_items = []
+        self.invoices = []
+        self.invoice_items = []
+
+    def order(self, number, date, total, lines=()):
+        order = Order(order_number=number, date=date, channel='B2B', salesperson='Novák', currency='CZK',
+                      total_czk_bez_dph=money(total), total_eur_bez_dph=0)
+        self.orders.append(order)
+        for code, ordered in lines:
+            self.order_items.append(OrderItem(order=order, product_code=code, product_name=code.lower(),
+                                              quantity=quantity(ordered), delivered=0))
+
+    def invoice(self, number, order_number, date, total, lines=()):
+        invoice = Invoice(invoice_number=number, order_number=order_number, date=date,
+                          total_czk_bez_dph=money(total), total_eur_bez_dph=0)
+        self.invoices.append(invoice)
+        for code, invoiced in lines:
+            self.invoice_items.append(InvoiceItem(invoice=invoice, product_code=code, quantity=quantity(invoiced)))
+
+    def join(self):
+        order_rows, line_rows, unmatched = join_orders_invoices(
+            self.orders, self.order_items, self.invoices, self.invoice_items)
+        return {row['order_number']: row for row in order_rows}, line_rows, unmatched
+
+    def test_invoiced(self):
+        self.order('O1', '2024-03-01', '300', [('A', '2'), ('B', '1')])
+        self.invoice('I2', 'O1', '2024-03-09', '100', [('A', '1')])
+        self.invoice('I1', 'O1', '2024-03-04', '200', [('A', '1'), ('B', '1')])
+        rows, lines, unmatched = self.join()
+        row = rows['O1']
+        self.assertEqual(row['status'], 'invoiced')
+        self.assertEqual(row['invoice_numbers'], ['I2', 'I1'])
+        self.assertEqual(row['lead_time_days'], 3)
+        self.assertEqual((row['invoiced_czk'], row['unbilled_czk']), (money('300'), 0))
+        self.assertEqual([(line['product_code'], line['invoiced'], line['open']) for line in lines],
+                         [('A', quantity('2'), 0), ('B', quantity('1'), 0)])
+        self.assertEqual(unmatched, 0)
+
+    def test_over_invoiced_and_itemless_orders_are_invoiced(self):
+        self.order('O1', '2024-03-01', '100', [('A', '1')])
+        self.invoice('I1', 'O1', '2024-03-01', '150', [('A', '1.5')])
+        self.order('O2', '2024-03-01', '50')
+        self.invoice('I2', 'O2', '2024-03-02', '50')
+        rows, lines, unmatched = self.join()
+        self.assertEqual((rows['O1']['status'], rows['O1']['unbilled_czk'], rows['O1']['lead_time_days']),
+                         ('invoiced', 0, 0))
+        self.assertEqual(lines[0]['open'], 0)
+        self.assertEqual(rows['O2']['status'], 'invoiced')
+
+    def test_partial(self):
+        self.order('O1', '2024-03-01', '300', [('A', '3'), ('B', '1')])
+        self.invoice('I1', 'O1', '2024-03-05', '100', [('A', '1'), ('B', '1')])
+        rows, lines, unmatched = self.join()
+        row = rows['O1']
+        self.assertEqual(row['status'], 'partial')
+        self.assertEqual(row['unbilled_czk'], money('200'))
+        self.assertEqual([(line['product_code'], line['open']) for line in lines],
+                         [('A', quantity('2')), ('B', 0)])
+
+    def test_open(self):
+        self.order('O1', '2024-03-01', '300', [('A', '3')])
+        self.order('', '2024-03-01', '10')
+        self.invoice('I1', '', '2024-03-02', '10')
+        rows, lines, unmatched = self.join()
+        for number in ('O1', ''):
+            with self.subTest(number=number):
+                self.assertEqual(rows[number]['status'], 'open')
+                self.assertEqual(rows[number]['invoice_numbers'], [])
+                self.assertIsNone(rows[number]['lead_time_days'])
+        self.assertEqual(rows['O1']['unbilled_czk'], money('300'))
+        self.assertEqual(lines[0]['open'], quantity('3'))
+        self.assertEqual(unmatched, 0)
+
+    def test_unmatched_invoices(self):
+        self.order('O1', '2024-03-01', '100', [('A', '1')])
+        self.invoice('I1', 'O9', '2024-03-02', '100', [('A', '1')])
+        self.invoice('I2', 'O9', '2024-03-03', '100', [('A', '1')])
+        rows, lines, unmatched = self.join()
+        self.assertEqual(rows['O1']['status'], 'open')
+        self.assertEqual(lines[0]['invoiced'], 0)
+        self.assertEqual(unmatched, 2)
+
+    def test_summary_counts_statuses(self):
+        self.order('O1', '2024-03-01', '100', [('A', '1')])
+        self.invoice('I1', 'O1', '2024-03-03', '100', [('A', '1')])
+        self.order('O2', '2024-03-01', '100', [('A', '2')])
+        self.invoice('I2', 'O2', '2024-03-05', '50', [('A', '1')])
+        self.order('O3', '2024-03-01', '100', [('A', '1')])
+        order_rows, line_rows, unmatched = join_orders_invoices(
+            self.orders, self.order_items, self.invoices, self.invoice_items)
+        total = summarize_fulfillment(order_rows, line_rows)[0]
+        self.assertEqual((total['channel'], total['orders'], total['invoiced_orders'], total['partial_orders'],
+                          total['open_orders']), (None, 3, 1, 1, 1))
+        self.assertAlmostEqual(total['fulfillment_rate'], 2 / 3)
+        self.assertAlmostEqual(total['quantity_rate'], 2 / 4)
+        self.assertEqual((total['lead_time_min'], total['lead_time_max'], total['lead_time_p50']), (2, 4, 2))
+
+
+def partner(cls, date, ico='', company='', customer_name='', zip_code='', total='0', **fields):
+    """Order or invoice of a partner, with its customer_id set the way the parsers set it."""
+    amounts = {name: money(total) for name in ('total_czk', 'total_czk_bez_dph', 'total_eur', 'total_eur_bez_dph')}
+    return cls(date=date, ico=ico, company=company, customer_name=customer_name, zip=zip_code, city='Praha',
+               customer_country='CZ', email='', phone='', **amounts, **fields,
+               customer_id=customer_id(ico, company or customer_name, zip_code))
+
+
+class StockPredictionTest(unittest.TestCase):
+
+    STOCK = {'STEADY': '40', 'SEASONAL': '500', 'NEW': '3', 'SOLD_OUT': '-2', 'NO_SALES': '10'}
+
+    def setUp(self):
+        rng = random.Random(7)
+        first = datetime.date(2023, 1, 2)
+        self.items = []
+        for day in range(420):
+            date = (first + datetime.timedelta(days=day)).isoformat()
+            month = (first + datetime.timedelta(days=day)).month
+            if rng.random() < 0.6:
+                self.items.append(sale(date, 'STEADY', str(rng.randint(1, 3))))
+            if rng.random() < (0.8 if 4 <= month <= 9 else 0.1):
+                self.items.append(sale(date, 'SEASONAL', f'{rng.randint(1, 40) / 4}'))
+            if day >= 400 and rng.random() < 0.5:
+                self.items.append(sale(date, 'NEW', '1'))
+            if day % 30 == 0:
+                self.items.append(sale(date, 'SOLD_OUT', '2'))
+
+    def predict(self):
+        stock_items = [StockItem(code=code, count=quantity(count)) for code, count in self.STOCK.items()]
+        with redirect_stdout(io.StringIO()):
+            return {item['code']: item.copy() for item in calculate_stock_predictions(stock_items, self.items)}
+
+    def test_numpy_matches_python(self):
+        if analytics.np is None:
+            self.skipTest('numpy is not installed')
+        with without_numpy():
+            python = self.predict()
+        numpy = self.predict()
+        for code in self.STOCK:
+            with self.subTest(code=code):
+                self.assertEqual(numpy[code], python[code])
+        self.assertNotIn('forecast_30d', numpy['NO_SALES'])
+        self.assertEqual(numpy['NO_SALES']['days_remaining'], -1)
+        self.assertGreater(numpy['SEASONAL']['forecast_30d'], 0)
+        self.assertEqual(numpy['SOLD_OUT']['stockout_date'], '2024-02-25')
+
+    def test_python_warns(self):
+        stock_items = [StockItem(code='STEADY', count=quantity('1'))]
+        with without_numpy(), redirect_stdout(io.StringIO()) as output:
+            calculate_stock_predictions(stock_items, self.items)
+        self.assertIn('numpy is not installed', output.getvalue())
+
+
+class CustomerTest(unittest.TestCase):
+
+    def test_ico_variants_merge(self):
+        keys = {customer_key(ico, name, zip_code) for ico, name, zip_code in [
+            ('00012345', 'Sport s.r.o.', '110 00'),
+            ('12 345', 'SPORT, s. r. o.', '602 00'),
+            ('CZ12345', '', ''),
+            (' 012345 ', 'Other name', '11000'),
+        ]}
+        self.assertEqual(keys, {'ico:12345'})
+        self.assertNotEqual(customer_key('12345', 'Sport', ''), customer_key('123450', 'Sport', ''))
+
+    def test_name_variants_merge(self):
+        keys = {customer_key('', name, zip_code) for name, zip_code in [
+            ('Sport Centrum, s.r.o.', '110 00'),
+            ('SPORT CENTRUM s.r.o', '11000'),
+            ('  sport  centrum   s. r. o. ', ' 110 00 '),
+            ('Sport-Centrum (s.r.o.)', '110\t00'),
+        ]}
+        self.assertEqual(keys, {'name:sport centrum s r o|11000'})
+
+    def test_missing_ico_or_name_does_not_collapse_customers(self):
+        self.assertIsNone(customer_key('', '', ''))
+        self.assertIsNone(customer_key(None, None, None))
+        self.assertIsNone(customer_key('000', ' ,. ', '110 00'))
+        # Without an ICO, different names or zip codes are different customers
+        self.assertEqual(len({customer_key('', 'Jan Novák', '110 00'), customer_key('', 'Eva Malá', '110 00'),
+                              customer_key('', 'Jan Novák', '602 00'), customer_key('', 'Jan Novák', '')}), 4)
+        # An ICO without digits falls back to the name
+        self.assertEqual(customer_key('n/a', 'Jan Novák', '110 00'), customer_key('', 'Jan Novák', '110 00'))
+
+        orders = [
+            partner(Order, '2024-01-01', customer_name='Jan Novák', zip_code='110 00'),
+            partner(Order, '2024-01-02', customer_name='Eva Malá', zip_code='110 00'),
+            partner(Order, '2024-01-03'),
+            partner(Order, '2024-01-04', zip_code='110 00'),
+        ]
+        customers = build_customers(orders, [])
+        self.assertEqual(sorted(customer['customer_name'] for customer in customers), ['Eva Malá', 'Jan Novák'])
+        self.assertEqual([customer['orders'] for customer in customers], [1, 1])
+
+    def test_lifetime_totals(self):
+        orders = [
+            partner(Order, '2024-02-01', ico='00012345', company='Sport s.r.o.', total='100.50'),
+            partner(Order, '2024-01-15', ico='12345', company='SPORT s. r. o.', total='200'),
+            partner(Order, '2024-03-01', ico='99', company='Other', total='7'),
+        ]
+        invoices = [
+            partner(Invoice, '2024-02-10', ico='12 345', company='Sport, s.r.o.', total='300.50',
+                    price_level=''),
+            partner(Invoice, '2024-02-20', ico='12345', company='Sport Praha s.r.o.', total='50',
+                    price_level='Sponzoring'),
+        ]
+        customers = {customer['ico']: customer for customer in build_customers(orders, invoices)}
+        self.assertEqual(len(customers), 2)
+        customer = customers['12345']
+        self.assertEqual(customer['customer_id'], customer_id('12345', '', ''))
+        self.assertEqual((customer['orders'], customer['invoices']), (2, 1))
+        self.assertEqual((customer['total_czk'], customer['total_eur_bez_dph']), (money('300.50'), money('300.50')))
+        self.assertEqual((customer['invoiced_czk'], customer['invoiced_eur_bez_dph']),
+                         (money('300.50'), money('300.50')))
+        # Sponsoring invoices only count towards the dates and identity
+        self.assertEqual((customer['first_date'], customer['last_date']), ('2024-01-15', '2024-02-20'))
+        self.assertEqual(customer['company'], 'Sport Praha s.r.o.')
+        self.assertEqual((customers['99']['orders'], customers['99']['invoices'], customers['99']['total_czk']),
+                         (1, 0, money('7')))
+        self.assertNotIn('street', customer)
+        self.assertNotIn('dic', customer)
+
+
+class ParseCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory()
+        self.addCleanup(tmp.cleanup)
+        self.cache_dir = os.path.join(tmp.name, 'cache')
+        self.path = os.path.join(tmp.name, 'export.xml')
+        self.write('<dataPack>one</dataPack>', 1_000_000_000)
+        self.parsed = []
+        self.error = None
+
+    def write(self, text, mtime):
+        with open(self.path, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.utime(self.path, ns=(mtime, mtime))
+
+    def parse(self, filepath, *args):
+        self.parsed.append(args)
+        if self.error:
+            return ([], []), self.error
+        with open(filepath, encoding='utf-8') as f:
+            text = f.read()
+        return ([text] if text != '<dataPack/>' else [], list(args)), None
+
+    def run_cached(self, *task_args):
+        """Parse the export through the cache; returns (result, from_cache)."""
+        self.parsed = []
+        [(result, from_cache)] = parse_files_cached('orders', self.parse, [self.path], *task_args,
+                                                    cache_dir=self.cache_dir)
+        self.assertEqual(len(self.parsed), 0 if from_cache else 1)
+        return result, from_cache
+
+    def test_unchanged_file_is_reused(self):
+        self.assertEqual(self.run_cached(), (((['<dataPack>one</dataPack>'], []), None), False))
+        self.assertEqual(self.run_cached(), (((['<dataPack>one</dataPack>'], []), None), True))
+
+    def test_touched_file_with_same_content_is_reused(self):
+        self.run_cached()
+        os.utime(self.path, ns=(2_000_000_000, 2_000_000_000))
+        with mock.patch.object(analytics, 'file_sha256', wraps=analytics.file_sha256) as sha256:
+            self.assertTrue(self.run_cached()[1])
+            self.assertEqual(sha256.call_count, 1)
+            # The entry now has the new mtime, so the content is not hashed again
+            self.assertTrue(self.run_cached()[1])
+            self.assertEqual(sha256.call_count, 1)
+
+    def test_changed_content_is_parsed(self):
+        self.run_cached()
+        self.write('<dataPack>two</dataPack>', 2_000_000_000)
+        self.assertEqual(self.run_cached(), (((['<dataPack>two</dataPack>'], []), None), False))
+        self.write('<dataPack>three</dataPack>', 2_000_000_000)
+        self.assertFalse(self.run_cached()[1])
+        self.assertTrue(self.run_cached()[1])
+
+    def test_parser_version_change_is_parsed(self):
+        self.run_cached()
+        with mock.patch.object(analytics, 'PARSER_VERSION', analytics.PARSER_VERSION + 1):
+            self.assertFalse(self.run_cached()[1])
+            self.assertTrue(self.run_cached()[1])
+        self.assertFalse(self.run_cached()[1])
+
+    def test_changed_task_args_are_parsed(self):
+        self.run_cached(['ENERVIT'])
+        self.assertEqual(self.run_cached(['ENERVIT']), (((['<dataPack>one</dataPack>'], ['ENERVIT']), None), True))
+        self.assertEqual(self.run_cached(['VITAR']), (((['<dataPack>one</dataPack>'], ['VITAR']), None), False))
+        self.assertFalse(self.run_cached()[1])
+
+    def test_failed_parse_is_not_stored(self):
+        self.error = 'not well-formed'
+        self.assertEqual(self.run_cached(), ((([], []), 'not well-formed'), False))
+        self.assertEqual(self.run_cached(), ((([], []), 'not well-formed'), False))
+        self.assertFalse(os.path.exists(os.path.join(self.cache_dir, 'orders')))
+        self.error = None
+        self.assertFalse(self.run_cached()[1])
+        self.assertTrue(self.run_cached()[1])
+
+    def test_export_without_records_is_stored(self):
+        self.write('<dataPack/>', 1_000_000_000)
+        self.assertEqual(self.run_cached(), ((([], []), None), False))
+        self.assertTrue(self.run_cached()[1])
+
+
+if __name__ == '__main__':
+    unittest.main()